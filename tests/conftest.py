@@ -5,7 +5,7 @@ import subprocess
 import sys
 import termios
 from concurrent.futures import Future
-from typing import Any, Generator, List, Tuple
+from typing import Any, Generator, List, Optional, Tuple
 
 import pytest
 from _pytest.fixtures import FixtureRequest
@@ -15,6 +15,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 from video_grid_merge import __main__ as main
+from video_grid_merge import command_runner as crn
 
 sys.stdin = io.StringIO()
 
@@ -94,6 +95,15 @@ def mock_subprocess_check_output(monkeypatch: Any) -> None:
     monkeypatch.setattr(subprocess, "check_output", mock)
 
 
+@pytest.fixture(autouse=True)
+def isolate_user_data(monkeypatch: MonkeyPatch, tmp_path: Any) -> None:
+    monkeypatch.setattr(main, "run_history_path", str(tmp_path / "history.sqlite3"))
+    monkeypatch.setattr(main, "keyframe_index_dir", str(tmp_path / "keyframes"))
+    monkeypatch.setattr(main, "loudness_cache_path", str(tmp_path / "loudness.json"))
+    monkeypatch.setattr(main, "result_cache_dir", str(tmp_path / "results"))
+    monkeypatch.setattr(main, "integrity_cache_path", str(tmp_path / "integrity.json"))
+
+
 @pytest.fixture(autouse=True)
 def clear_cache() -> Generator[None, None, None]:
     main.get_video_size.cache_clear()
@@ -109,8 +119,8 @@ def mock_environment(monkeypatch: Any) -> Any:
     def mock_link(src: str, dst: str) -> None:
         pass
 
-    def mock_run(*args: Any, **kwargs: Any) -> None:
-        pass
+    def mock_run_command(*args: Any, **kwargs: Any) -> int:
+        return 0
 
     class MockFile:
         def __init__(self) -> None:
@@ -129,7 +139,7 @@ def mock_environment(monkeypatch: Any) -> Any:
 
     monkeypatch.setattr(os.path, "join", mock_join)
     monkeypatch.setattr(os, "link", mock_link)
-    monkeypatch.setattr(subprocess, "run", mock_run)
+    monkeypatch.setattr(crn, "run_command", mock_run_command)
     monkeypatch.setattr("builtins.open", lambda *args, **kwargs: mock_file)
 
     return mock_file
@@ -182,13 +192,15 @@ def mock_thread_pool(monkeypatch: Any) -> Any:
 def mock_file_operations(
     request: FixtureRequest, monkeypatch: pytest.MonkeyPatch
 ) -> FixtureRequest:
-    def mock_rename_files_with_spaces(directory: str) -> None:
-        pass
-
-    def mock_get_video_files(directory: str) -> List[str]:
+    def mock_get_video_files(directory: str, *args: Any) -> List[str]:
         return ["video1.mp4", "video2.mp4", "video3.mp4", "video4.mp4"]
 
-    def mock_create_target_video(input_folder: str, video_files: List[str]) -> None:
+    def mock_create_target_video(
+        input_folder: str,
+        video_files: List[str],
+        journal: Any = None,
+        end: Optional[float] = None,
+    ) -> None:
         pass
 
     def mock_makedirs(output_folder: str, exist_ok: bool) -> None:
@@ -205,20 +217,31 @@ def mock_file_operations(
         return "/path/to/output_file.mov"
 
     def mock_create_ffmpeg_command_v1(
-        input_files: List[str], output_path: str, match_input_resolution_flag: bool
-    ) -> str:
-        return "ffmpeg_command_v1"
+        input_files: List[str],
+        output_path: str,
+        match_input_resolution_flag: bool,
+        *args: Any,
+        **kwargs: Any,
+    ) -> List[str]:
+        return ["ffmpeg_command_v1", output_path]
 
     def mock_create_ffmpeg_command_v2(
-        input_files: List[str], output_path: str, match_input_resolution_flag: bool
-    ) -> str:
-        return "ffmpeg_command_v2"
-
-    def mock_subprocess_run(ffmpeg_command: str, shell: bool) -> None:
-        print(f"Executing command: {ffmpeg_command}")
-
-    def mock_delete_files_in_folder(files: List[str], input_folder: str) -> None:
-        pass
+        input_files: List[str],
+        output_path: str,
+        match_input_resolution_flag: bool,
+        *args: Any,
+        **kwargs: Any,
+    ) -> List[str]:
+        return ["ffmpeg_command_v2", output_path]
+
+    def mock_run_command(command: List[str], *args: Any, **kwargs: Any) -> int:
+        print(f"Executing command: {' '.join(command)}")
+        return 0
+
+    def mock_delete_files_in_folder(
+        files: List[str], input_folder: str, *args: Any
+    ) -> List[str]:
+        return []
 
     def mock_exit(code: int) -> None:
         raise SystemExit(code)
@@ -228,10 +251,6 @@ def mock_file_operations(
 
     monkeypatch.setattr(main, "ffmpeg_cmd_version", request.param)
 
-    monkeypatch.setattr(
-        "video_grid_merge.__main__.rnf.rename_files_with_spaces",
-        mock_rename_files_with_spaces,
-    )
     monkeypatch.setattr(
         "video_grid_merge.__main__.get_video_files", mock_get_video_files
     )
@@ -255,7 +274,7 @@ def mock_file_operations(
         "video_grid_merge.__main__.create_ffmpeg_command_v2",
         mock_create_ffmpeg_command_v2,
     )
-    monkeypatch.setattr(subprocess, "run", mock_subprocess_run)
+    monkeypatch.setattr(crn, "run_command", mock_run_command)
     monkeypatch.setattr(
         "video_grid_merge.__main__.dlf.delete_files_in_folder",
         mock_delete_files_in_folder,
@@ -0,0 +1,78 @@
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import benchmark as bmk
+
+
+def make_results(encode: float, fps: float, peak_rss: int) -> Dict[str, Any]:
+    return {
+        "version": bmk.RESULTS_VERSION,
+        "runs": {
+            "2x2_640x360_30fps/v1/flat": {
+                "stage_times": {"normalize": 1.0, "encode": encode},
+                "total_seconds": 1.0 + encode,
+                "fps": fps,
+                "peak_rss": peak_rss,
+            }
+        },
+    }
+
+
+def test_build_input_command() -> None:
+    case = bmk.BENCHMARK_CASES[0]
+    command = bmk.build_input_command(case, 1, "tile_01.mp4")
+
+    assert "testsrc2=size=640x360:rate=30:duration=7.5" in command
+    assert "sine=frequency=275:sample_rate=48000:duration=7.5" in command
+    assert command[-1] == "tile_01.mp4"
+    assert [case.grid_size**2 for case in bmk.BENCHMARK_CASES] == [4, 9, 16, 25, 36]
+
+
+def test_save_and_load_results(tmp_path: Path) -> None:
+    path = str(tmp_path / "bench" / "results.json")
+    results = make_results(2.0, 150.0, 100 * 1024 * 1024)
+
+    bmk.save_results(results, path)
+
+    assert bmk.load_results(path) == results
+    assert bmk.load_results(str(tmp_path / "missing.json")) is None
+
+
+def test_compare_results() -> None:
+    baseline = make_results(2.0, 150.0, 100 * 1024 * 1024)
+
+    results = make_results(2.2, 140.0, 110 * 1024 * 1024)
+    assert bmk.compare_results(results, baseline) == []
+
+    regressions = bmk.compare_results(
+        make_results(3.0, 100.0, 150 * 1024 * 1024), baseline
+    )
+    assert regressions == [
+        "2x2_640x360_30fps/v1/flat: encode time 3.00s (baseline 2.00s)",
+        "2x2_640x360_30fps/v1/flat: total time 4.00s (baseline 3.00s)",
+        "2x2_640x360_30fps/v1/flat: fps 100.0 (baseline 150.0)",
+        "2x2_640x360_30fps/v1/flat: peak RSS 150.0MiB (baseline 100.0MiB)",
+    ]
+    # A looser threshold and runs without a baseline are not reported
+    assert (
+        bmk.compare_results(make_results(3.0, 100.0, 150 * 1024 * 1024), baseline, 1.0)
+        == []
+    )
+    assert bmk.compare_results(make_results(3.0, 100.0, 0), {"runs": {}}) == []
+
+
+def test_prefetch_runs_are_compared_with_plain_baseline() -> None:
+    baseline = make_results(2.0, 150.0, 100 * 1024 * 1024)
+    run = make_results(1.6, 190.0, 100 * 1024 * 1024)["runs"].popitem()[1]
+    results = {"runs": {"2x2_640x360_30fps/v1/flat/prefetch": run}}
+
+    key = bmk.get_result_key("2x2_640x360_30fps", "v1", "flat", True)
+    assert key in results["runs"]
+    assert bmk.get_speedups(results, baseline) == {
+        "2x2_640x360_30fps/v1/flat/prefetch": 1.25
+    }
+    assert bmk.compare_results(results, baseline) == []
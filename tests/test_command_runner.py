@@ -0,0 +1,38 @@
+import os
+import sys
+import threading
+import time
+from typing import Any, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import command_runner as crn
+
+
+def test_run_command(tmp_path: Any) -> None:
+    lines: List[str] = []
+    # Arguments reach the program as they are, without a shell expanding them
+    assert crn.run_command(["echo", "$HOME *"], on_output=lines.append) == 0
+    assert lines == ["$HOME *\n"]
+    assert crn.run_command(["sh", "-c", "exit 3"]) == 3
+
+
+def test_run_command_timeout_kills_process_group(tmp_path: Any) -> None:
+    marker = tmp_path / "marker"
+    start = time.monotonic()
+    returncode = crn.run_command(
+        ["sh", "-c", f"(sleep 1; touch {marker}) & sleep 30"], timeout=0.2
+    )
+
+    assert returncode < 0
+    assert time.monotonic() - start < 5
+    # The background child of the shell was killed with it
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+def test_run_command_cancel() -> None:
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    assert crn.run_command(["sleep", "30"], cancel=cancel) < 0
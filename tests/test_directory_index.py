@@ -0,0 +1,53 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import directory_index as dix
+from video_grid_merge import fingerprint as fpr
+
+
+def test_scan(tmp_path: Path) -> None:
+    (tmp_path / "b.mp4").write_text("bb")
+    (tmp_path / "a.mp4").write_text("a")
+    (tmp_path / "subfolder").mkdir()
+    os.symlink(tmp_path / "b.mp4", tmp_path / "link.mp4")
+
+    index = dix.DirectoryIndex.scan(str(tmp_path))
+
+    assert index.names() == ["a.mp4", "b.mp4", "link.mp4"]
+    entry = index.get("b.mp4")
+    assert entry is not None
+    assert entry.size == 2
+    # Symbolic links are indexed with the stat of their target
+    assert index.get("link.mp4") == entry._replace(name="link.mp4")
+    assert index.get("subfolder") is None
+    assert dix.DirectoryIndex.scan(str(tmp_path / "missing")).names() == []
+
+
+def test_refresh_and_remove(tmp_path: Path) -> None:
+    (tmp_path / "a.mp4").write_text("a")
+    index = dix.DirectoryIndex.scan(str(tmp_path))
+
+    (tmp_path / "a_TV.mp4").write_text("tv")
+    assert index.names() == ["a.mp4"]
+    index.refresh(["a_TV.mp4", "missing.mp4"])
+    assert index.names() == ["a.mp4", "a_TV.mp4"]
+
+    (tmp_path / "a.mp4").unlink()
+    index.refresh(["a.mp4"])
+    index.remove(["a_TV.mp4"])
+    assert index.names() == []
+
+
+def test_fingerprint(tmp_path: Path) -> None:
+    path = tmp_path / "a.mp4"
+    path.write_text("dummy")
+    index = dix.DirectoryIndex.scan(str(tmp_path))
+
+    assert index.fingerprint("a.mp4") == fpr.file_fingerprint(str(path))
+    assert index.fingerprint("a.mp4", full=True) == fpr.file_fingerprint(
+        str(path), full=True
+    )
+    assert index.fingerprint("missing.mp4") is None
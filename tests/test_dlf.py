@@ -108,3 +108,15 @@ def test_delete_files_in_folder_with_directory(tmpdir: str) -> None:
 
     assert not (folder_path / "file_TV.txt").exists()
     assert (folder_path / "directory_TV").exists()
+
+
+def test_delete_files_in_folder_with_file_names(tmp_path: Path) -> None:
+    (tmp_path / "a_TV.mov").write_text("Test File 1")
+    (tmp_path / "b_TV.mov").write_text("Test File 2")
+
+    deleted = dlf.delete_files_in_folder(
+        dlf.temporarily_data_list, str(tmp_path), ["a_TV.mov", "missing_TV.mov"]
+    )
+
+    assert deleted == ["a_TV.mov"]
+    assert (tmp_path / "b_TV.mov").exists()
@@ -1,7 +1,7 @@
 import math
 import os
 import sys
-from typing import Any, List
+from typing import Any, List, Optional
 
 import pytest
 
@@ -20,6 +20,17 @@ def sample_video_paths() -> List[str]:
     return [os.path.join(TEST_DATA_DIR, video) for video in SAMPLE_VIDEOS]
 
 
+def has_args(argv: List[str], args: List[str]) -> bool:
+    """Return whether args appear in argv as consecutive arguments."""
+    return any(
+        argv[i : i + len(args)] == args for i in range(len(argv) - len(args) + 1)
+    )
+
+
+def get_filter_complex(argv: List[str]) -> str:
+    return argv[argv.index("-filter_complex") + 1]
+
+
 @pytest.mark.parametrize("match_input_resolution_flag", [True, False])
 def test_create_ffmpeg_command_v1(
     sample_video_paths: List[str], match_input_resolution_flag: bool, monkeypatch: Any
@@ -37,7 +48,7 @@ def test_create_ffmpeg_command_v1(
     )
 
     # Check if the command is not empty
-    assert command != ""
+    assert command != []
 
     # Check if all input files are in the command
     for input_file in sample_video_paths:
@@ -53,26 +64,27 @@ def test_create_ffmpeg_command_v1(
         expected_resolution = f"{EXPECTED_WIDTH * sqrt_N}x{EXPECTED_HEIGHT * sqrt_N}"
     else:
         expected_resolution = f"{EXPECTED_WIDTH}x{EXPECTED_HEIGHT}"
-    assert f"-s {expected_resolution}" in command
+    assert has_args(command, ["-s", expected_resolution])
 
     # Check if filter complex is present
     assert "-filter_complex" in command
+    filter_complex = get_filter_complex(command)
 
     # Check if the number of scale operations matches the number of input files
-    scale_count = command.count(f"scale={EXPECTED_WIDTH}:{EXPECTED_HEIGHT}")
+    scale_count = filter_complex.count(f"scale={EXPECTED_WIDTH}:{EXPECTED_HEIGHT}")
     assert scale_count == N
 
     # Check if the number of hstack operations is correct
-    hstack_count = command.count("hstack=inputs=")
+    hstack_count = filter_complex.count("hstack=inputs=")
     assert hstack_count == sqrt_N
 
     # Check if vstack operation is present
-    assert "vstack=inputs=" in command
+    assert "vstack=inputs=" in filter_complex
 
 
 def test_create_ffmpeg_command_v1_empty_input() -> None:
     command = main.create_ffmpeg_command_v1([], "output.mp4", True)
-    assert command == ""
+    assert command == []
 
 
 def test_create_ffmpeg_command_v1_invalid_video_size(
@@ -89,7 +101,7 @@ def test_create_ffmpeg_command_v1_invalid_video_size(
     monkeypatch.setattr(main, "get_video_size", mock_get_video_size)
 
     command = main.create_ffmpeg_command_v1([str(invalid_file)], "output.mp4", True)
-    assert command == ""
+    assert command == []
 
 
 @pytest.mark.parametrize("match_input_resolution_flag", [True, False])
@@ -109,7 +121,7 @@ def test_create_ffmpeg_command_v2(
     )
 
     # Check if the command is not empty
-    assert command != ""
+    assert command != []
 
     # Check if all input files are in the command
     for input_file in sample_video_paths:
@@ -125,26 +137,27 @@ def test_create_ffmpeg_command_v2(
         expected_resolution = f"{EXPECTED_WIDTH * sqrt_N}x{EXPECTED_HEIGHT * sqrt_N}"
     else:
         expected_resolution = f"{EXPECTED_WIDTH}x{EXPECTED_HEIGHT}"
-    assert f"-s {expected_resolution}" in command
+    assert has_args(command, ["-s", expected_resolution])
 
     # Check if filter complex is present
     assert "-filter_complex" in command
+    filter_complex = get_filter_complex(command)
 
     # Check if the number of scale operations matches the number of input files
-    scale_count = command.count(f"scale={EXPECTED_WIDTH}:{EXPECTED_HEIGHT}")
+    scale_count = filter_complex.count(f"scale={EXPECTED_WIDTH}:{EXPECTED_HEIGHT}")
     assert scale_count == N
 
     # Check if the number of hstack operations is correct
-    hstack_count = command.count("hstack=inputs=")
+    hstack_count = filter_complex.count("hstack=inputs=")
     assert hstack_count == sqrt_N
 
     # Check if vstack operation is present
-    assert "vstack=inputs=" in command
+    assert "vstack=inputs=" in filter_complex
 
 
 def test_create_ffmpeg_command_v2_empty_input() -> None:
     command = main.create_ffmpeg_command_v2([], "output.mp4", True)
-    assert command == ""
+    assert command == []
 
 
 def test_create_ffmpeg_command_v2_invalid_video_size(
@@ -161,4 +174,520 @@ def test_create_ffmpeg_command_v2_invalid_video_size(
     monkeypatch.setattr(main, "get_video_size", mock_get_video_size)
 
     command = main.create_ffmpeg_command_v2([str(invalid_file)], "output.mp4", True)
-    assert command == ""
+    assert command == []
+
+
+@pytest.mark.parametrize(
+    "start,duration,expected",
+    [
+        (None, None, "-i a.mp4 -i b.mp4"),
+        (0.0, 60.0, "-t 60.0 -i a.mp4 -t 60.0 -i b.mp4"),
+        (60.0, 30.0, "-ss 60.0 -t 30.0 -i a.mp4 -ss 60.0 -t 30.0 -i b.mp4"),
+    ],
+)
+def test_build_input_options(
+    start: Optional[float], duration: Optional[float], expected: str
+) -> None:
+    assert main.build_input_options(["a.mp4", "b.mp4"], start, duration) == (
+        expected.split(" ")
+    )
+
+
+def test_build_input_options_image() -> None:
+    # a still image is decoded once, so it is neither seeked nor cut
+    assert main.build_input_options(["a.mp4", "b.png"], 60.0, 30.0) == [
+        "-ss",
+        "60.0",
+        "-t",
+        "30.0",
+        "-i",
+        "a.mp4",
+        "-i",
+        "b.png",
+    ]
+
+
+def test_build_input_options_keeps_paths() -> None:
+    # Every path is one argument, whatever characters it contains
+    paths = ["/in/my clip.mp4", '/in/it\'s \\ "a".png', "/in/$(x);.mp4"]
+    assert main.build_input_options(paths) == [
+        "-i",
+        paths[0],
+        "-i",
+        paths[1],
+        "-i",
+        paths[2],
+    ]
+
+
+def test_build_grid_filter_complex_image() -> None:
+    filter_complex = main.build_grid_filter_complex(
+        4, 320, 180, 25.0, [0, 1, 1, 2], image_inputs=[1]
+    )
+    assert (
+        "[1:v]scale=320:180,loop=loop=-1:size=1:start=0,fps=25.0,split=2[v1][v2]"
+        in filter_complex
+    )
+    assert "anullsrc=channel_layout=stereo:sample_rate=48000,asplit=2[a1][a2]" in (
+        filter_complex
+    )
+    assert "[v0][v1]hstack=inputs=2:shortest=1[row0]" in filter_complex
+    assert "vstack=inputs=2:shortest=1[vstack]" in filter_complex
+    assert "amix=inputs=4:duration=shortest:dropout_transition=0" in filter_complex
+
+
+@pytest.mark.parametrize(
+    "policy,max_fps,expected",
+    [
+        ("first", None, 60.0),
+        ("min", None, 24.0),
+        ("max", None, 60.0),
+        ("common", None, 30.0),
+        ("first", 30.0, 30.0),
+        ("min", 30.0, 24.0),
+    ],
+)
+def test_get_output_fps(
+    policy: str, max_fps: Optional[float], expected: float, monkeypatch: Any
+) -> None:
+    rates = {"a.mp4": 60.0, "b.mp4": 30.0, "c.mp4": 24.0, "d.mp4": 30.0}
+    monkeypatch.setattr(main, "get_video_fps", lambda f: rates.get(f))
+    monkeypatch.setattr(main, "output_fps_policy", policy)
+    monkeypatch.setattr(main, "max_output_fps", max_fps)
+    assert main.get_output_fps(["a.mp4", "b.mp4", "c.mp4", "d.mp4", "e.png"]) == (
+        expected
+    )
+
+
+def test_get_output_fps_invalid_policy(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "output_fps_policy", "fastest")
+    with pytest.raises(ValueError, match="Invalid output_fps_policy: fastest"):
+        main.get_output_fps(["a.mp4"])
+
+
+def test_get_convert_inputs(monkeypatch: Any) -> None:
+    pix_fmts = {"a.mp4": "yuv420p", "b.mp4": "yuv422p10le", "c.png": "rgb24"}
+    monkeypatch.setattr(main, "probe_video", lambda f: {"pix_fmt": pix_fmts.get(f)})
+    files = ["a.mp4", "b.mp4", "b.mp4", "c.png", "d.mp4"]
+
+    assert main.get_convert_inputs(files, [0, 1, 1, 2, 3]) == [1, 2, 3]
+    monkeypatch.setattr(main, "target_pix_fmt", None)
+    assert main.get_convert_inputs(files, [0, 1, 1, 2, 3]) == []
+
+
+def test_build_grid_filter_complex_convert() -> None:
+    filter_complex = main.build_grid_filter_complex(
+        4, 320, 180, 25.0, image_inputs=[3], convert_inputs=[1, 3]
+    )
+    assert "[0:v]scale=320:180,fps=25.0[v0]" in filter_complex
+    assert "[1:v]scale=320:180,format=yuv420p,fps=25.0[v1]" in filter_complex
+    assert (
+        "[3:v]scale=320:180,format=yuv420p,loop=loop=-1:size=1:start=0,fps=25.0[v3]"
+        in filter_complex
+    )
+
+
+@pytest.mark.parametrize(
+    "strategy,expected",
+    [
+        ("mix", [0, 2, 3]),
+        ("first", [0, 2]),
+        ("single", [0]),
+        ("silent", []),
+        ("none", []),
+    ],
+)
+def test_get_audio_tiles(strategy: str, expected: List[int], monkeypatch: Any) -> None:
+    codecs = {"a.mp4": "aac", "b.mp4": None, "c.mp4": "aac", "d.mp4": "opus"}
+    monkeypatch.setattr(main, "probe_video", lambda f: {"audio_codec": codecs[f]})
+    monkeypatch.setattr(main, "audio_strategy", strategy)
+    monkeypatch.setattr(main, "audio_mix_tiles", 2)
+    assert main.get_audio_tiles(["a.mp4", "b.mp4", "c.mp4", "d.mp4"]) == expected
+
+
+def test_get_audio_tiles_invalid_strategy(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "audio_strategy", "loud")
+    with pytest.raises(ValueError, match="Invalid audio_strategy: loud"):
+        main.get_audio_tiles(["a.mp4"])
+
+
+@pytest.mark.parametrize(
+    "strategy,audio_map,audio_output",
+    [
+        ("single", ["-map", "1:a"], []),
+        ("copy", ["-map", "1:a"], ["-c:a", "copy"]),
+        ("none", [], ["-an"]),
+    ],
+)
+def test_create_ffmpeg_command_audio_passthrough(
+    strategy: str, audio_map: List[str], audio_output: List[str], monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(
+        main, "probe_video", lambda f: {"audio_codec": None if f == "a" else "aac"}
+    )
+    monkeypatch.setattr(main, "audio_strategy", strategy)
+
+    command = main.create_ffmpeg_command_v1(["a", "b", "c", "d"], "out.mp4", True)
+
+    # no audio filter at all: the audio of the other tiles is not decoded
+    assert ":a]" not in get_filter_complex(command)
+    assert get_filter_complex(command).endswith("vstack=inputs=2[vstack]")
+    assert has_args(command, ["-map", "[vstack]", *audio_map, "-c:v"])
+    assert has_args(command, ["-b:a", "192k", *audio_output, "-threads"])
+
+
+def test_create_ffmpeg_command_audio_mix_skips_silent_tiles(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(
+        main, "probe_video", lambda f: {"audio_codec": None if f == "b" else "aac"}
+    )
+
+    command = main.create_ffmpeg_command_v2(["a", "b", "c", "a"], "out.mp4", True)
+    filter_complex = get_filter_complex(command)
+
+    assert "[1:a]" not in filter_complex
+    assert "[0:a]volume=1,asplit=2[a0][a3]; [2:a]volume=1[a2]; " in filter_complex
+    assert filter_complex.endswith(
+        "[a0][a2][a3]amix=inputs=3:dropout_transition=0,volume=3[aout]"
+    )
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("1080p", {"size": "1080p", "profile": "v2", "bitrate": None}),
+        ("1920x1080:v1:6M", {"size": "1920x1080", "profile": "v1", "bitrate": "6M"}),
+        ("540p::800k", {"size": "540p", "profile": "v2", "bitrate": "800k"}),
+    ],
+)
+def test_parse_rendition(text: str, expected: Any) -> None:
+    assert main.parse_rendition(text) == expected
+
+
+@pytest.mark.parametrize("text", ["1080", "1080p:v3", "1080p:v1:fast", "x720"])
+def test_parse_rendition_invalid(text: str) -> None:
+    with pytest.raises(ValueError, match="Invalid rendition"):
+        main.parse_rendition(text)
+
+
+def test_create_ffmpeg_command_keeps_paths(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "probe_video", lambda f: {"audio_codec": "aac"})
+    monkeypatch.setattr(main, "output_artifacts", ["sprite"])
+    files = ["/in/it's 1.mp4", '/in/"2".mp4', "/in/3 \\ x.mp4", "/in/$4.mp4"]
+
+    command = main.create_ffmpeg_command_v1(files, "/out/100% 'a'.mp4", True)
+
+    # Every path and the filter graph are passed to ffmpeg unchanged
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-i"] == files
+    assert "select='not(mod(n\\,250))'" in get_filter_complex(command)
+    assert "/out/100% 'a'.mp4" in command
+    assert command[-1] == "/out/100%% 'a'_sprite_%03d.jpg"
+
+
+def test_create_ffmpeg_command_renditions(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "probe_video", lambda f: {"audio_codec": "aac"})
+    monkeypatch.setattr(
+        main,
+        "output_renditions",
+        [main.parse_rendition("180p:v1:1M"), main.parse_rendition("160x90")],
+    )
+
+    command = main.create_ffmpeg_command_v2(["a", "b", "c", "d"], "out.mp4", True)
+    filter_complex = get_filter_complex(command)
+
+    # The grid is composited once and split into the renditions
+    assert filter_complex.count("vstack=inputs=2") == 1
+    assert filter_complex.endswith(
+        "[vstack]split=3[vmain][vr0][vr1]; [vr0]scale=-2:180[r0]; "
+        "[vr1]scale=160:90[r1]; [aout]asplit=3[amain][ar0][ar1]"
+    )
+    assert has_args(command, ["-map", "[vmain]", "-map", "[amain]", "-c:v", "libx264"])
+    assert has_args(command, ["-s", "640x360", "out.mp4", "-map", "[r0]"])
+    assert has_args(
+        command,
+        ["-map", "[r0]", "-map", "[ar0]", "-c:v", "libx264", "-preset", "ultrafast"]
+        + ["-r", "25.0", "-c:a", "aac", "-b:a", "192k"]
+        + ["-b:v", "1M", "-maxrate", "1M", "-bufsize", "1M", "-threads"],
+    )
+    assert command[-1] == "out_160x90.mp4"
+    assert main.get_extra_output_paths("out.mp4") == [
+        "out_180p.mp4",
+        "out_160x90.mp4",
+    ]
+
+
+def test_create_ffmpeg_command_artifacts(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "probe_video", lambda f: {"audio_codec": "aac"})
+    monkeypatch.setattr(main, "output_artifacts", ["poster", "sprite", "preview"])
+
+    command = main.create_ffmpeg_command_v1(["a", "b", "c", "d"], "out.mp4", True)
+    filter_complex = get_filter_complex(command)
+
+    assert filter_complex.count("vstack=inputs=2") == 1
+    assert filter_complex.endswith(
+        "[vstack]split=4[vmain][vposter][vsprite][vpreview]; "
+        "[vposter]thumbnail=100[poster]; "
+        "[vsprite]select='not(mod(n\\,250))',scale=160:-2,tile=5x5[sprite]; "
+        "[vpreview]fps=10.0,scale=-2:240[preview]"
+    )
+    # Artifacts have no audio, so the mixed track is not split
+    assert has_args(command, ["-map", "[vmain]", "-map", "[aout]", "-c:v"])
+    assert has_args(
+        command, ["-map", "[poster]", "-frames:v", "1", "-q:v", "2", "out_poster.jpg"]
+    )
+    assert has_args(command, ["-map", "[sprite]", "-q:v", "3", "out_sprite_%03d.jpg"])
+    assert command[-12:] == (
+        ["-map", "[preview]", "-t", "10.0", "-c:v", "libx264", "-preset"]
+        + ["ultrafast", "-crf", "30", "-an", "out_preview.mp4"]
+    )
+    assert main.get_extra_output_paths("out.mp4") == [
+        "out_poster.jpg",
+        "out_sprite_%03d.jpg",
+        "out_preview.mp4",
+    ]
+    # A '%' of the output path is no image2 sequence pattern
+    assert main.get_artifact_path("/out/100%.mp4", "sprite") == (
+        "/out/100%%_sprite_%03d.jpg"
+    )
+    with pytest.raises(ValueError, match="Invalid artifact"):
+        main.build_artifact_output("gif", 25.0)
+
+
+def test_create_proxy_command(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (1920, 1080))
+    monkeypatch.setattr(main, "probe_video", lambda f: {"pix_fmt": "yuv420p"})
+
+    command = main.create_proxy_command(["a.mp4", "b.mp4", "c.png", "a.mp4"], "p.mp4")
+
+    # Videos are looped and cut to proxy_seconds, images are held by the graph
+    assert command[: command.index("-filter_complex")] == (
+        ["ffmpeg", "-y", "-stream_loop", "-1", "-t", "10.0", "-i", "a.mp4"]
+        + ["-stream_loop", "-1", "-t", "10.0", "-i", "b.mp4", "-i", "c.png"]
+    )
+    assert "[0:v]scale=160:90,fps=10.0,split=2[v0][v3]; " in get_filter_complex(command)
+    assert "aout" not in get_filter_complex(command)
+    assert command[command.index("-map") :] == (
+        ["-map", "[vstack]", "-c:v", "libx264", "-preset", "ultrafast", "-crf", "30"]
+        + ["-r", "10.0", "-an", "-t", "10.0", "-loglevel", "error", "p.mp4"]
+    )
+    assert main.get_proxy_path("/out/grid.mov") == "/out/grid_proxy.mov"
+
+
+def test_get_block_ranges() -> None:
+    assert main.get_block_ranges(10, 5) == [(0, 5), (5, 5)]
+    assert main.get_block_ranges(7, 3) == [(0, 3), (3, 3), (6, 1)]
+
+
+@pytest.mark.parametrize("intermediate", ["fifo", "file"])
+def test_create_hierarchical_ffmpeg_commands(
+    intermediate: str, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(
+        main, "probe_video", lambda f: {"pix_fmt": "yuv420p", "audio_codec": "aac"}
+    )
+    input_files = [f"tile{i}.mp4" for i in range(25)]
+
+    block_commands, block_paths, final_command = (
+        main.create_hierarchical_ffmpeg_commands(
+            input_files, "out.mp4", True, "/blocks", 2, "v2", intermediate=intermediate
+        )
+    )
+
+    # 5x5 tiles in blocks of 2x2, 2x1, 1x2 and 1x1 tiles
+    assert len(block_commands) == len(block_paths) == 9
+    input_counts = [command.count("-i") for command in block_commands]
+    assert input_counts == [4, 4, 2, 4, 4, 2, 2, 2, 1]
+    assert has_args(
+        block_commands[0],
+        ["-i", "tile0.mp4", "-i", "tile1.mp4", "-i", "tile5.mp4", "-i", "tile6.mp4"],
+    )
+    block_filter = get_filter_complex(block_commands[0])
+    assert "[v0][v1]hstack=inputs=2[row0]" in block_filter
+    assert "[0:v]scale=320:180,fps=25.0[v0]; [v0]null[row0]" in get_filter_complex(
+        block_commands[8]
+    )
+    assert "amix=inputs=4:dropout_transition=0,volume=4[aout]" in block_filter
+    assert "pcm_f32le" in block_commands[0]
+    assert block_commands[0][-1] == block_paths[0]
+    assert block_paths[0].endswith(".nut" if intermediate == "fifo" else ".mkv")
+
+    final_filter = get_filter_complex(final_command)
+    assert final_command.count("-i") == 9
+    assert "[0:v][1:v][2:v]hstack=inputs=3[row0]" in final_filter
+    assert "amix=inputs=9:dropout_transition=0,volume=9[aout]" in final_filter
+    assert has_args(final_command, ["-preset", "medium", "-crf", "23"])
+    assert has_args(final_command, ["-s", "1600x900", "out.mp4"])
+    assert "scale" not in final_filter
+
+
+def test_create_hierarchical_ffmpeg_commands_image_block(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    input_files = [f"tile{i}.mp4" for i in range(8)] + ["logo.png"]
+
+    block_commands, _, _ = main.create_hierarchical_ffmpeg_commands(
+        input_files, "out.mp4", True, "/blocks", 2, "v2", duration=30.0
+    )
+
+    # only the block holding nothing but the image is cut at the grid length
+    assert "loop=loop=-1" in get_filter_complex(block_commands[3])
+    assert has_args(block_commands[3], ["-t", "30.0", "-loglevel"])
+    assert all(not has_args(c, ["-t", "30.0", "-loglevel"]) for c in block_commands[:3])
+
+
+def test_create_hierarchical_ffmpeg_commands_audio(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "audio_strategy", "first")
+    monkeypatch.setattr(main, "audio_mix_tiles", 1)
+    input_files = [f"tile{i}.mp4" for i in range(9)]
+
+    block_commands, _, final_command = main.create_hierarchical_ffmpeg_commands(
+        input_files, "out.mp4", True, "/blocks", 2, "v2"
+    )
+
+    # only the block of the first tile carries audio
+    assert has_args(block_commands[0], ["-map", "[aout]"])
+    assert all("[aout]" not in command for command in block_commands[1:])
+    assert "[0:a]amix=inputs=1:dropout_transition=0,volume=1[aout]" in (
+        get_filter_complex(final_command)
+    )
+
+
+@pytest.mark.parametrize("strategy", ["single", "copy"])
+def test_create_hierarchical_ffmpeg_commands_single_audio(
+    strategy: str, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "audio_strategy", strategy)
+    input_files = [f"tile{i}.mp4" for i in range(9)]
+
+    block_commands, _, final_command = main.create_hierarchical_ffmpeg_commands(
+        input_files, "out.mp4", True, "/blocks", 2, "v2", start=5.0
+    )
+
+    # The heard tile is read by the final process, not through its block
+    assert all("[aout]" not in command for command in block_commands)
+    assert "[aout]" not in final_command
+    assert final_command.count("-i") == 5
+    assert has_args(final_command, ["-ss", "5.0", "-i", "tile0.mp4"])
+    assert has_args(final_command, ["-map", "4:a"])
+    assert has_args(final_command, ["-c:a", "copy"]) == (strategy == "copy")
+
+
+def test_run_hierarchical_ffmpeg_commands_fifo(tmp_path: Any) -> None:
+    block_paths = [str(tmp_path / "block0"), str(tmp_path / "block1")]
+    output_path = tmp_path / "out.txt"
+    # The commands are run without a shell
+    final_command = [
+        "sh",
+        "-c",
+        f"cat {block_paths[0]} {block_paths[1]} > {output_path}",
+    ]
+
+    returncode = main.run_hierarchical_ffmpeg_commands(
+        [
+            ["sh", "-c", f"printf a > {block_paths[0]}"],
+            ["sh", "-c", f"printf b > {block_paths[1]}"],
+        ],
+        block_paths,
+        final_command,
+    )
+    assert returncode == 0
+    assert output_path.read_text() == "ab"
+
+    # A failed block must not leave the final process waiting for its FIFO
+    for block_path in block_paths:
+        os.remove(block_path)
+    returncode = main.run_hierarchical_ffmpeg_commands(
+        [["sh", "-c", "exit 3"], ["sh", "-c", f"printf b > {block_paths[1]}"]],
+        block_paths,
+        final_command,
+    )
+    assert returncode == 3
+
+
+def test_encode_grid_hierarchical(tmp_path: Any, monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "hierarchical_block_size", 2)
+    monkeypatch.setattr(main, "hierarchical_intermediate", "file")
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    commands: List[List[str]] = []
+
+    def mock_run_ffmpeg_command(command: List[str], *args: Any) -> int:
+        commands.append(command)
+        return 0
+
+    monkeypatch.setattr(main, "run_ffmpeg_command", mock_run_ffmpeg_command)
+
+    output_path = str(tmp_path / "out.mp4")
+    input_files = [f"tile{i}.mp4" for i in range(16)]
+    assert main.encode_grid(input_files, output_path, 10.0, "v1") == 0
+    assert len(commands) == 5
+    assert commands[-1][-1] == output_path
+    # the blocks are removed with their temporary folder
+    assert os.listdir(tmp_path) == []
+
+    commands.clear()
+    assert main.encode_grid(input_files[:4], output_path, 10.0, "v1") == 0
+    assert len(commands) == 1
+
+
+def test_get_unique_inputs(tmp_path: Any) -> None:
+    source = tmp_path / "feed.mp4"
+    source.write_text("feed")
+    other = tmp_path / "other.mp4"
+    other.write_text("feed")
+    os.link(source, tmp_path / "feed_copy.mp4")
+    os.symlink(source, tmp_path / "feed_link.mp4")
+    files = [
+        str(tmp_path / name)
+        for name in ["feed.mp4", "other.mp4", "feed_copy.mp4", "feed_link.mp4"]
+    ]
+
+    unique_files, input_indexes = main.get_unique_inputs(files)
+    assert unique_files == files[:2]
+    assert input_indexes == [0, 1, 0, 0]
+
+
+def test_build_grid_filter_complex_shared_inputs() -> None:
+    filter_complex = main.build_grid_filter_complex(4, 320, 180, 30.0, [0, 1, 0, 0])
+    assert filter_complex.startswith(
+        "[0:v]scale=320:180,fps=30.0,split=3[v0][v2][v3]; "
+        "[1:v]scale=320:180,fps=30.0[v1]; "
+    )
+    assert "[0:a]volume=1,asplit=3[a0][a2][a3]; [1:a]volume=1[a1]; " in filter_complex
+    assert filter_complex.endswith(
+        "[a0][a1][a2][a3]amix=inputs=4:dropout_transition=0,volume=4[aout]"
+    )
+    assert "[v0][v1]hstack=inputs=2[row0]" in filter_complex
+
+
+def test_create_ffmpeg_command_opens_shared_inputs_once(
+    tmp_path: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 30.0)
+    source = tmp_path / "a_TV.mp4"
+    source.write_text("a")
+    for name in ["b_TV.mp4", "c_TV.mp4"]:
+        os.link(source, tmp_path / name)
+    (tmp_path / "d_TV.mp4").write_text("d")
+    files = [str(tmp_path / f"{name}_TV.mp4") for name in "abcd"]
+
+    command = main.create_ffmpeg_command(files, "out.mp4", True, "v1")
+    assert command.count("-i") == 2
+    assert has_args(command, ["-i", files[0], "-i", files[3], "-filter_complex"])
+    assert "split=3[v0][v1][v2]" in get_filter_complex(command)
@@ -0,0 +1,60 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import fingerprint as fpr
+
+
+def test_file_fingerprint(tmp_path: Path) -> None:
+    path = tmp_path / "video.mp4"
+    path.write_text("dummy")
+    fingerprint = fpr.file_fingerprint(str(path))
+    assert fingerprint is not None
+    assert fingerprint["size"] == 5
+    # Small files are hashed completely
+    assert fpr.file_fingerprint(str(path), full=True) == fingerprint
+
+    path.write_text("changed content")
+    assert fpr.file_fingerprint(str(path)) != fingerprint
+    assert fpr.file_fingerprint(str(tmp_path / "missing.mp4")) is None
+
+
+def test_get_sample_offsets() -> None:
+    assert fpr.get_sample_offsets(10 * 64, 64, 8) == []
+    assert fpr.get_sample_offsets(10 * 64 + 1, 64, 8) == [
+        0,
+        64,
+        128,
+        192,
+        256,
+        321,
+        385,
+        449,
+        513,
+        577,
+    ]
+    assert fpr.get_sample_offsets(1000, 100, 1) == [0, 450, 900]
+
+
+def test_sampled_fingerprint_of_large_file(tmp_path: Path) -> None:
+    path = tmp_path / "large.mp4"
+    data = bytearray(os.urandom(fpr.SAMPLE_SIZE * 40))
+    path.write_bytes(data)
+    sampled = fpr.file_fingerprint(str(path))
+    full = fpr.file_fingerprint(str(path), full=True)
+    assert sampled is not None and full is not None
+    assert sampled["hash"] != full["hash"]
+
+    # A change in the tail block is detected with the same size and mtime
+    stat = os.stat(path)
+    data[-1] ^= 0xFF
+    path.write_bytes(data)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    fpr._hash_file.cache_clear()
+    assert fpr.file_fingerprint(str(path)) != sampled
+
+    stats = fpr.measure_throughput([str(path)])
+    assert stats["files"] == 1
+    assert stats["bytes"] == fpr.SAMPLE_SIZE * 40
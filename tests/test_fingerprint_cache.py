@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+from typing import Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import fingerprint_cache as fpc
+
+
+def test_fingerprint_cache_round_trip(tmp_path: Any) -> None:
+    path = str(tmp_path / "a.mp4")
+    with open(path, "w") as f:
+        f.write("a")
+    cache_path = str(tmp_path / "cache" / "cache.json")
+    cache = fpc.FingerprintCache.open(cache_path)
+    assert cache.get_entry(path) is None
+
+    cache.set_entry(path, {"value": 1})
+    cache.save()
+    cache = fpc.FingerprintCache.open(cache_path)
+    assert cache.get_entry(path) == {
+        "fingerprint": cache.entries[path]["fingerprint"],
+        "value": 1,
+    }
+
+    # The entry no longer applies once the file changes
+    with open(path, "w") as f:
+        f.write("changed")
+    assert cache.get_entry(path) is None
+
+
+def test_fingerprint_cache_ignores_other_versions(tmp_path: Any) -> None:
+    cache_path = tmp_path / "cache.json"
+    cache_path.write_text(json.dumps({"version": 0, "entries": {"a": {}}}))
+    assert fpc.FingerprintCache.open(str(cache_path)).entries == {}
+
+    cache_path.write_text("{")
+    assert fpc.FingerprintCache.open(str(cache_path)).entries == {}
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+from typing import Any, List
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import integrity_check as ick
+
+CORRUPT_LOG = "[h264 @ 0x1] Invalid NAL unit size (1234 > 567).\n"
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch: Any) -> List[Any]:
+    calls: List[Any] = []
+
+    def mock_run(argv: List[str], **kwargs: Any) -> Any:
+        calls.append(argv)
+        path = argv[argv.index("-i") + 1]
+        stderr = CORRUPT_LOG if "corrupt" in path else ""
+        return subprocess.CompletedProcess(argv, 0, "", stderr)
+
+    monkeypatch.setattr(subprocess, "run", mock_run)
+    return calls
+
+
+def test_build_check_command() -> None:
+    assert ick.build_check_command("a.mp4", "fast")[-8:] == [
+        "a.mp4",
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        "-f",
+        "null",
+        "-",
+    ]
+    assert ick.build_check_command("a.mp4", "full")[-6:] == [
+        "a.mp4",
+        "-map",
+        "0",
+        "-f",
+        "null",
+        "-",
+    ]
+    with pytest.raises(ValueError, match="Invalid integrity check mode"):
+        ick.build_check_command("a.mp4", "slow")
+
+
+def test_check_file(ffmpeg: List[Any]) -> None:
+    assert ick.check_file("a.mp4", "fast") is None
+    assert ick.check_file("corrupt.mp4", "full") == CORRUPT_LOG.strip()
+
+
+def test_check_files_uses_cache(tmp_path: Any, ffmpeg: List[Any]) -> None:
+    paths = [str(tmp_path / name) for name in ("a.mp4", "b.mp4")]
+    for path in paths:
+        with open(path, "w") as f:
+            f.write(path)
+    cache_path = str(tmp_path / "integrity.json")
+
+    results = ick.check_files(paths, "full", ick.IntegrityCache.open(cache_path))
+    assert results == {paths[0]: None, paths[1]: None}
+    assert len(ffmpeg) == 2
+
+    # Clean files are not checked again, also not in the faster mode
+    ick.check_files(paths, "fast", ick.IntegrityCache.open(cache_path))
+    assert len(ffmpeg) == 2
+
+    # until they change
+    with open(paths[0], "w") as f:
+        f.write("changed")
+    ick.check_files(paths, "full", ick.IntegrityCache.open(cache_path))
+    assert len(ffmpeg) == 3
+
+
+def test_fast_check_after_full_check_of_changed_file(tmp_path: Any) -> None:
+    path = str(tmp_path / "a.mp4")
+    with open(path, "w") as f:
+        f.write("a")
+    cache = ick.IntegrityCache(str(tmp_path / "integrity.json"))
+    cache.record(path, "full")
+
+    with open(path, "w") as f:
+        f.write("changed")
+    cache.record(path, "fast")
+    assert cache.is_clean(path, "fast")
+    assert not cache.is_clean(path, "full")
+
+
+def test_merge_videos_aborts_on_corrupt_input(
+    tmp_path: Any, monkeypatch: Any, ffmpeg: List[Any], capsys: Any
+) -> None:
+    monkeypatch.setattr(main, "integrity_check_mode", "fast")
+    monkeypatch.setattr(main, "integrity_check_workers", 1)
+    monkeypatch.setattr(
+        main, "create_target_video", lambda *args: pytest.fail("normalized")
+    )
+    files = ["a.mp4", "corrupt.mp4", "c.mp4", "d.mp4"]
+    for file in files:
+        (tmp_path / file).write_text(file)
+
+    with pytest.raises(ValueError, match="Corrupt input files: corrupt.mp4"):
+        main.merge_videos(str(tmp_path), files, str(tmp_path / "out.mp4"))
+
+    # The checks after the corrupt file are skipped
+    assert len(ffmpeg) == 2
+    out = capsys.readouterr().out
+    assert "Integrity Check: a.mp4: ok" in out
+    assert f"Integrity Check: corrupt.mp4: {CORRUPT_LOG.strip()}" in out
+    assert "Integrity Check: d.mp4: not checked" in out
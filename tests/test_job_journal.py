@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import job_journal as jnl
+
+SETTINGS = {"output_path": "/output/combined_video.mov", "cmd_version": "v1"}
+
+
+def test_journal_round_trip(tmp_path: Path) -> None:
+    video = tmp_path / "video.mp4"
+    video.write_text("dummy")
+    tv_video = tmp_path / "video_TV.mp4"
+    tv_video.write_text("dummy")
+    journal_path = jnl.get_journal_path(str(tmp_path / "out.mov"))
+
+    journal = jnl.JobJournal.open(journal_path, SETTINGS)
+    journal.record_probe(str(video), 12.5)
+    journal.record_normalized(str(tv_video))
+
+    reopened = jnl.JobJournal.open(journal_path, SETTINGS)
+    assert reopened.get_probe(str(video)) == 12.5
+    assert reopened.is_normalized(str(tv_video))
+    assert not reopened.is_normalized(str(tmp_path / "other_TV.mp4"))
+    assert not os.path.exists(f"{journal_path}.tmp")
+
+    reopened.remove()
+    assert not os.path.exists(journal_path)
+
+
+def test_journal_detects_changed_files(tmp_path: Path) -> None:
+    video = tmp_path / "video.mp4"
+    video.write_text("dummy")
+    journal = jnl.JobJournal.open(str(tmp_path / "job.journal.json"), SETTINGS)
+    journal.record_probe(str(video), 12.5)
+    journal.record_normalized(str(video))
+
+    video.write_text("re-recorded")
+    assert journal.get_probe(str(video)) is None
+    assert not journal.is_normalized(str(video))
+
+
+def test_journal_discarded_for_other_settings(tmp_path: Path) -> None:
+    journal_path = str(tmp_path / "job.journal.json")
+    journal = jnl.JobJournal.open(journal_path, SETTINGS)
+    journal.plan_segments(100.0, 60.0)
+
+    other = jnl.JobJournal.open(journal_path, {**SETTINGS, "cmd_version": "v2"})
+    assert other.segments == []
+
+
+def test_journal_ignores_corrupt_file(tmp_path: Path) -> None:
+    journal_path = tmp_path / "job.journal.json"
+    journal_path.write_text("{not json")
+    journal = jnl.JobJournal.open(str(journal_path), SETTINGS)
+    assert journal.probes == {}
+
+
+def test_plan_segments(tmp_path: Path) -> None:
+    journal = jnl.JobJournal.open(str(tmp_path / "job.journal.json"), SETTINGS)
+    journal.plan_segments(130.0, 60.0)
+    assert [(s["start"], s["duration"]) for s in journal.segments] == [
+        (0.0, 60.0),
+        (60.0, 60.0),
+        (120.0, 10.0),
+    ]
+
+    # An existing plan is kept so recorded segments stay valid
+    journal.plan_segments(500.0, 10.0)
+    assert len(journal.segments) == 3
+
+
+def test_record_segment(tmp_path: Path) -> None:
+    journal_path = str(tmp_path / "job.journal.json")
+    journal = jnl.JobJournal.open(journal_path, SETTINGS)
+    journal.plan_segments(120.0, 60.0)
+    part = tmp_path / "out.part0000.mov"
+    part.write_text("segment")
+    journal.record_segment(0, str(part))
+
+    reopened = jnl.JobJournal.open(journal_path, SETTINGS)
+    assert reopened.is_segment_done(0)
+    assert not reopened.is_segment_done(1)
+    with open(journal_path) as f:
+        assert json.load(f)["segments"][0]["path"] == str(part)
+
+    part.write_text("truncated")
+    assert not reopened.is_segment_done(0)
@@ -0,0 +1,216 @@
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import job_server as jsv
+
+
+@pytest.fixture
+def input_videos(tmp_path: Path) -> List[str]:
+    paths = []
+    for name in ["d.mp4", "c.mp4", "b.mov", "a.mp4"]:
+        path = tmp_path / name
+        path.write_text("dummy")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def mock_merge_videos(monkeypatch: Any) -> List[Dict[str, Any]]:
+    calls: List[Dict[str, Any]] = []
+
+    def mock(
+        input_folder: str,
+        video_files: List[str],
+        output_path: str,
+        cmd_version: Optional[str] = None,
+        progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        calls.append(
+            {
+                "links": [
+                    os.readlink(os.path.join(input_folder, f)) for f in video_files
+                ],
+                "video_files": video_files,
+                "output_path": output_path,
+                "cmd_version": cmd_version,
+            }
+        )
+        if progress_callback:
+            progress_callback({"fraction": 0.5, "speed": 2.0})
+        return {"normalize": 1.5, "encode": 3.0}
+
+    monkeypatch.setattr(main, "merge_videos", mock)
+    return calls
+
+
+def test_parse_job_request(input_videos: List[str], tmp_path: Path) -> None:
+    job = jsv.parse_job_request(
+        {"inputs": input_videos, "layout": "2x2", "profile": "v2"}, str(tmp_path)
+    )
+    assert job.inputs == input_videos
+    assert job.profile == "v2"
+    assert job.output_path == str(tmp_path / f"job_{job.job_id}.mov")
+    assert job.status == "queued"
+
+
+@pytest.mark.parametrize(
+    "payload_update,message",
+    [
+        ({"inputs": "a.mp4"}, "'inputs' must be a list"),
+        ({"layout": "3x3"}, "does not match"),
+        ({"layout": "1x4"}, "Only NxN layouts"),
+        ({"profile": "v9"}, "Invalid profile"),
+        ({"output_path": "out.avi"}, "Unsupported output extension"),
+    ],
+)
+def test_parse_job_request_invalid(
+    input_videos: List[str],
+    tmp_path: Path,
+    payload_update: Dict[str, Any],
+    message: str,
+) -> None:
+    payload: Dict[str, Any] = {"inputs": input_videos}
+    payload.update(payload_update)
+    with pytest.raises(ValueError, match=message):
+        jsv.parse_job_request(payload, str(tmp_path))
+
+
+def test_parse_job_request_missing_input(
+    input_videos: List[str], tmp_path: Path
+) -> None:
+    input_videos[0] = str(tmp_path / "missing.mp4")
+    with pytest.raises(ValueError, match="Input file not found"):
+        jsv.parse_job_request({"inputs": input_videos}, str(tmp_path))
+
+
+def test_run_job_keeps_tile_order(
+    input_videos: List[str], tmp_path: Path, mock_merge_videos: List[Dict[str, Any]]
+) -> None:
+    job_queue = jsv.MergeJobQueue(str(tmp_path))
+    job = jsv.parse_job_request({"inputs": input_videos}, str(tmp_path))
+    job_queue.submit(job)
+    job_queue.run_job(job)
+
+    assert job.status == "succeeded"
+    assert job.progress == 1.0
+    assert job.speed == 2.0
+    assert job.stage_times == {"normalize": 1.5, "encode": 3.0}
+    call = mock_merge_videos[0]
+    assert call["links"] == input_videos
+    assert call["video_files"] == ["0.mp4", "1.mp4", "2.mov", "3.mp4"]
+    assert call["cmd_version"] == main.ffmpeg_cmd_version
+
+
+def test_run_job_failure(
+    input_videos: List[str], tmp_path: Path, monkeypatch: Any
+) -> None:
+    def mock(*args: Any, **kwargs: Any) -> Dict[str, float]:
+        raise RuntimeError("encode failed")
+
+    monkeypatch.setattr(main, "merge_videos", mock)
+    job_queue = jsv.MergeJobQueue(str(tmp_path))
+    job = job_queue.submit(
+        jsv.parse_job_request({"inputs": input_videos}, str(tmp_path))
+    )
+    job_queue.run_job(job)
+
+    assert job.status == "failed"
+    assert job.error == "encode failed"
+    assert 'vgm_jobs_total{status="failed"} 1' in job_queue.render_metrics()
+
+
+def test_finished_jobs_are_pruned(
+    input_videos: List[str], tmp_path: Path, mock_merge_videos: List[Dict[str, Any]]
+) -> None:
+    job_queue = jsv.MergeJobQueue(str(tmp_path), keep_finished=2)
+    jobs = [
+        job_queue.submit(jsv.parse_job_request({"inputs": input_videos}, str(tmp_path)))
+        for _ in range(4)
+    ]
+    for job in jobs[:3]:
+        job_queue.run_job(job)
+
+    # The oldest finished job is dropped, the queued one is kept
+    assert [job["id"] for job in job_queue.snapshot()] == [
+        job.job_id for job in jobs[1:]
+    ]
+    assert job_queue.get(jobs[0].job_id) is None
+    assert 'vgm_jobs_total{status="succeeded"} 3' in job_queue.render_metrics()
+
+
+def test_render_metrics(
+    input_videos: List[str], tmp_path: Path, mock_merge_videos: List[Dict[str, Any]]
+) -> None:
+    job_queue = jsv.MergeJobQueue(str(tmp_path), workers=3)
+    finished = job_queue.submit(
+        jsv.parse_job_request({"inputs": input_videos}, str(tmp_path))
+    )
+    job_queue.run_job(finished)
+    job_queue.submit(jsv.parse_job_request({"inputs": input_videos}, str(tmp_path)))
+
+    metrics = job_queue.render_metrics()
+    assert "vgm_queue_depth 1" in metrics
+    assert "vgm_jobs_in_flight 0" in metrics
+    assert "vgm_workers 3" in metrics
+    assert 'vgm_jobs_total{status="succeeded"} 1' in metrics
+    assert 'vgm_stage_latency_seconds_sum{stage="encode"} 3.0' in metrics
+    assert 'vgm_stage_latency_seconds_count{stage="normalize"} 1' in metrics
+
+
+def test_http_api(
+    input_videos: List[str], tmp_path: Path, mock_merge_videos: List[Dict[str, Any]]
+) -> None:
+    job_queue = jsv.MergeJobQueue(str(tmp_path), workers=2)
+    job_queue.start()
+    server = jsv.create_server("127.0.0.1", 0, job_queue)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        request = urllib.request.Request(
+            f"{base_url}/jobs",
+            data=json.dumps({"inputs": input_videos, "profile": "v2"}).encode(),
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 202
+            job_id = json.load(response)["id"]
+
+        job_queue._queue.join()
+        with urllib.request.urlopen(f"{base_url}/jobs/{job_id}") as response:
+            status = json.load(response)
+        assert status["status"] == "succeeded"
+        assert status["profile"] == "v2"
+
+        with urllib.request.urlopen(f"{base_url}/jobs") as response:
+            assert [job["id"] for job in json.load(response)] == [job_id]
+
+        with urllib.request.urlopen(f"{base_url}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "vgm_jobs_in_flight 0" in response.read().decode()
+
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{base_url}/jobs/unknown")
+        assert e.value.code == 404
+
+        bad_request = urllib.request.Request(
+            f"{base_url}/jobs", data=b"{}", method="POST"
+        )
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(bad_request)
+        assert e.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        job_queue.stop()
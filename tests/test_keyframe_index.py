@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+from typing import Any, List
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import fingerprint as fpr
+from video_grid_merge import keyframe_index as kfi
+
+FFPROBE_OUTPUT = "0.000000,K__\n0.033333,___\n2.000000,K__\n4.000000,K_\n4.0333,__\n"
+
+
+@pytest.fixture
+def ffprobe(monkeypatch: Any) -> List[Any]:
+    calls: List[Any] = []
+
+    def mock_run(argv: List[str], **kwargs: Any) -> Any:
+        calls.append(argv)
+        return subprocess.CompletedProcess(argv, 0, FFPROBE_OUTPUT, "")
+
+    monkeypatch.setattr(subprocess, "run", mock_run)
+    return calls
+
+
+def test_get_keyframes_is_cached(tmp_path: Any, ffprobe: List[Any]) -> None:
+    video = tmp_path / "a.mp4"
+    video.write_text("video")
+    index_dir = str(tmp_path / "index")
+
+    fingerprint = fpr.file_fingerprint(str(video))
+    keyframes = kfi.get_keyframes(str(video), fingerprint, index_dir)
+    assert list(keyframes or []) == [0.0, 2.0, 4.0]
+    index_path = kfi.get_index_path(index_dir, str(video))
+    assert os.path.getsize(index_path) == kfi.INDEX_HEADER.size + 3 * 8
+
+    # the second lookup reads the index without probing the video again
+    again = kfi.get_keyframes(str(video), fingerprint, index_dir)
+    assert list(again or []) == [0.0, 2.0, 4.0]
+    assert len(ffprobe) == 1
+
+    # a changed video is probed again
+    video.write_text("changed video")
+    kfi.get_keyframes(str(video), fpr.file_fingerprint(str(video)), index_dir)
+    assert len(ffprobe) == 2
+
+
+def test_repeat_keyframes() -> None:
+    assert kfi.repeat_keyframes([0.0, 2.0], 3.0, 8.0) == [0.0, 2.0, 3.0, 5.0, 6.0]
+
+
+def test_common_keyframes() -> None:
+    keyframes = [[0.0, 2.0, 4.0, 6.0], [0.0, 3.0, 4.0005, 6.0], [0.0, 4.0, 6.0]]
+    assert kfi.common_keyframes(keyframes) == [0.0, 4.0, 6.0]
+    assert kfi.common_keyframes([[0.0, 2.0], [1.0]]) == []
+    assert kfi.common_keyframes([]) == []
+
+
+def test_get_segment_starts() -> None:
+    keyframes = [0.0, 2.5, 5.0, 7.5, 10.0, 12.5, 15.0]
+    assert kfi.get_segment_starts(keyframes, 17.0, 4.0) == [0.0, 5.0, 10.0, 15.0]
+    # without keyframes within two segments the nominal boundaries are used
+    assert kfi.get_segment_starts([0.0, 30.0], 17.0, 4.0) == [0.0, 4.0, 8.0, 12.0, 16.0]
+
+
+def test_get_output_keyframes(tmp_path: Any, monkeypatch: Any, ffprobe: Any) -> None:
+    (tmp_path / "a.mp4").write_text("video")
+    (tmp_path / "b.png").write_text("image")
+    monkeypatch.setattr(main, "get_video_length_ffmpeg", lambda path: 5.0)
+
+    keyframes = main.get_output_keyframes(str(tmp_path), ["b.png", "a.mp4"], 12.0, 3.0)
+
+    # keyframes of a.mp4 concatenated to 12s, from 3s on
+    assert keyframes == [1.0, 2.0, 4.0, 6.0, 7.0]
+
+
+def test_get_output_keyframes_of_all_tiles(
+    tmp_path: Any, monkeypatch: Any, ffprobe: Any
+) -> None:
+    for name in ["a.mp4", "c.mp4"]:
+        (tmp_path / name).write_text(name)
+    lengths = {"a.mp4": 5.0, "c.mp4": 6.0}
+    monkeypatch.setattr(
+        main, "get_video_length_ffmpeg", lambda path: lengths[os.path.basename(path)]
+    )
+
+    keyframes = main.get_output_keyframes(str(tmp_path), ["a.mp4", "c.mp4"], 12.0, 3.0)
+
+    # a.mp4 loops at 0, 5 and 10s, c.mp4 at 0 and 6s: only 4s and 10s are shared
+    assert keyframes == [1.0, 7.0]
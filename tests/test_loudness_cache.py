@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+from typing import Any, List
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import loudness_cache as lcs
+
+LOUDNORM_LOG = """[Parsed_loudnorm_0 @ 0x1]
+{
+	"input_i" : "-31.20",
+	"input_tp" : "-12.00",
+	"input_lra" : "4.10",
+	"input_thresh" : "-41.50"
+}
+"""
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch: Any) -> List[Any]:
+    calls: List[Any] = []
+
+    def mock_run(argv: List[str], **kwargs: Any) -> Any:
+        calls.append(argv)
+        return subprocess.CompletedProcess(argv, 0, "", LOUDNORM_LOG)
+
+    monkeypatch.setattr(subprocess, "run", mock_run)
+    return calls
+
+
+def test_measure_loudness(ffmpeg: List[Any]) -> None:
+    assert lcs.measure_loudness("a.mp4") == {
+        "input_i": -31.2,
+        "input_tp": -12.0,
+        "input_lra": 4.1,
+    }
+    assert "-vn" in ffmpeg[0]
+
+
+@pytest.mark.parametrize(
+    "input_i,input_tp,expected",
+    [
+        (-31.2, -12.0, 8.2),
+        (-31.2, -4.0, 3.0),  # limited by the true peak ceiling
+        (-10.0, -0.5, -13.0),
+        (-70.0, -50.0, 20.0),
+        (float("-inf"), float("-inf"), 0.0),
+    ],
+)
+def test_get_gain_db(input_i: float, input_tp: float, expected: float) -> None:
+    loudness = {"input_i": input_i, "input_tp": input_tp, "input_lra": 0.0}
+    assert lcs.get_gain_db(loudness, -23.0) == pytest.approx(expected)
+
+
+def test_apply_loudness_balance_uses_cache(
+    tmp_path: Any, monkeypatch: Any, ffmpeg: List[Any]
+) -> None:
+    (tmp_path / "a.mp4").write_text("a")
+    (tmp_path / "b.png").write_text("b")
+    monkeypatch.setattr(main, "loudness_gains", {})
+
+    main.apply_loudness_balance(str(tmp_path), ["a.mp4", "b.png"])
+    assert len(ffmpeg) == 1
+    assert main.loudness_gains == {
+        str(tmp_path / "a.mp4"): pytest.approx(8.2),
+        str(tmp_path / "a_TV.mp4"): pytest.approx(8.2),
+    }
+
+    # a repeat job reads the measurement from the cache
+    main.apply_loudness_balance(str(tmp_path), ["a.mp4", "b.png"])
+    assert len(ffmpeg) == 1
+
+    # until the input changes
+    (tmp_path / "a.mp4").write_text("changed")
+    main.apply_loudness_balance(str(tmp_path), ["a.mp4", "b.png"])
+    assert len(ffmpeg) == 2
+
+
+def test_create_ffmpeg_command_balanced_audio(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (320, 180))
+    monkeypatch.setattr(main, "get_video_fps", lambda f: 25.0)
+    monkeypatch.setattr(main, "loudness_gains", {"a": 8.2, "c": -3.5})
+
+    command = main.create_ffmpeg_command_v1(["a", "b", "c", "d"], "out.mp4", True)
+
+    filter_complex = command[command.index("-filter_complex") + 1]
+    assert "[0:a]volume=8.20dB[a0]; [1:a]volume=1[a1]; [2:a]volume=-3.50dB[a2]" in (
+        filter_complex
+    )
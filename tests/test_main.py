@@ -14,6 +14,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 from video_grid_merge import __main__ as main
+from video_grid_merge import command_runner as crn
+from video_grid_merge import delete_files as dlf
+from video_grid_merge import job_journal as jnl
 
 from .conftest import FFMPEG_CMD_VERSIONS
 
@@ -42,7 +45,7 @@ def test_main_all_versions(
 def test_main_with_non_square_number_of_videos(
     mock_file_operations: Any, monkeypatch: pytest.MonkeyPatch
 ) -> None:
-    def mock_get_video_files(folder: str) -> List[str]:
+    def mock_get_video_files(folder: str, *args: Any) -> List[str]:
         return [
             "video1.mp4",
             "video2.mp4",
@@ -177,7 +180,7 @@ def test_main_with_invalid_version(
 def test_main_with_insufficient_videos(
     mock_file_operations: Any, monkeypatch: pytest.MonkeyPatch
 ) -> None:
-    def mock_get_video_files(folder: str) -> List[str]:
+    def mock_get_video_files(folder: str, *args: Any) -> List[str]:
         return ["video1.mp4", "video2.mp4"]  # 不十分なビデオ数
 
     monkeypatch.setattr(main, "get_video_files", mock_get_video_files)
@@ -242,7 +245,7 @@ def test_main_success_case(capsys: Any, mock_file_operations: Any) -> None:
 
 
 def test_main_error_case(capsys: Any, monkeypatch: Any) -> None:
-    def mock_get_video_files(directory: str) -> List[str]:
+    def mock_get_video_files(directory: str, *args: Any) -> List[str]:
         return []
 
     monkeypatch.setattr(
@@ -271,3 +274,236 @@ def test_main_with_specified_folders(capsys: Any, mock_file_operations: Any) ->
         assert "Video Grid Merge End And Output Success" in captured.out
         assert "File Output Complete: /path/to/output_file.mov" in captured.out
         assert "Processing Time(s): " in captured.out
+
+
+def test_create_target_video_resumes_from_journal(
+    tmp_path: Any, mock_thread_pool: Any, monkeypatch: Any
+) -> None:
+    for name in ["video1.mp4", "video1_TV.mp4", "video2.mp4", "video2_TV.mp4"]:
+        (tmp_path / name).write_text(name)
+    journal = jnl.JobJournal.open(str(tmp_path / "job.journal.json"), {})
+    journal.record_probe(str(tmp_path / "video1.mp4"), 10.0)
+    journal.record_normalized(str(tmp_path / "video1_TV.mp4"))
+    probed: List[str] = []
+
+    def mock_length(path: str) -> float:
+        probed.append(path)
+        return 20.0
+
+    monkeypatch.setattr(main, "get_video_length_ffmpeg", mock_length)
+
+    max_length = main.create_target_video(
+        str(tmp_path), ["video1.mp4", "video2.mp4"], journal
+    )
+
+    assert max_length == 20.0
+    assert probed == [str(tmp_path / "video2.mp4")]
+    # video1 was normalized before the interruption, video2 is redone from scratch
+    assert [task[1][1] for task in mock_thread_pool.submitted_tasks] == ["video2.mp4"]
+    assert not (tmp_path / "video2_TV.mp4").exists()
+    assert journal.get_probe(str(tmp_path / "video2.mp4")) == 20.0
+
+
+def test_create_target_video_shares_duplicate_inputs(
+    tmp_path: Any, monkeypatch: Any
+) -> None:
+    (tmp_path / "a.mp4").write_text("feed")
+    os.symlink(tmp_path / "a.mp4", tmp_path / "b.mp4")
+    (tmp_path / "c.mp4").write_text("other")
+    lengths = {"a.mp4": 10.0, "b.mp4": 10.0, "c.mp4": 20.0}
+    processed: List[str] = []
+
+    def mock_process_video(
+        input_folder: str, file: str, max_length: float, length: float
+    ) -> None:
+        processed.append(file)
+        with open(main.get_target_video_path(input_folder, file), "w") as f:
+            f.write(file)
+
+    monkeypatch.setattr(
+        main, "get_video_length_ffmpeg", lambda path: lengths[os.path.basename(path)]
+    )
+    monkeypatch.setattr(main, "process_video", mock_process_video)
+
+    assert main.create_target_video(str(tmp_path), ["a.mp4", "b.mp4", "c.mp4"]) == 20.0
+    assert sorted(processed) == ["a.mp4", "c.mp4"]
+    assert os.path.samefile(tmp_path / "a_TV.mp4", tmp_path / "b_TV.mp4")
+
+
+def test_create_target_video_image(tmp_path: Any, monkeypatch: Any) -> None:
+    (tmp_path / "a.mp4").write_text("video")
+    (tmp_path / "b.png").write_text("image")
+    probed: List[str] = []
+
+    def mock_get_video_length_ffmpeg(path: str) -> float:
+        probed.append(os.path.basename(path))
+        return 10.0
+
+    monkeypatch.setattr(main, "get_video_length_ffmpeg", mock_get_video_length_ffmpeg)
+
+    assert main.create_target_video(str(tmp_path), ["a.mp4", "b.png"]) == 10.0
+    assert probed == ["a.mp4"]
+    assert os.path.samefile(tmp_path / "b.png", tmp_path / "b_TV.png")
+    assert main.get_target_files(str(tmp_path), sorted(os.listdir(tmp_path))) == [
+        str(tmp_path / "a_TV.mp4"),
+        str(tmp_path / "b_TV.png"),
+    ]
+
+
+def test_create_target_video_end(tmp_path: Any, monkeypatch: Any) -> None:
+    lengths = {"a.mp4": 4.0, "b.mp4": 30.0}
+    calls: List[Any] = []
+
+    def mock_process_video(
+        input_folder: str, file: str, max_length: float, length: float
+    ) -> None:
+        calls.append((file, max_length, length))
+
+    monkeypatch.setattr(
+        main, "get_video_length_ffmpeg", lambda path: lengths[os.path.basename(path)]
+    )
+    monkeypatch.setattr(main, "process_video", mock_process_video)
+
+    assert main.create_target_video(str(tmp_path), ["a.mp4", "b.mp4"], end=10.0) == 10.0
+    assert sorted(calls) == [("a.mp4", 10.0, 4.0), ("b.mp4", 10.0, 30.0)]
+    assert main.get_loop_count(4.0, 10.0) == 3
+
+
+def test_encode_segments_skips_finished_segments(
+    tmp_path: Any, monkeypatch: Any
+) -> None:
+    output_path = str(tmp_path / "out.mov")
+    journal = jnl.JobJournal.open(jnl.get_journal_path(output_path), {})
+    monkeypatch.setattr(main, "resume_segment_seconds", 60.0)
+    journal.plan_segments(150.0, 60.0)
+    finished = tmp_path / "out.part0000.mov"
+    finished.write_text("segment 0")
+    journal.record_segment(0, str(finished))
+
+    ranges: List[Any] = []
+
+    def mock_create_ffmpeg_command(*args: Any, **kwargs: Any) -> List[str]:
+        ranges.append((kwargs["start"], kwargs["duration"]))
+        return ["ffmpeg", args[1]]
+
+    def mock_run_ffmpeg_command(command: List[str], *args: Any) -> int:
+        with open(command[1], "w") as f:
+            f.write(" ".join(command))
+        return 0
+
+    def mock_run_command(command: List[str], **kwargs: Any) -> int:
+        return 0
+
+    monkeypatch.setattr(main, "create_ffmpeg_command", mock_create_ffmpeg_command)
+    monkeypatch.setattr(main, "run_ffmpeg_command", mock_run_ffmpeg_command)
+    monkeypatch.setattr(crn, "run_command", mock_run_command)
+
+    main.encode_segments(["a_TV.mp4"], output_path, 150.0, journal)
+
+    assert ranges == [(60.0, 60.0), (120.0, 30.0)]
+    assert not os.path.exists(jnl.get_journal_path(output_path))
+    assert sorted(os.listdir(tmp_path)) == []
+
+
+def test_encode_segments_failure_keeps_journal(tmp_path: Any, monkeypatch: Any) -> None:
+    output_path = str(tmp_path / "out.mov")
+    journal = jnl.JobJournal.open(jnl.get_journal_path(output_path), {})
+    monkeypatch.setattr(main, "create_ffmpeg_command", lambda *a, **k: ["ffmpeg"])
+    monkeypatch.setattr(main, "run_ffmpeg_command", lambda *args: 1)
+
+    with pytest.raises(RuntimeError, match="failed to encode segment 0"):
+        main.encode_segments(["a_TV.mp4"], output_path, 30.0, journal)
+    assert os.path.exists(jnl.get_journal_path(output_path))
+
+
+@pytest.mark.parametrize("deadline,segment_seconds", [(None, 60.0), (300.0, 10.0)])
+def test_merge_videos_journal_segment_seconds(
+    tmp_path: Any,
+    monkeypatch: Any,
+    deadline: Optional[float],
+    segment_seconds: float,
+) -> None:
+    (tmp_path / "a_TV.mp4").write_bytes(b"a")
+    calls: List[Any] = []
+
+    def mock_encode_segments(*args: Any) -> None:
+        calls.append((args[3].settings["segment_seconds"], args[-1]))
+
+    monkeypatch.setattr(main, "resume_segment_seconds", 60.0)
+    monkeypatch.setattr(main, "deadline_segment_seconds", 10.0)
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 30.0)
+    monkeypatch.setattr(main, "get_run_parameters", lambda *args: None)
+    monkeypatch.setattr(main, "get_output_keyframes", lambda *args: None)
+    monkeypatch.setattr(main, "encode_segments", mock_encode_segments)
+    monkeypatch.setattr(dlf, "delete_files_in_folder", lambda *args: [])
+
+    main.merge_videos(
+        str(tmp_path),
+        ["a.mp4"],
+        str(tmp_path / "out.mov"),
+        resume=True,
+        deadline=deadline,
+    )
+
+    # The journal records the segment length the segments are planned with
+    assert calls == [(segment_seconds, segment_seconds)]
+
+
+def test_main_preview(
+    tmp_path: Any, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls = []
+
+    def mock_create_proxy_command(
+        files: List[str], path: str, start: Optional[float]
+    ) -> List[str]:
+        calls.append((files, path))
+        return ["ffmpeg", path]
+
+    monkeypatch.setattr(
+        main, "get_video_files", lambda *args: ["d.mp4", "b.mp4", "c.mp4", "a.mp4"]
+    )
+    monkeypatch.setattr(
+        main, "create_target_video", lambda *args: pytest.fail("target videos")
+    )
+    monkeypatch.setattr(main, "create_proxy_command", mock_create_proxy_command)
+    monkeypatch.setattr(main, "run_ffmpeg_command", lambda command: 0)
+
+    main.main("/in", str(tmp_path), output_file="grid.mp4", preview=True)
+
+    proxy_path = str(tmp_path / "grid_proxy.mp4")
+    assert calls == [([f"/in/{name}.mp4" for name in "abcd"], proxy_path)]
+    assert f"File Output Complete: {proxy_path}" in capsys.readouterr().out
+    assert main.parse_args(["--preview"]).preview
+
+
+def test_merge_proxy_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "create_proxy_command", lambda *args: ["ffmpeg"])
+    monkeypatch.setattr(main, "run_ffmpeg_command", lambda command: 1)
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed to render the proxy"):
+        main.merge_proxy("/in", ["a.mp4", "b.mp4", "c.mp4", "d.mp4"], "p.mp4")
+
+
+def test_parse_args() -> None:
+    args = main.parse_args(["--resume", "--input-folder", "/in"])
+    assert args.resume
+    assert args.input_folder == "/in"
+    assert args.output_folder is None
+    assert not main.parse_args([]).resume
+    assert main.parse_args(["--deadline", "600"]).deadline == 600.0
+    assert main.parse_args(["--speed", "1.5"]).speed == 1.5
+    assert main.parse_args(["--encoder", "libx265"]).encoder == "libx265"
+    args = main.parse_args(["--start", "600", "--end", "900"])
+    assert (args.start, args.end) == (600.0, 900.0)
+    assert main.parse_args(["--audio", "single"]).audio == "single"
+    with pytest.raises(SystemExit):
+        main.parse_args(["--deadline", "600", "--speed", "1.5"])
+
+
+def test_show_stats(capsys: Any) -> None:
+    assert main.parse_args(["stats"]).command == "stats"
+    assert main.parse_args([]).command == "merge"
+
+    main.show_stats()
+    assert "No runs recorded." in capsys.readouterr().out
@@ -0,0 +1,138 @@
+import os
+import sys
+from typing import Any, Dict
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import memory_budget as mbg
+
+MiB = mbg.MiB
+
+
+@pytest.fixture
+def grid() -> Dict[str, Any]:
+    # 10x10 grid of 1080p tiles on a 16 core machine
+    return {
+        "inputs": [{"width": 1920, "height": 1080, "pix_fmt": "yuv420p"}] * 100,
+        "output": {
+            "width": 19200,
+            "height": 10800,
+            "tile_width": 1920,
+            "tile_height": 1080,
+        },
+        "options": {"cores": 16, "preset": "medium"},
+    }
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("1024", 1024),
+        ("512M", 512 * MiB),
+        ("8G", 8 * 1024 * MiB),
+        ("1.5GiB", 1536 * MiB),
+    ],
+)
+def test_parse_memory_size(text: str, expected: int) -> None:
+    assert mbg.parse_memory_size(text) == expected
+
+
+def test_parse_memory_size_invalid() -> None:
+    with pytest.raises(ValueError, match="Invalid memory size"):
+        mbg.parse_memory_size("lots")
+
+
+def test_estimate_peak_memory(grid: Dict[str, Any]) -> None:
+    frame = 1920 * 1080 * 1.5
+    output_frame = 19200 * 10800 * 1.5
+    expected = (
+        64 * MiB
+        + 100 * (4 * MiB + frame * (6 + 16) + frame * 0.05 * 8)
+        + 100 * frame * 3
+        + output_frame * (40 + 3 + 16)
+    )
+    predicted = mbg.estimate_peak_memory(
+        grid["inputs"], grid["output"], grid["options"]
+    )
+    assert predicted == int(expected)
+
+    ten_bit = [dict(entry, pix_fmt="yuv420p10le") for entry in grid["inputs"]]
+    ten_bit_predicted = mbg.estimate_peak_memory(
+        ten_bit, grid["output"], grid["options"]
+    )
+    assert ten_bit_predicted > predicted
+
+
+def test_fit_memory_budget(grid: Dict[str, Any]) -> None:
+    unlimited = mbg.estimate_peak_memory(
+        grid["inputs"], grid["output"], grid["options"]
+    )
+    options, output, predicted, applied = mbg.fit_memory_budget(
+        grid["inputs"], grid["output"], grid["options"], unlimited - 1
+    )
+    assert applied == ["decoder_threads 1"]
+    assert options["decoder_threads"] == 1
+    assert output == grid["output"]
+    assert predicted < unlimited
+
+    options, output, predicted, applied = mbg.fit_memory_budget(
+        grid["inputs"], grid["output"], grid["options"], 4096 * MiB
+    )
+    assert applied[-1] == "output 1920x1080"
+    assert options["rc_lookahead"] == 0
+    assert options["encoder_threads"] == 1
+    assert (output["width"], output["height"]) == (1920, 1080)
+    assert predicted <= 4096 * MiB
+
+
+def test_fit_memory_budget_settings(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: (1920, 1080))
+    monkeypatch.setattr(main, "probe_video", lambda f: {"pix_fmt": "yuv420p"})
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    for name in ["decoder_threads", "input_thread_queue_size", "encoder_threads"]:
+        monkeypatch.setattr(main, name, 0)
+    monkeypatch.setattr(main, "encoder_rc_lookahead", None)
+    monkeypatch.setattr(main, "match_input_resolution_flag", True)
+
+    input_files = [f"tile{i}.mp4" for i in range(16)]
+    settings, predicted = main.fit_memory_budget(input_files, 2048 * MiB, "v2")
+
+    assert predicted <= 2048 * MiB
+    assert settings["decoder_threads"] == 1
+    assert "match_input_resolution_flag" not in settings
+    # Nothing is changed until the settings are applied
+    assert main.decoder_threads == 0
+    with main.module_settings(settings):
+        assert main.build_input_options(["a.mp4"]) == [
+            "-threads",
+            "1",
+            "-thread_queue_size",
+            "2",
+            "-i",
+            "a.mp4",
+        ]
+        encoder_options = main.build_encoder_options("v2", 30.0)
+        index = encoder_options.index("-rc-lookahead")
+        assert encoder_options[index : index + 4] == [
+            "-rc-lookahead",
+            "10",
+            "-crf",
+            "23",
+        ]
+        assert main.match_input_resolution_flag
+    assert main.build_input_options(["a.mp4"]) == ["-i", "a.mp4"]
+    assert main.encoder_rc_lookahead is None
+
+
+def test_get_memory_model_without_size(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "get_video_size", lambda f: None)
+    monkeypatch.setattr(main, "probe_video", lambda f: {})
+
+    inputs, output, options = main.get_memory_model(["a.mp4", "b.mp4"] * 2, "v1")
+
+    assert (inputs[0]["width"], inputs[0]["height"]) == (0, 0)
+    assert (output["width"], output["height"]) == (0, 0)
+    assert mbg.estimate_peak_memory(inputs, output, options) > 0
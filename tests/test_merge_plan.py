@@ -0,0 +1,276 @@
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import command_runner as crn
+from video_grid_merge import run_history as rhs
+
+LENGTHS = {"b.mp4": 10.0, "a.mp4": 4.0, "c.mov": 3.0, "a_b.mp4": 10.0}
+
+
+@pytest.fixture
+def mock_probes(monkeypatch: Any, tmp_path: Path) -> Path:
+    for name in LENGTHS:
+        (tmp_path / name).write_bytes(b"x" * 1000)
+
+    def mock_length(path: str) -> Optional[float]:
+        return LENGTHS.get(os.path.basename(path))
+
+    def mock_size(path: str) -> Tuple[int, int]:
+        return (640, 360)
+
+    def mock_fps(path: str) -> float:
+        return 30.0
+
+    def mock_probe_video(path: str) -> Dict[str, Any]:
+        return {"video_codec": "h264", "pix_fmt": "yuv420p", "audio_codec": "aac"}
+
+    monkeypatch.setattr(main, "get_video_length_ffmpeg", mock_length)
+    monkeypatch.setattr(main, "get_video_size", mock_size)
+    monkeypatch.setattr(main, "get_video_fps", mock_fps)
+    monkeypatch.setattr(main, "probe_video", mock_probe_video)
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "6.1")
+    monkeypatch.setattr(main, "ffmpeg_cmd_version", "v1")
+    monkeypatch.setattr(main, "match_input_resolution_flag", True)
+    return tmp_path
+
+
+def test_get_loop_count() -> None:
+    assert main.get_loop_count(10.0, 10.0) == 1
+    assert main.get_loop_count(5.0, 10.0) == 2
+    assert main.get_loop_count(3.0, 10.0) == 4
+    assert main.get_loop_count(12.0, 10.0) == 1
+    assert main.get_loop_count(None, 10.0) == 0
+
+
+def test_create_merge_plan(mock_probes: Path) -> None:
+    folder = str(mock_probes)
+    output_path = str(mock_probes / "out.mov")
+    plan = main.create_merge_plan(folder, list(LENGTHS), output_path)
+
+    # Tiles follow the alphabetical order of the target video names
+    assert [entry["file"] for entry in plan["inputs"]] == [
+        "a.mp4",
+        "a_b.mp4",
+        "b.mp4",
+        "c.mov",
+    ]
+    assert plan["max_length"] == 10.0
+    by_file = {entry["file"]: entry for entry in plan["inputs"]}
+    assert by_file["b.mp4"]["action"] == "link"
+    assert by_file["b.mp4"]["loop_count"] == 1
+    assert by_file["a.mp4"]["action"] == "concat"
+    assert by_file["a.mp4"]["loop_count"] == 3
+    assert by_file["c.mov"]["loop_count"] == 4
+    assert by_file["a.mp4"]["estimated_target_bytes"] == 2500
+    assert by_file["c.mov"]["pix_fmt"] == "yuv420p"
+
+    argv = plan["argv"]
+    assert argv[0] == "ffmpeg"
+    assert argv[-1] == output_path
+    assert [argv[i + 1] for i, arg in enumerate(argv) if arg == "-i"] == [
+        entry["target_file"] for entry in plan["inputs"]
+    ]
+    assert plan["filter_complex"] == argv[argv.index("-filter_complex") + 1]
+    assert "vstack=inputs=2" in plan["filter_complex"]
+    assert plan["output"] == {
+        "path": output_path,
+        "width": 1280,
+        "height": 720,
+        "fps": 30.0,
+        "pix_fmt": "yuv420p",
+    }
+    assert not any(entry["convert_pix_fmt"] for entry in plan["inputs"])
+    assert "format=" not in plan["filter_complex"]
+    assert plan["estimates"]["intermediate_bytes"] == 2500 + int(1000 * 10.0 / 3.0)
+    assert plan["estimates"]["encoded_frames"] == 300
+    assert plan["estimates"]["encoded_pixels"] == 1280 * 720 * 300
+    assert plan["estimates"]["decoded_pixels"] == 4 * 640 * 360 * 300
+    assert plan["estimates"]["encode_seconds"] is None
+    assert plan["estimates"]["peak_memory_bytes"] > 0
+    json.dumps(plan)
+
+
+def test_create_merge_plan_time_range(mock_probes: Path) -> None:
+    plan = main.create_merge_plan(
+        str(mock_probes), list(LENGTHS), str(mock_probes / "o.mov"), start=2.0, end=8.0
+    )
+
+    # Target videos end at 8s and every tile is read from 2s to 8s
+    assert plan["max_length"] == 8.0
+    by_file = {entry["file"]: entry for entry in plan["inputs"]}
+    assert by_file["b.mp4"]["action"] == "link"
+    assert by_file["a.mp4"]["loop_count"] == 2
+    argv = plan["argv"]
+    assert argv[argv.index("-i") - 4 : argv.index("-i")] == ["-ss", "2.0", "-t", "6.0"]
+    assert argv.count("-ss") == 4
+    assert plan["estimates"]["encoded_frames"] == 180
+
+
+def test_create_merge_plan_predicts_encode_time(mock_probes: Path) -> None:
+    run = main.get_run_parameters([str(mock_probes / "b.mp4")] * 4, 20.0, "v1")
+    rhs.record_run(main.run_history_path, {**run, "encode_seconds": 8.0})
+
+    plan = main.create_merge_plan(
+        str(mock_probes), list(LENGTHS), str(mock_probes / "o.mov")
+    )
+
+    # Half the duration of the recorded run with the same grid
+    assert plan["estimates"]["encode_seconds"] == pytest.approx(4.0)
+
+
+def test_execute_merge_plan(mock_probes: Path, monkeypatch: Any) -> None:
+    folder = str(mock_probes)
+    plan = main.create_merge_plan(folder, list(LENGTHS), str(mock_probes / "o.mov"))
+
+    def fail_probe(path: str) -> None:
+        raise AssertionError("a saved plan must not probe again")
+
+    processed: List[Tuple[Any, ...]] = []
+    commands: List[Any] = []
+
+    def mock_run_command(argv: List[str], **kwargs: Any) -> int:
+        commands.append(argv)
+        return 0
+
+    monkeypatch.setattr(main, "get_video_length_ffmpeg", fail_probe)
+    monkeypatch.setattr(main, "process_video", lambda *args: processed.append(args))
+    monkeypatch.setattr(crn, "run_command", mock_run_command)
+
+    stage_times = main.execute_merge_plan(json.loads(json.dumps(plan)))
+
+    assert set(stage_times) == {"normalize", "encode"}
+    assert sorted(processed) == sorted(
+        (folder, file, 10.0, length) for file, length in LENGTHS.items()
+    )
+    assert commands == [plan["argv"]]
+
+
+def test_execute_merge_plan_failure(mock_probes: Path, monkeypatch: Any) -> None:
+    plan = main.create_merge_plan(
+        str(mock_probes), list(LENGTHS), str(mock_probes / "o.mov")
+    )
+    monkeypatch.setattr(main, "process_video", lambda *args: None)
+    monkeypatch.setattr(crn, "run_command", lambda argv, **kwargs: 1)
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed to encode the grid"):
+        main.execute_merge_plan(plan)
+
+
+def test_execute_merge_plan_changed_input(mock_probes: Path) -> None:
+    plan = main.create_merge_plan(
+        str(mock_probes), list(LENGTHS), str(mock_probes / "o.mov")
+    )
+    (mock_probes / "a.mp4").write_bytes(b"re-recorded")
+    with pytest.raises(ValueError, match="Input video changed"):
+        main.execute_merge_plan(plan)
+
+
+def test_save_merge_plan(tmp_path: Path, capsys: Any) -> None:
+    plan = {"argv": ["ffmpeg"], "output": {"path": "o.mov"}}
+    main.save_merge_plan(plan, "-")
+    assert json.loads(capsys.readouterr().out) == plan
+
+    plan_path = tmp_path / "plan.json"
+    main.save_merge_plan(plan, str(plan_path))
+    assert json.loads(plan_path.read_text()) == plan
+
+
+def test_main_plan_mode(mock_file_operations: Any, monkeypatch: Any) -> None:
+    saved: List[Any] = []
+    monkeypatch.setattr(
+        main, "create_merge_plan", lambda *args, **kwargs: {"output_path": args[2]}
+    )
+    monkeypatch.setattr(
+        main, "save_merge_plan", lambda plan, path: saved.append((plan, path))
+    )
+    monkeypatch.setattr(
+        main, "merge_videos", lambda *args, **kwargs: pytest.fail("must not encode")
+    )
+
+    main.main("in", "out", output_file="grid", plan_path="-")
+
+    assert saved == [({"output_path": os.path.join("out", "grid.mov")}, "-")]
+
+
+def test_get_merge_recipe(mock_probes: Path, monkeypatch: Any) -> None:
+    folder = str(mock_probes)
+    recipe = main.get_merge_recipe(folder, list(LENGTHS), str(mock_probes / "o.mov"))
+
+    assert len(recipe["inputs"]) == 4
+    assert "tile0" in recipe["argv"] and "output.mov" in recipe["argv"]
+    assert not any(folder in arg for arg in recipe["argv"])
+    assert recipe == main.get_merge_recipe(
+        folder, list(LENGTHS), str(mock_probes / "other" / "p.mov")
+    )
+
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "7.0")
+    assert recipe != main.get_merge_recipe(
+        folder, list(LENGTHS), str(mock_probes / "o.mov")
+    )
+
+
+def test_merge_videos_result_cache(mock_probes: Path, monkeypatch: Any) -> None:
+    encodes: List[str] = []
+
+    def mock_encode_grid(
+        input_files: List[str], output_path: str, *args: Any, **kwargs: Any
+    ) -> int:
+        encodes.append(output_path)
+        with open(output_path, "wb") as f:
+            f.write(b"grid")
+        return 0
+
+    monkeypatch.setattr(main, "use_result_cache", True)
+    monkeypatch.setattr(main, "record_run_history", False)
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 10.0)
+    monkeypatch.setattr(main, "encode_grid", mock_encode_grid)
+    folder = str(mock_probes)
+
+    stage_times = main.merge_videos(folder, list(LENGTHS), str(mock_probes / "o.mov"))
+    assert set(stage_times) == {"cache", "normalize", "encode"}
+
+    stage_times = main.merge_videos(folder, list(LENGTHS), str(mock_probes / "p.mov"))
+    assert set(stage_times) == {"cache"}
+    assert encodes == [str(mock_probes / "o.mov")]
+    assert (mock_probes / "p.mov").read_bytes() == b"grid"
+
+
+def test_result_cache_survives_reused_output_path(
+    mock_probes: Path, monkeypatch: Any
+) -> None:
+    encodes: List[Optional[str]] = []
+
+    def mock_encode_grid(
+        input_files: List[str], output_path: str, *args: Any, **kwargs: Any
+    ) -> int:
+        encodes.append(main.get_ffmpeg_version())
+        # Written in place, like ffmpeg -y
+        with open(output_path, "wb") as f:
+            f.write(f"grid {main.get_ffmpeg_version()}".encode())
+        return 0
+
+    monkeypatch.setattr(main, "use_result_cache", True)
+    monkeypatch.setattr(main, "record_run_history", False)
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 10.0)
+    monkeypatch.setattr(main, "encode_grid", mock_encode_grid)
+    folder = str(mock_probes)
+    output_path = mock_probes / "o.mov"
+
+    main.merge_videos(folder, list(LENGTHS), str(output_path))
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "7.0")
+    main.merge_videos(folder, list(LENGTHS), str(output_path))
+    assert output_path.read_bytes() == b"grid 7.0"
+
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "6.1")
+    stage_times = main.merge_videos(folder, list(LENGTHS), str(output_path))
+    assert set(stage_times) == {"cache"}
+    assert encodes == ["6.1", "7.0"]
+    assert output_path.read_bytes() == b"grid 6.1"
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import memory_budget as mbg
+from video_grid_merge import prefetch as pft
+
+MiB = pft.MiB
+
+
+def wait_for(predicate: Any, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_get_window_bytes(monkeypatch: Any) -> None:
+    monkeypatch.setattr(mbg, "get_available_memory", lambda: 400 * MiB)
+    assert pft.get_window_bytes(4, 64 * MiB) == 25 * MiB
+    assert pft.get_window_bytes(4, 8 * MiB) == 8 * MiB
+    monkeypatch.setattr(mbg, "get_available_memory", lambda: None)
+    assert pft.get_window_bytes(4, 64 * MiB) == 64 * MiB
+    assert pft.get_window_bytes(4, 0) == pft.READ_SIZE
+
+
+def test_prefetcher_follows_position(tmp_path: Path, monkeypatch: Any) -> None:
+    monkeypatch.setattr(mbg, "get_available_memory", lambda: None)
+    paths = []
+    for name in ["a_TV.mp4", "b_TV.mp4"]:
+        path = tmp_path / name
+        path.write_bytes(b"x" * 4 * MiB)
+        paths.append(str(path))
+
+    with pft.Prefetcher(
+        paths + [paths[0]], lambda path: 10.0, 1 * MiB, MiB // 2, workers=2
+    ) as prefetcher:
+        # Only the window ahead of the start is read
+        assert wait_for(lambda: prefetcher.prefetched_bytes == 2 * MiB)
+        time.sleep(0.05)
+        assert prefetcher.prefetched_bytes == 2 * MiB
+
+        # Halfway through, the window ahead of the middle is read and the part
+        # ffmpeg has already read is skipped
+        prefetcher.update(5.0)
+        assert wait_for(lambda: prefetcher.prefetched_bytes == 4 * MiB)
+        assert prefetcher.get_read_offset(0) == 2 * MiB
+        assert prefetcher.next_chunk() is None
+
+
+def test_encode_grid_prefetches_inputs(monkeypatch: Any) -> None:
+    updates: List[float] = []
+    reports: List[Dict[str, float]] = []
+
+    class MockPrefetcher:
+        def __init__(self, paths: List[str], *args: Any, **kwargs: Any) -> None:
+            assert paths == ["a_TV.mp4", "b_TV.mp4", "a_TV.mp4"]
+
+        def __enter__(self) -> "MockPrefetcher":
+            return self
+
+        def __exit__(self, *args: Any) -> None:
+            pass
+
+        def update(self, position: float) -> None:
+            updates.append(position)
+
+    def mock_run(command: List[str], duration: Optional[float], callback: Any) -> int:
+        callback({"out_time": 2.0})
+        return 0
+
+    monkeypatch.setattr(main, "prefetch_inputs", True)
+    monkeypatch.setattr(pft, "Prefetcher", MockPrefetcher)
+    monkeypatch.setattr(
+        main, "create_ffmpeg_command", lambda *args, **kwargs: ["ffmpeg"]
+    )
+    monkeypatch.setattr(main, "run_ffmpeg_command", mock_run)
+
+    main.encode_grid(
+        ["a_TV.mp4", "b_TV.mp4", "c_TV.png", "a_TV.mp4"],
+        "out.mp4",
+        10.0,
+        start=3.0,
+        progress_callback=reports.append,
+    )
+
+    assert updates == [5.0]
+    assert reports == [{"out_time": 2.0}]
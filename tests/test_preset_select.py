@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+from typing import Any, List, Optional
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import __main__ as main
+from video_grid_merge import command_runner as crn
+from video_grid_merge import job_journal as jnl
+from video_grid_merge import preset_select as psl
+
+
+@pytest.fixture
+def clock(monkeypatch: Any) -> List[float]:
+    now = [1000.0]
+    # The clock of preset_select and __main__ alike
+    monkeypatch.setattr(time, "perf_counter", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize(
+    "budget,expected",
+    [(1000.0, "veryslow"), (45.0, "fast"), (11.5, "ultrafast"), (1.0, "ultrafast")],
+)
+def test_select_preset(clock: List[float], budget: float, expected: str) -> None:
+    # encode time of the whole job with each preset
+    seconds = {p: 10.0 / psl.X264_RELATIVE_SPEED[p] for p in psl.X264_PRESETS}
+    estimated: List[str] = []
+
+    def estimate(preset: str) -> Optional[float]:
+        estimated.append(preset)
+        return seconds[preset]
+
+    assert psl.select_preset(estimate, clock[0] + budget) == expected
+    assert len(estimated) <= 4
+
+
+def test_select_preset_counts_estimate_time(clock: List[float]) -> None:
+    def estimate(preset: str) -> Optional[float]:
+        clock[0] += 30.0  # e.g. a calibration encode
+        return None if preset == "veryslow" else 10.0
+
+    # after three estimates only 10s of the 100s budget are left
+    assert psl.select_preset(estimate, clock[0] + 100.0) == "slow"
+
+
+def test_select_preset_with_budget(clock: List[float]) -> None:
+    def estimate(preset: str) -> Optional[float]:
+        clock[0] += 30.0  # e.g. a calibration encode
+        return None if preset == "veryslow" else 10.0
+
+    # a fixed budget is not charged for the estimates
+    assert psl.select_preset(estimate, None, budget_seconds=100.0) == "slower"
+
+
+def test_preset_controller_keeps_preset_on_schedule(clock: List[float]) -> None:
+    controller = psl.PresetController("slow", 100.0, clock[0] + 100.0)
+    clock[0] += 5.0
+    controller.update(10.0, 5.0)
+    assert controller.preset == "slow"
+    assert controller.profile_name("v2") == "v2:slow"
+
+
+def test_preset_controller_falls_back(clock: List[float]) -> None:
+    controller = psl.PresetController("slow", 100.0, clock[0] + 100.0)
+    # the first 10s took 40s: the remaining 90s need 90 / 60 * 1.1 = 1.65x
+    clock[0] += 40.0
+    controller.update(10.0, 40.0)
+    # 0.25x * 0.62 / 0.14 = 1.1x is not enough, superfast is the last step
+    assert controller.preset == "ultrafast"
+
+    controller = psl.PresetController("slow", 100.0, clock[0] + 100.0)
+    # 0.83x is too slow for 1.13x, medium is predicted at 0.83x * 0.22 / 0.14 = 1.31x
+    clock[0] += 12.0
+    controller.update(10.0, 12.0)
+    assert controller.preset == "medium"
+    assert controller.presets_used == ["slow", "medium"]
+    assert controller.profile_name("v2") == "v2:mixed"
+
+
+def test_preset_controller_with_x265_speeds(clock: List[float]) -> None:
+    controller = psl.PresetController(
+        "slow",
+        100.0,
+        clock[0] + 100.0,
+        psl.ENCODER_PRESETS["libx265"],
+        relative_speed=psl.ENCODER_RELATIVE_SPEED["libx265"],
+    )
+    # 0.83x is too slow for 1.13x; x265 medium is predicted at 0.83x * 0.25 / 0.09
+    clock[0] += 12.0
+    controller.update(10.0, 12.0)
+    assert controller.preset == "medium"
+
+
+def test_select_encoder_preset_x265(monkeypatch: Any, clock: List[float]) -> None:
+    calibrated: List[str] = []
+
+    def mock_calibrate(
+        input_files: List[str], max_length: float, preset: str, *args: Any
+    ) -> Optional[float]:
+        calibrated.append(preset)
+        clock[0] += 20.0
+        return 100.0 * psl.X265_RELATIVE_SPEED[preset]
+
+    monkeypatch.setattr(main, "video_encoder", "libx265")
+    monkeypatch.setattr(main, "calibrate_encode_speed", mock_calibrate)
+    monkeypatch.setattr(main, "predict_encode_time", lambda run: None)
+
+    controller = main.select_encoder_preset(
+        ["a_TV.mp4"], 100.0, None, "v2", {"profile": "v2-x265"}, target_speed=4.0
+    )
+
+    # 25s per encode: medium (4s) and slow (11.1s) fit, slower (33.3s) does not
+    assert controller.preset == "slow"
+    assert controller.relative_speed is psl.X265_RELATIVE_SPEED
+    # The speed target is measured from the end of the calibrations
+    assert controller.deadline_at == clock[0] + 25.0
+    assert controller.profile_name(main.get_run_profile("v2")) == "v2-x265:slow"
+    monkeypatch.setattr(main, "encoder_rc_lookahead", 10)
+    assert main.build_encoder_options("v2", 30.0, "slow")[:9] == [
+        "-c:v",
+        "libx265",
+        "-preset",
+        "slow",
+        "-x265-params",
+        "log-level=error:rc-lookahead=10",
+        "-tag:v",
+        "hvc1",
+        "-crf",
+    ]
+
+
+def test_encode_segments_with_preset_controller(
+    tmp_path: Any, monkeypatch: Any, clock: List[float]
+) -> None:
+    output_path = str(tmp_path / "out.mov")
+    journal = jnl.JobJournal.open(jnl.get_journal_path(output_path), {})
+    monkeypatch.setattr(main, "deadline_segment_seconds", 10.0)
+    controller = psl.PresetController("slow", 30.0, clock[0] + 30.0)
+    presets: List[Any] = []
+
+    def mock_create_ffmpeg_command(*args: Any, **kwargs: Any) -> List[str]:
+        presets.append((args[1], kwargs["preset"]))
+        return ["ffmpeg", args[1]]
+
+    def mock_run_ffmpeg_command(command: List[str], *args: Any) -> int:
+        clock[0] += 15.0  # every segment runs at 0.67x
+        with open(command[1], "w") as f:
+            f.write(" ".join(command))
+        return 0
+
+    def mock_run_command(command: List[str], **kwargs: Any) -> int:
+        return 0
+
+    monkeypatch.setattr(main, "create_ffmpeg_command", mock_create_ffmpeg_command)
+    monkeypatch.setattr(main, "run_ffmpeg_command", mock_run_ffmpeg_command)
+    monkeypatch.setattr(crn, "run_command", mock_run_command)
+
+    main.encode_segments(
+        ["a_TV.mp4"], output_path, 30.0, journal, "v2", None, controller
+    )
+
+    assert [os.path.basename(path) for path, _ in presets] == [
+        "out.part0000.ts",
+        "out.part0001.ts",
+        "out.part0002.ts",
+    ]
+    assert presets[0][1] == "slow"
+    assert presets[1][1] != "slow"
+    assert controller.profile_name("v2") == "v2:mixed"
+
+
+@pytest.mark.parametrize("deadline,target_speed", [(600.0, None), (None, 1.5)])
+def test_preset_control_rejects_gpu(
+    monkeypatch: Any, deadline: Optional[float], target_speed: Optional[float]
+) -> None:
+    with pytest.raises(ValueError, match="cannot be combined with the gpu version"):
+        main.merge_videos(
+            "/input",
+            ["a.mp4"],
+            "out.mp4",
+            cmd_version="gpu",
+            deadline=deadline,
+            target_speed=target_speed,
+        )
+
+    monkeypatch.setattr(main, "ffmpeg_cmd_version", "gpu")
+    with pytest.raises(SystemExit, match="cannot be used with the gpu version"):
+        main.main(deadline=deadline, target_speed=target_speed)
@@ -0,0 +1,72 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import result_cache as rcs
+
+
+def test_get_result_key() -> None:
+    key = rcs.get_result_key({"argv": ["ffmpeg"], "inputs": [1, 2]})
+    assert key == rcs.get_result_key({"inputs": [1, 2], "argv": ["ffmpeg"]})
+    assert key != rcs.get_result_key({"inputs": [2, 1], "argv": ["ffmpeg"]})
+
+
+def test_store_and_fetch(tmp_path: Path) -> None:
+    cache_dir = str(tmp_path / "cache")
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"grid")
+
+    cache = rcs.ResultCache.open(cache_dir, 1000)
+    assert not cache.fetch("key", str(tmp_path / "again.mp4"))
+    cache.store("key", str(output))
+
+    cache = rcs.ResultCache.open(cache_dir, 1000)
+    assert cache.fetch("key", str(tmp_path / "again.mp4"))
+    assert (tmp_path / "again.mp4").read_bytes() == b"grid"
+    assert cache.total_bytes() == 4
+
+    # Outputs written again in place (ffmpeg -y) do not change the cached files
+    for path in [output, tmp_path / "again.mp4"]:
+        with open(path, "wb") as f:
+            f.write(b"next")
+    assert cache.fetch("key", str(tmp_path / "again.mp4"))
+    assert (tmp_path / "again.mp4").read_bytes() == b"grid"
+
+
+def test_changed_entry_is_dropped(tmp_path: Path) -> None:
+    cache = rcs.ResultCache.open(str(tmp_path / "cache"), 1000)
+    output = tmp_path / "out.mp4"
+    output.write_bytes(b"grid")
+    cache.store("key", str(output))
+
+    # The cached file is written outside the cache
+    with open(os.path.join(cache.directory, cache.entries["key"]["file"]), "wb") as f:
+        f.write(b"other grid")
+    assert not cache.fetch("key", str(tmp_path / "again.mp4"))
+    assert cache.entries == {}
+    assert os.listdir(tmp_path / "cache") == ["index.json"]
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    cache = rcs.ResultCache.open(str(tmp_path / "cache"), 10)
+    for key in ["a", "b", "c"]:
+        path = tmp_path / f"{key}.mp4"
+        path.write_bytes(b"1234")
+        cache.store(key, str(path))
+        if key == "a":
+            cache.entries["a"]["last_used"] = 0.0
+    assert sorted(cache.entries) == ["b", "c"]
+
+    # Recently fetched outputs are kept
+    cache.entries["b"]["last_used"] = 1.0
+    assert cache.fetch("b", str(tmp_path / "b2.mp4"))
+    (tmp_path / "d.mp4").write_bytes(b"1234")
+    cache.store("d", str(tmp_path / "d.mp4"))
+    assert sorted(cache.entries) == ["b", "d"]
+
+    # Outputs larger than the budget are not stored
+    (tmp_path / "e.mp4").write_bytes(b"x" * 11)
+    cache.store("e", str(tmp_path / "e.mp4"))
+    assert "e" not in cache.entries
@@ -0,0 +1,92 @@
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_grid_merge import run_history as rhs
+
+RUN: Dict[str, Any] = {
+    "profile": "v1",
+    "ffmpeg_version": "6.1",
+    "cores": 4,
+    "grid_size": 2,
+    "tile_width": 640,
+    "tile_height": 360,
+    "output_width": 1280,
+    "output_height": 720,
+    "fps": 30.0,
+    "duration": 10.0,
+    "normalize_seconds": 0.5,
+    "encode_seconds": 5.0,
+}
+
+
+def test_record_and_load_runs(tmp_path: Path) -> None:
+    db_path = str(tmp_path / "history" / "runs.sqlite3")
+    assert rhs.load_runs(db_path) == []
+
+    rhs.record_run(db_path, RUN)
+    rhs.record_run(db_path, {**RUN, "started_at": 1.0, "profile": "v2"})
+
+    runs = rhs.load_runs(db_path)
+    assert [run["profile"] for run in runs] == ["v2", "v1"]
+    assert runs[1]["encode_seconds"] == 5.0
+    assert runs[1]["started_at"] > 1.0
+
+
+def test_get_pixel_work() -> None:
+    assert rhs.get_pixel_work(RUN) == (4 * 640 * 360 + 1280 * 720) * 300
+    assert rhs.get_pixel_work({}) == 0.0
+
+
+def test_fit_cost_model() -> None:
+    runs = [
+        {**RUN, "duration": 10.0, "encode_seconds": 6.0},
+        {**RUN, "duration": 20.0, "encode_seconds": 11.0},
+        {**RUN, "duration": 40.0, "encode_seconds": 21.0},
+        {**RUN, "profile": "v2", "encode_seconds": 20.0},
+        {**RUN, "profile": "v2", "encode_seconds": None},
+    ]
+    models = rhs.fit_cost_model(runs)
+
+    intercept, slope = models["v1"]
+    assert intercept == pytest.approx(1.0)
+    work_per_core = rhs.get_pixel_work(RUN) / 4
+    assert slope * work_per_core == pytest.approx(5.0)
+    # A single v2 run gives a line through the origin
+    assert models["v2"][0] == 0.0
+    assert models["v2"][1] * work_per_core == pytest.approx(20.0)
+
+
+def test_predict_encode_time() -> None:
+    runs = [
+        {**RUN, "duration": 10.0, "encode_seconds": 6.0},
+        {**RUN, "duration": 20.0, "encode_seconds": 11.0},
+    ]
+    assert rhs.predict_encode_time(runs, {**RUN, "duration": 30.0}) == pytest.approx(
+        16.0
+    )
+    # Twice the cores halves the work per core
+    assert rhs.predict_encode_time(
+        runs, {**RUN, "duration": 40.0, "cores": 8}
+    ) == pytest.approx(11.0)
+    assert rhs.predict_encode_time(runs, {**RUN, "profile": "gpu"}) is None
+
+
+def test_format_stats() -> None:
+    assert rhs.format_stats([]) == "No runs recorded."
+
+    runs = [
+        {**RUN, "started_at": 0.0, "ffmpeg_version": "5.1"},
+        {**RUN, "started_at": 1.0, "encode_seconds": 10.0},
+    ]
+    report = rhs.format_stats(runs)
+    throughput = rhs.get_pixel_work(RUN) / 1e6
+    assert f"v1   ffmpeg 5.1          runs    1  mean {throughput / 5:9.2f}" in report
+    assert f"v1   ffmpeg 6.1          runs    1  mean {throughput / 10:9.2f}" in report
+    assert "Cost model" in report
+    assert "2x2 640x360 30.00fps 10.0s" in report
@@ -1,12 +1,16 @@
+import io
 import os
 import subprocess
 import sys
-from typing import Any, Optional, Tuple
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 import pytest
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from video_grid_merge import __main__ as main
+from video_grid_merge import delete_files as dlf
+from video_grid_merge import run_history as rhs
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -213,3 +217,150 @@ def test_get_target_files(tmpdir: Any) -> None:
         str(folder.join("test1_TV.mp4")),
         str(folder.join("test3_TV.mov")),
     ]
+
+
+@pytest.mark.parametrize(
+    "progress,duration,expected",
+    [
+        (
+            {"out_time_us": "5000000", "speed": "2.5x", "progress": "continue"},
+            10.0,
+            {"out_time": 5.0, "speed": 2.5, "fraction": 0.5, "done": 0.0},
+        ),
+        (
+            {"out_time_us": "N/A", "speed": "N/A", "progress": "continue"},
+            10.0,
+            {"out_time": 0.0, "speed": 0.0, "fraction": 0.0, "done": 0.0},
+        ),
+        (
+            {"out_time_us": "9000000", "speed": "1x", "progress": "end"},
+            None,
+            {"out_time": 9.0, "speed": 1.0, "fraction": 1.0, "done": 1.0},
+        ),
+    ],
+)
+def test_parse_ffmpeg_progress(
+    progress: Dict[str, str], duration: Optional[float], expected: Dict[str, float]
+) -> None:
+    assert main.parse_ffmpeg_progress(progress, duration) == expected
+
+
+def test_run_ffmpeg_command_with_progress(monkeypatch: Any) -> None:
+    commands: List[List[str]] = []
+
+    class MockProcess:
+        def __init__(self, command: List[str], **kwargs: Any) -> None:
+            commands.append(command)
+            self.stdout = io.StringIO(
+                "out_time_us=2000000\nspeed=4x\nprogress=continue\n"
+                "out_time_us=4000000\nspeed=4x\nprogress=end\n"
+            )
+
+        def wait(self) -> int:
+            return 0
+
+    monkeypatch.setattr(subprocess, "Popen", MockProcess)
+    reports: List[Dict[str, float]] = []
+    main.run_ffmpeg_command(
+        ["ffmpeg", "-y", "-i", "a.mp4", "out.mp4"], 4.0, reports.append
+    )
+
+    assert commands == [
+        ["ffmpeg", "-progress", "pipe:1", "-nostats", "-y", "-i", "a.mp4", "out.mp4"]
+    ]
+    assert [report["fraction"] for report in reports] == [0.5, 1.0]
+    assert reports[-1]["done"] == 1.0
+
+
+def test_merge_videos_stage_times(monkeypatch: Any, tmp_path: Path) -> None:
+    run_calls: List[Any] = []
+    (tmp_path / "a.mp4").write_bytes(b"a")
+    (tmp_path / "a_TV.mp4").write_bytes(b"a")
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 12.0)
+    monkeypatch.setattr(
+        main, "create_ffmpeg_command_v2", lambda *args, **kwargs: ["ffmpeg", "v2"]
+    )
+
+    def mock_run_ffmpeg_command(*args: Any) -> int:
+        run_calls.append(args)
+        return 0
+
+    monkeypatch.setattr(main, "run_ffmpeg_command", mock_run_ffmpeg_command)
+    monkeypatch.setattr(dlf, "delete_files_in_folder", lambda *args: [])
+    monkeypatch.setattr(main, "get_video_size", lambda path: (640, 360))
+    monkeypatch.setattr(main, "get_video_fps", lambda path: 25.0)
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "6.1")
+
+    stage_times = main.merge_videos(
+        str(tmp_path), ["a.mp4"], "out.mp4", cmd_version="v2"
+    )
+
+    assert set(stage_times) == {"normalize", "encode"}
+    assert run_calls == [(["ffmpeg", "v2"], 12.0, None)]
+    [run] = rhs.load_runs(main.run_history_path)
+    assert run["profile"] == "v2"
+    assert run["ffmpeg_version"] == "6.1"
+    assert (run["tile_width"], run["tile_height"], run["fps"]) == (640, 360, 25.0)
+    assert run["duration"] == 12.0
+    assert run["encode_seconds"] == stage_times["encode"]
+
+
+def test_merge_videos_without_run_history(monkeypatch: Any, tmp_path: Path) -> None:
+    (tmp_path / "a_TV.mp4").write_bytes(b"a")
+    monkeypatch.setattr(main, "record_run_history", False)
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 12.0)
+    monkeypatch.setattr(
+        main, "create_ffmpeg_command", lambda *args, **kwargs: ["ffmpeg"]
+    )
+    monkeypatch.setattr(main, "run_ffmpeg_command", lambda *args: 0)
+    monkeypatch.setattr(dlf, "delete_files_in_folder", lambda *args: [])
+    monkeypatch.setattr(main, "get_video_size", lambda path: (640, 360))
+    monkeypatch.setattr(main, "get_video_fps", lambda path: 25.0)
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "6.1")
+
+    main.merge_videos(str(tmp_path), ["a.mp4"], "out.mp4")
+
+    assert rhs.load_runs(main.run_history_path) == []
+
+
+def test_merge_videos_encode_failure(monkeypatch: Any, tmp_path: Path) -> None:
+    deleted: List[Any] = []
+    (tmp_path / "a_TV.mp4").write_bytes(b"a")
+
+    def mock_delete_files_in_folder(*args: Any) -> List[str]:
+        deleted.append(args)
+        return []
+
+    monkeypatch.setattr(main, "create_target_video", lambda *args: 12.0)
+    monkeypatch.setattr(
+        main, "create_ffmpeg_command", lambda *args, **kwargs: ["ffmpeg"]
+    )
+    monkeypatch.setattr(main, "run_ffmpeg_command", lambda *args: 1)
+    monkeypatch.setattr(dlf, "delete_files_in_folder", mock_delete_files_in_folder)
+    monkeypatch.setattr(main, "get_video_size", lambda path: (640, 360))
+    monkeypatch.setattr(main, "get_video_fps", lambda path: 25.0)
+    monkeypatch.setattr(main, "get_ffmpeg_version", lambda: "6.1")
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed to encode the grid"):
+        main.merge_videos(str(tmp_path), ["a.mp4"], "out.mp4")
+
+    # The temporary data is removed, but the failed run is not recorded
+    assert len(deleted) == 1
+    assert rhs.load_runs(main.run_history_path) == []
+
+
+def test_merge_videos_renditions_need_a_single_encode(monkeypatch: Any) -> None:
+    monkeypatch.setattr(main, "output_renditions", [main.parse_rendition("540p")])
+    with pytest.raises(ValueError, match="cannot be combined with resumable"):
+        main.merge_videos("/input", ["a.mp4"], "out.mp4", resume=True)
+
+
+def test_get_ffmpeg_version(monkeypatch: Any) -> None:
+    main.get_ffmpeg_version.cache_clear()
+    monkeypatch.setattr(
+        subprocess,
+        "check_output",
+        lambda *args, **kwargs: b"ffmpeg version 6.1.1-3ubuntu5 Copyright (c)",
+    )
+    assert main.get_ffmpeg_version() == "6.1.1-3ubuntu5"
+    main.get_ffmpeg_version.cache_clear()
@@ -1,27 +1,131 @@
+import argparse
 import atexit
 import io
+import json
 import math
 import os
 import re
+import sqlite3
 import subprocess
 import sys
+import tempfile
 import termios
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from functools import lru_cache
-from typing import List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_dir)
 
+from video_grid_merge import command_runner as crn
 from video_grid_merge import delete_files as dlf
-from video_grid_merge import rename_files as rnf
+from video_grid_merge import directory_index as dix
+from video_grid_merge import fingerprint as fpr
+from video_grid_merge import integrity_check as ick
+from video_grid_merge import job_journal as jnl
+from video_grid_merge import keyframe_index as kfi
+from video_grid_merge import loudness_cache as lcs
+from video_grid_merge import memory_budget as mbg
+from video_grid_merge import prefetch as pft
+from video_grid_merge import preset_select as psl
+from video_grid_merge import result_cache as rcs
+from video_grid_merge import run_history as rhs
 
 video_extension_list = [".mov", ".mp4"]
+# Still images placed in a cell are shown for the whole length of the grid
+image_extension_list = [".png", ".jpg", ".jpeg"]
 match_input_resolution_flag = True
 temporarily_data_list = ["_TV", ".txt"]
 ffmpeg_loglevel = "error"
 ffmpeg_cmd_version = "v1"
+# Seconds an ffmpeg command may run before its process group is killed
+ffmpeg_timeout: Optional[float] = None
+# Length (seconds) of the output segments encoded by a resumable (--resume) job
+resume_segment_seconds = 60.0
+# Encode with a deadline: length of the calibration encodes and of the segments
+# after which the preset may be switched to a faster one
+preset_calibration_seconds = 5.0
+deadline_segment_seconds = 10.0
+# Hierarchical compositing: grids with more than block x block tiles are stacked
+# in blocks by separate ffmpeg processes (0 disables). The blocks are streamed to
+# the final process through FIFOs ("fifo") or written as lossless files ("file")
+hierarchical_block_size = 0
+hierarchical_intermediate = "fifo"
+hierarchical_workers = 2
+# Buffering of the grid encode (0/None keep the ffmpeg defaults); set by --max-memory
+decoder_threads = 0
+input_thread_queue_size = 0
+encoder_threads = 0
+encoder_rc_lookahead: Optional[int] = None
+default_encoder_presets = {"v1": "ultrafast", "v2": "medium"}
+# Software encoder of the v1 and v2 versions; the presets selected for a deadline
+# or speed target follow its ladder (see psl.ENCODER_PRESETS)
+video_encoder = "libx264"
+VIDEO_ENCODERS = ["libx264", "libx265"]
+# Frame rate of the grid: of the "first" video, the "min", the "max" or the most
+# "common" one of all videos, capped at max_output_fps (None for no cap)
+output_fps_policy = "first"
+max_output_fps: Optional[float] = None
+# Pixel format every tile is converted to right after decoding (None keeps the
+# input formats), so stacking and encoding run on one cheap layout
+target_pix_fmt: Optional[str] = "yuv420p"
+# Audio of the grid: "mix" all tiles, mix the "first" audio_mix_tiles tiles, the
+# first tile alone re-encoded ("single") or stream copied ("copy"), a "silent"
+# track or "none". Tiles that are not heard are never decoded
+audio_strategy = "mix"
+audio_mix_tiles = 4
+AUDIO_STRATEGIES = ["mix", "first", "single", "copy", "silent", "none"]
+# Balance the mixed tiles to loudness_target (LUFS) with cached EBU R128
+# measurements; loudness_gains (dB per file) is set by apply_loudness_balance
+balance_loudness = False
+loudness_target = -23.0
+loudness_cache_path = lcs.default_cache_path
+loudness_gains: Dict[str, float] = {}
+# Store the parameters and stage times of every run for the encode time cost model
+record_run_history = True
+run_history_path = rhs.default_history_path
+# Check every input with ffmpeg ("fast": demux only, "full": decode) before any
+# other work of a merge; clean files are cached by fingerprint
+integrity_check_mode: Optional[str] = None
+integrity_check_workers = 4
+integrity_cache_path = ick.default_cache_path
+# Keyframe timestamps of the inputs, so segments can start on keyframes
+keyframe_index_dir = kfi.default_index_dir
+# Extra outputs of the grid encode at other sizes, profiles and bitrates, e.g.
+# {"size": "1080p", "profile": "v2", "bitrate": "6M"} (see parse_rendition).
+# They are scaled from the same composited frames in the same ffmpeg process
+output_renditions: List[Dict[str, Optional[str]]] = []
+# Artifacts made from the same composited frames: a "poster" frame picked by the
+# thumbnail filter, "sprite" sheets of one frame every sprite_interval seconds
+# for scrubbing and a short low resolution "preview" clip
+output_artifacts: List[str] = []
+ARTIFACTS = ["poster", "sprite", "preview"]
+sprite_interval = 10.0
+sprite_columns = 5
+sprite_rows = 5
+sprite_tile_width = 160
+preview_seconds = 10.0
+preview_height = 240
+preview_fps = 10.0
+# Proxy (--preview) renders for checking the tile order: small tiles, a low frame
+# rate and only the first proxy_seconds, read from the inputs directly
+proxy_tile_width = 160
+proxy_fps = 10.0
+proxy_seconds = 10.0
+# Read the inputs into the page cache ahead of ffmpeg during the grid encode,
+# following its '-progress' position (see prefetch.Prefetcher)
+prefetch_inputs = False
+prefetch_window_bytes = pft.DEFAULT_WINDOW_BYTES
+prefetch_workers = 2
+# Reuse the output of an identical earlier merge (same inputs, graph, encoder
+# arguments and ffmpeg version); the least recently used outputs are removed
+# beyond result_cache_max_bytes
+use_result_cache = False
+result_cache_dir = rcs.default_cache_dir
+result_cache_max_bytes = 20 * 1024**3
 
 original_terminal_settings = None
 
@@ -118,23 +222,92 @@ def safe_input(prompt: str) -> str:
     return input(prompt)
 
 
-def get_video_files(input_folder: str) -> List[str]:
+def get_video_files(
+    input_folder: str, directory_index: Optional[dix.DirectoryIndex] = None
+) -> List[str]:
     """
-    Get a list of video files from the specified input folder.
+    Get a list of video (and still image) files from the specified input folder.
 
     Args:
         input_folder (str): The path to the folder containing video files.
+        directory_index (Optional[dix.DirectoryIndex]): The index of the input folder.
+                                                        If None, the folder is scanned.
 
     Returns:
-        List[str]: A list of video file names with extensions in the video_extension_list.
+        List[str]: A list of file names with extensions in the video_extension_list
+        or the image_extension_list.
     """
+    directory_index = directory_index or dix.DirectoryIndex.scan(input_folder)
     return [
         file
-        for file in os.listdir(input_folder)
-        if os.path.splitext(file)[1] in video_extension_list
+        for file in directory_index.names()
+        if os.path.splitext(file)[1] in video_extension_list or is_image_file(file)
     ]
 
 
+def is_image_file(file: str) -> bool:
+    """
+    Check whether a grid cell file is a still image.
+
+    Args:
+        file (str): The file name or path.
+
+    Returns:
+        bool: True if the extension is in the image_extension_list.
+    """
+    return os.path.splitext(file)[1].lower() in image_extension_list
+
+
+def get_output_fps(files: List[str]) -> Optional[float]:
+    """
+    Get the frame rate of the grid according to output_fps_policy and max_output_fps.
+
+    Every tile is converted to this frame rate, so a single high frame rate input
+    does not make the whole grid encode duplicated frames unless the policy asks
+    for it.
+
+    Args:
+        files (List[str]): The files of the grid tiles.
+
+    Returns:
+        Optional[float]: The frame rate, or None if it cannot be determined.
+
+    Raises:
+        ValueError: If output_fps_policy is not supported.
+    """
+    if output_fps_policy == "first":
+        fps = get_video_fps(get_first_video_file(files))
+    elif output_fps_policy in ("min", "max", "common"):
+        probed = [get_video_fps(file) for file in files if not is_image_file(file)]
+        rates = [rate for rate in probed if rate is not None]
+        if not rates:
+            fps = None
+        elif output_fps_policy == "min":
+            fps = min(rates)
+        elif output_fps_policy == "max":
+            fps = max(rates)
+        else:
+            fps = max(rates, key=rates.count)
+    else:
+        raise ValueError(f"Invalid output_fps_policy: {output_fps_policy}")
+    if fps is not None and max_output_fps and fps > max_output_fps:
+        fps = max_output_fps
+    return fps
+
+
+def get_first_video_file(files: List[str]) -> str:
+    """
+    Get the first file that is not a still image, to read the grid frame rate from.
+
+    Args:
+        files (List[str]): The files of the grid tiles.
+
+    Returns:
+        str: The first video file, or the first file if all are images.
+    """
+    return next((file for file in files if not is_image_file(file)), files[0])
+
+
 @lru_cache(maxsize=None)
 def get_video_length_ffmpeg(file_path: str) -> Union[float, None]:
     """
@@ -205,72 +378,217 @@ def get_video_fps(file_path: str) -> Optional[float]:
         return None
 
 
-def process_video(input_folder: str, file: str, max_length: float) -> None:
+def get_target_video_path(input_folder: str, file: str) -> str:
+    """
+    Get the path of the processed ('_TV') video created for an input video.
+
+    Args:
+        input_folder (str): The path to the folder containing the input video.
+        file (str): The name of the input video file.
+
+    Returns:
+        str: The path of the processed video.
+    """
+    return os.path.join(
+        input_folder, f"{os.path.splitext(file)[0]}_TV{os.path.splitext(file)[1]}"
+    )
+
+
+def get_concat_list_path(input_folder: str, file: str) -> str:
+    """
+    Get the path of the concat list process_video writes for an input video.
+
+    Args:
+        input_folder (str): The path to the folder containing the input video.
+        file (str): The name of the input video file.
+
+    Returns:
+        str: The path of the concat list.
+    """
+    return os.path.join(input_folder, f"list_{os.path.splitext(file)[0]}.txt")
+
+
+def get_loop_count(length: Optional[float], max_length: float) -> int:
+    """
+    Get how many times process_video repeats a video to reach max_length.
+
+    Args:
+        length (Optional[float]): The length of the video.
+        max_length (float): The target length.
+
+    Returns:
+        int: 1 if the video is linked as is, the number of concatenated copies if it
+        is shorter, or 0 if no target video is created.
+    """
+    if length and max_length and length >= max_length:
+        return 1
+    if length and max_length and length < max_length:
+        count = int(max_length / length)
+        if max_length % length != 0:
+            count += 1
+        return count
+    return 0
+
+
+def quote_concat_path(path: str) -> str:
+    """
+    Quote a path for a 'file' line of an ffmpeg concat list.
+
+    Args:
+        path (str): The path of the listed file.
+
+    Returns:
+        str: The path in single quotes, with single quotes in it escaped.
+    """
+    return "'" + path.replace("'", "'\\''") + "'"
+
+
+def process_video(
+    input_folder: str, file: str, max_length: float, length: Optional[float] = None
+) -> None:
     """
     Process a single video file, either by linking or concatenating it to match the max_length.
 
+    Still images are always linked; they are held for the whole length in the grid
+    filter graph (see build_tile_filters) instead of being concatenated.
+
     Args:
         input_folder (str): The path to the folder containing the input video.
         file (str): The name of the video file to process.
         max_length (float): The target length for the processed video.
+        length (Optional[float]): The length of the video if it is already known.
+                                  If None, it is determined with ffmpeg.
     """
-    length = get_video_length_ffmpeg(os.path.join(input_folder, file))
-    if length == max_length:
+    if is_image_file(file):
         os.link(
             os.path.join(input_folder, file),
-            os.path.join(
-                input_folder,
-                f"{os.path.splitext(file)[0]}_TV{os.path.splitext(file)[1]}",
-            ),
+            get_target_video_path(input_folder, file),
         )
-    elif length and max_length and length < max_length:
-        count = int(max_length / length)
-        output_file = os.path.join(
-            input_folder, f"list_{os.path.splitext(file)[0]}.txt"
+        return
+    if length is None:
+        length = get_video_length_ffmpeg(os.path.join(input_folder, file))
+    # Videos reaching max_length are linked (longer ones are cut by the grid encode)
+    if length and max_length and length >= max_length:
+        os.link(
+            os.path.join(input_folder, file),
+            get_target_video_path(input_folder, file),
         )
+    elif length and max_length and length < max_length:
+        output_file = get_concat_list_path(input_folder, file)
 
         with open(output_file, "w") as f:
-            f.write(f"file '{file}'\n" * count)
-            if max_length % length != 0:
-                f.write(f"file '{file}'\n")
+            f.write(
+                f"file {quote_concat_path(file)}\n" * get_loop_count(length, max_length)
+            )
 
-        tv_file = os.path.join(
-            input_folder, f"{os.path.splitext(file)[0]}_TV{os.path.splitext(file)[1]}"
-        )
-        subprocess.run(
-            f"ffmpeg -f concat -safe 0 -i {output_file} -c copy -t {max_length} {tv_file} -loglevel {ffmpeg_loglevel}",
-            shell=True,
+        tv_file = get_target_video_path(input_folder, file)
+        crn.run_command(
+            [
+                "ffmpeg",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                output_file,
+                "-c",
+                "copy",
+                "-t",
+                str(max_length),
+                tv_file,
+                "-loglevel",
+                ffmpeg_loglevel,
+            ],
+            timeout=ffmpeg_timeout,
         )
 
 
-def create_target_video(input_folder: str, video_files: List[str]) -> None:
+def create_target_video(
+    input_folder: str,
+    video_files: List[str],
+    journal: Optional[jnl.JobJournal] = None,
+    end: Optional[float] = None,
+) -> Optional[float]:
     """
     Create target videos by processing all input video files.
 
     This function determines the maximum length among all input videos and processes
     each video to match this length.
 
+    With a journal, probed lengths and completed target videos are recorded as
+    they finish, and work recorded by an interrupted run is skipped as long as
+    the files are unchanged.
+
+    With an end time, the target videos only reach the end of the merged time
+    range, so short videos are not concatenated further than needed.
+
     Args:
         input_folder (str): The path to the folder containing the input videos.
         video_files (List[str]): A list of video file names to process.
+        journal (Optional[jnl.JobJournal]): The checkpoint journal of a resumable job.
+        end (Optional[float]): The end of the merged time range in seconds.
+
+    Returns:
+        Optional[float]: The length every target video was padded to, or None if no
+        input length could be determined.
     """
-    lengths = [
-        get_video_length_ffmpeg(os.path.join(input_folder, file))
-        for file in video_files
-    ]
+    lengths: List[Optional[float]] = []
+    for file in video_files:
+        if is_image_file(file):
+            lengths.append(None)
+            continue
+        file_path = os.path.join(input_folder, file)
+        length = journal.get_probe(file_path) if journal else None
+        if length is None:
+            length = get_video_length_ffmpeg(file_path)
+            if journal and length is not None:
+                journal.record_probe(file_path, length)
+        lengths.append(length)
     print(f"Input Video Time List: {lengths}")
 
     max_length = max((length for length in lengths if length is not None), default=None)
     if max_length is None:
-        return
-
+        return None
+    if end is not None:
+        max_length = min(max_length, end)
+
+    pending = []
+    for file, length in zip(video_files, lengths):
+        if journal:
+            tv_file = get_target_video_path(input_folder, file)
+            if journal.is_normalized(tv_file):
+                continue
+            # Remove a target video left incomplete by an interrupted run
+            if os.path.exists(tv_file):
+                os.remove(tv_file)
+        pending.append((file, length))
+
+    # Inputs showing the same file share one target video (hard links), so the
+    # grid encode can detect them and decode the file only once
+    pending_files = [file for file, _ in pending]
+    unique_files, input_indexes = get_unique_inputs(
+        pending_files, [os.path.join(input_folder, file) for file in pending_files]
+    )
     with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(process_video, input_folder, file, max_length)
-            for file in video_files
-        ]
+        futures = {
+            executor.submit(process_video, input_folder, file, max_length, length): file
+            for file, length in pending
+            if file in unique_files
+        }
         for future in as_completed(futures):
             future.result()
+            if journal:
+                journal.record_normalized(
+                    get_target_video_path(input_folder, futures[future])
+                )
+    for file, index in zip(pending_files, input_indexes):
+        source_tv_file = get_target_video_path(input_folder, unique_files[index])
+        if file != unique_files[index] and os.path.exists(source_tv_file):
+            tv_file = get_target_video_path(input_folder, file)
+            os.link(source_tv_file, tv_file)
+            if journal:
+                journal.record_normalized(tv_file)
+    return max_length
 
 
 def get_target_files(folder: str, files: List[str]) -> List[str]:
@@ -287,7 +605,8 @@ def get_target_files(folder: str, files: List[str]) -> List[str]:
     return [
         os.path.join(folder, file)
         for file in files
-        if "_TV" in file and file.endswith(tuple(video_extension_list))
+        if "_TV" in file
+        and (file.endswith(tuple(video_extension_list)) or is_image_file(file))
     ]
 
 
@@ -363,241 +682,2909 @@ def get_video_size(filename: str) -> Optional[Tuple[int, int]]:
         return None
 
 
-def create_ffmpeg_command_v1(
-    input_files: list[str], output_path: str, match_input_resolution_flag: bool
-) -> str:
+@lru_cache(maxsize=None)
+def probe_video(file_path: str) -> Dict[str, Any]:
     """
-    Create an advanced ffmpeg command to merge multiple videos into a grid layout with sophisticated audio mixing.
-
-    This function generates an ffmpeg command that combines multiple input videos
-    into a single output video with a grid layout. It scales all input videos to the
-    same resolution, stacks them into a grid, and applies a sophisticated audio mixing process.
-    The command uses the 'ultrafast' preset of the libx264 codec for rapid encoding,
-    prioritizing speed while maintaining high audio quality and proper frame rate.
+    Get the codec, pixel format and audio stream information of a video file using ffprobe.
 
-    Features:
-    - Scales all input videos to the same size without maintaining aspect ratio
-    - Maintains the frame rate of the first input video
-    - Arranges videos in a grid layout based on the square root of the number of input files
-    - Applies volume normalization to each input audio stream for consistent audio levels
-    - Uses a sophisticated audio mixing process with dropout transition and volume adjustment
-    - Enhances audio clarity and reduces distortion in the final output
-    - Balances audio levels effectively across all inputs
-    - Uses libx264 codec with 'ultrafast' preset for fast encoding
-    - Optionally matches the output resolution to the combined input resolutions if specified
+    This function is cached to improve performance for repeated calls.
 
     Args:
-        input_files (list[str]): A list of paths to input video files.
-        output_path (str): The path for the output video file.
-        match_input_resolution_flag (bool): If True, the output resolution matches
-                                            the combined input video resolutions; otherwise,
-                                            it uses the resolution of the first input video.
+        file_path (str): The path to the video file.
 
     Returns:
-        str: The ffmpeg command string with advanced video layout and audio processing.
+        Dict[str, Any]: 'video_codec', 'pix_fmt' and 'audio_codec' (None if the file has
+        no audio stream), or an empty dict if the file cannot be probed.
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        f"{ffmpeg_loglevel}",
+        "-show_entries",
+        "stream=codec_type,codec_name,pix_fmt",
+        "-of",
+        "json",
+        file_path,
+    ]
+    try:
+        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT).decode()
+        streams = json.loads(output).get("streams", [])
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Error running ffprobe on {file_path}: {e}")
+        return {}
+    video: Dict[str, Any] = next(
+        (st for st in streams if st.get("codec_type") == "video"), {}
+    )
+    audio: Dict[str, Any] = next(
+        (st for st in streams if st.get("codec_type") == "audio"), {}
+    )
+    return {
+        "video_codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "audio_codec": audio.get("codec_name"),
+    }
 
-    Note:
-        This function prioritizes speed in video processing and quality in audio output,
-        while maintaining smooth playback with proper frame rate handling.
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_version() -> Optional[str]:
     """
-    if not input_files:
-        return ""
+    Get the version of the installed ffmpeg.
 
-    video_size = get_video_size(input_files[0])
-    if video_size is None:
-        return ""
+    Returns:
+        Optional[str]: The version string (e.g. "6.1.1"), or None if it cannot be determined.
+    """
+    try:
+        output = subprocess.check_output(
+            ["ffmpeg", "-version"], stderr=subprocess.STDOUT
+        ).decode()
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Error getting the ffmpeg version: {e}")
+        return None
+    match = re.search(r"ffmpeg version (\S+)", output)
+    return match.group(1) if match else None
 
-    # Get FPS from the first video
-    fps = get_video_fps(input_files[0])
-    if fps is None:
-        fps = 30.0  # Default to 30fps if unable to detect
 
-    video_width, video_height = video_size
+def build_input_options(
+    input_files: list[str],
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+) -> List[str]:
+    """
+    Create the '-i' options of the grid command.
 
-    N = len(input_files)
-    sqrt_N = int(math.sqrt(N))
+    When start or duration is given, '-ss'/'-t' are placed before each '-i' so
+    ffmpeg seeks on the input side and never decodes frames outside the range.
+    Still images are not seeked; their single frame is held by the filter graph.
+    The decoder threads and the input queue size are limited if decoder_threads
+    or input_thread_queue_size is set.
 
-    if match_input_resolution_flag:
-        output_width = video_width * sqrt_N
-        output_height = video_height * sqrt_N
-    else:
-        output_width = video_width
-        output_height = video_height
+    Args:
+        input_files (list[str]): A list of paths to input video files.
+        start (Optional[float]): Position in seconds to start reading every input from.
+        duration (Optional[float]): Number of seconds to read from every input.
 
-    # Build filter complex with FPS setting
-    filter_complex = "".join(
-        [
-            f"[{i}:v]scale={video_width}:{video_height},fps={fps}[v{i}]; "
-            for i in range(N)
-        ]
-    )
-    filter_complex += "".join(
-        [
-            f'{"".join([f"[v{i*sqrt_N+j}]" for j in range(sqrt_N)])}hstack=inputs={sqrt_N}[row{i}]; '
-            for i in range(sqrt_N)
-        ]
-    )
-    filter_complex += f'{"".join([f"[row{i}]" for i in range(sqrt_N)])}vstack=inputs={sqrt_N}[vstack]; '
-    filter_complex += "".join([f"[{i}:a]volume=1[a{i}]; " for i in range(N)])
-    filter_complex += "".join([f"[a{i}]" for i in range(N)])
-    filter_complex += f"amix=inputs={N}:dropout_transition=0,volume={N}[aout]"
+    Returns:
+        List[str]: The input options as ffmpeg arguments.
+    """
+    seek: List[str] = []
+    if start:
+        seek += ["-ss", str(start)]
+    if duration is not None:
+        seek += ["-t", str(duration)]
+    options: List[str] = []
+    if decoder_threads:
+        options += ["-threads", str(decoder_threads)]
+    if input_thread_queue_size:
+        options += ["-thread_queue_size", str(input_thread_queue_size)]
+    argv: List[str] = []
+    for input_file in input_files:
+        argv += [] if is_image_file(input_file) else seek
+        argv += options + ["-i", input_file]
+    return argv
+
+
+def get_unique_inputs(
+    input_files: List[str], probe_files: Optional[List[str]] = None
+) -> Tuple[List[str], List[int]]:
+    """
+    Find the tiles that show the same file, so every file is opened only once.
 
-    return (
-        f"ffmpeg -y {' '.join([f'-i {input_file}' for input_file in input_files])} "
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[vstack]" -map "[aout]" '
-        f"-c:v libx264 -preset ultrafast -r {fps} "
-        f"-c:a aac -b:a 192k -threads {os.cpu_count()} -loglevel {ffmpeg_loglevel} "
-        f"-s {output_width}x{output_height} {output_path}"
-    )
+    Files are identified by their fingerprint (size, modification time, inode and
+    sampled content hash), so hard links and symbolic links to the same file are detected as well.
 
+    Args:
+        input_files (List[str]): The videos of the grid tiles.
+        probe_files (Optional[List[str]]): The files identifying the tiles, in the same
+                                           order as input_files. Defaults to input_files.
 
-def create_ffmpeg_command_v2(
-    input_files: list[str], output_path: str, match_input_resolution_flag: bool
-) -> str:
+    Returns:
+        Tuple[List[str], List[int]]: The unique input files, and for every tile the
+        index of its file in the unique input files.
     """
-    Create an ffmpeg command to merge multiple videos into a grid layout with balanced efficiency and quality.
+    probe_files = probe_files or input_files
+    unique_files: List[str] = []
+    input_indexes: List[int] = []
+    indexes: Dict[str, int] = {}
+    for input_file, probe_file in zip(input_files, probe_files):
+        fingerprint = fpr.file_fingerprint(probe_file)
+        key = json.dumps(fingerprint, sort_keys=True) if fingerprint else probe_file
+        if key not in indexes:
+            indexes[key] = len(unique_files)
+            unique_files.append(input_file)
+        input_indexes.append(indexes[key])
+    return unique_files, input_indexes
+
+
+def get_image_inputs(input_files: List[str]) -> List[int]:
+    """
+    Get the indexes of the still image inputs.
 
-    This function generates an ffmpeg command that combines multiple input videos
-    into a single output video with a grid layout. It scales all input videos to the
-    same resolution, stacks them into a grid, and applies sophisticated audio mixing.
-    The command balances encoding efficiency and output quality, prioritizing file size
-    reduction while maintaining good visual and audio quality and proper frame rate.
+    Args:
+        input_files (List[str]): The input files of an ffmpeg command.
 
-    Features:
-    - Scales all input videos to the same size without maintaining aspect ratio
-    - Maintains the frame rate of the first input video
-    - Arranges videos in a grid layout based on the square root of the number of input files
-    - Applies volume normalization to each input audio stream for consistent audio levels
-    - Uses a sophisticated audio mixing process with dropout transition and volume adjustment
-    - Enhances audio clarity and reduces distortion in the final output
-    - Balances audio levels effectively across all inputs
-    - Uses libx264 codec with 'medium' preset for a balance of encoding speed and compression efficiency
-    - Applies Constant Rate Factor (CRF) for efficient size/quality balance
-    - Optionally matches the output resolution to the combined input resolutions if specified
+    Returns:
+        List[int]: The indexes of the inputs that are still images.
+    """
+    return [index for index, file in enumerate(input_files) if is_image_file(file)]
+
+
+def get_convert_inputs(probe_files: List[str], input_indexes: List[int]) -> List[int]:
+    """
+    Get the indexes of the inputs whose pixel format is not target_pix_fmt.
 
     Args:
-        input_files (list[str]): A list of paths to input video files.
-        output_path (str): The path for the output video file.
-        match_input_resolution_flag (bool): If True, the output resolution matches
-                                            the combined input video resolutions; otherwise,
-                                            it uses the resolution of the first input video.
+        probe_files (List[str]): The files the pixel format of every tile is read from.
+        input_indexes (List[int]): The input index of every tile (see get_unique_inputs).
 
     Returns:
-        str: The ffmpeg command string with balanced video and audio processing.
+        List[int]: The indexes of the inputs to convert. Inputs whose pixel format
+        cannot be determined are converted as well.
+    """
+    if not target_pix_fmt:
+        return []
+    pix_fmts: Dict[int, Optional[str]] = {}
+    for file, index in zip(probe_files, input_indexes):
+        if index not in pix_fmts:
+            pix_fmts[index] = probe_video(file).get("pix_fmt")
+    return [index for index, pix_fmt in pix_fmts.items() if pix_fmt != target_pix_fmt]
 
-    Note:
-        This function aims to produce smaller file sizes compared to the fastest encoding
-        options, while still maintaining good visual quality, audio clarity, and smooth playback.
+
+def has_audio(file: str) -> bool:
     """
-    if not input_files:
-        return ""
+    Check whether a tile has an audio track.
 
-    video_size = get_video_size(input_files[0])
-    if video_size is None:
-        return ""
+    Args:
+        file (str): The file of the tile.
 
-    # Get FPS from the first video
-    fps = get_video_fps(input_files[0])
-    if fps is None:
-        fps = 30.0  # Default to 30fps if unable to detect
+    Returns:
+        bool: False for still images and videos probed without an audio stream, True
+        otherwise (also if the file cannot be probed).
+    """
+    if is_image_file(file):
+        return False
+    probe = probe_video(file)
+    return not probe or probe.get("audio_codec") is not None
 
-    video_width, video_height = video_size
 
-    N = len(input_files)
-    sqrt_N = int(math.sqrt(N))
+def get_audio_tiles(probe_files: List[str]) -> List[int]:
+    """
+    Get the tiles whose audio is heard according to audio_strategy.
 
-    if match_input_resolution_flag:
-        output_width = video_width * sqrt_N
-        output_height = video_height * sqrt_N
-    else:
-        output_width = video_width
-        output_height = video_height
+    Args:
+        probe_files (List[str]): The files the audio streams of every tile are read from.
 
-    # Build filter complex with FPS setting
-    filter_complex = "".join(
-        [
-            f"[{i}:v]scale={video_width}:{video_height},fps={fps}[v{i}]; "
-            for i in range(N)
-        ]
-    )
-    filter_complex += "".join(
-        [
-            f'{"".join([f"[v{i*sqrt_N+j}]" for j in range(sqrt_N)])}hstack=inputs={sqrt_N}[row{i}]; '
-            for i in range(sqrt_N)
-        ]
-    )
-    filter_complex += f'{"".join([f"[row{i}]" for i in range(sqrt_N)])}vstack=inputs={sqrt_N}[vstack]; '
-    filter_complex += "".join([f"[{i}:a]volume=1[a{i}]; " for i in range(N)])
-    filter_complex += "".join([f"[a{i}]" for i in range(N)])
-    filter_complex += f"amix=inputs={N}:dropout_transition=0,volume={N}[aout]"
+    Returns:
+        List[int]: The tiles with an audio track that are heard, in tile order.
 
-    return (
-        f"ffmpeg -y {' '.join([f'-i {input_file}' for input_file in input_files])} "
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[vstack]" -map "[aout]" '
-        f"-c:v libx264 -preset medium -crf 23 -r {fps} "
-        f"-c:a aac -b:a 128k -threads {os.cpu_count()} -loglevel {ffmpeg_loglevel} "
-        f"-s {output_width}x{output_height} {output_path}"
-    )
+    Raises:
+        ValueError: If audio_strategy is not supported.
+    """
+    if audio_strategy not in AUDIO_STRATEGIES:
+        raise ValueError(f"Invalid audio_strategy: {audio_strategy}")
+    if audio_strategy in ("silent", "none"):
+        return []
+    tiles = [tile for tile, file in enumerate(probe_files) if has_audio(file)]
+    if audio_strategy == "first":
+        return tiles[:audio_mix_tiles]
+    if audio_strategy in ("single", "copy"):
+        return tiles[:1]
+    return tiles
+
+
+def build_audio_options(
+    audio_tiles: List[int], input_indexes: List[int]
+) -> Tuple[Optional[List[int]], List[str], List[str]]:
+    """
+    Create the audio mapping of a grid command according to audio_strategy.
 
+    Args:
+        audio_tiles (List[int]): The heard tiles (see get_audio_tiles).
+        input_indexes (List[int]): The input index of every tile.
 
-def create_gpu_ffmpeg_command(
-    input_files: list[str], output_path: str, match_input_resolution_flag: bool
-) -> str:  # pragma: no cover
-    if not input_files:
-        return ""
+    Returns:
+        Tuple[Optional[List[int]], List[str], List[str]]: The tiles mixed by the filter
+        graph (an empty list for a silent track, None if the graph has no audio), the
+        audio -map option and the output options following the encoder options.
+    """
+    if audio_strategy == "none":
+        return None, [], ["-an"]
+    if audio_strategy in ("single", "copy") and audio_tiles:
+        codec = ["-c:a", "copy"] if audio_strategy == "copy" else []
+        return None, ["-map", f"{input_indexes[audio_tiles[0]]}:a"], codec
+    # A silent track from anullsrc is endless and must end with the video
+    return audio_tiles, ["-map", "[aout]"], [] if audio_tiles else ["-shortest"]
 
-    video_size = get_video_size(input_files[0])
-    if video_size is None:
-        return ""
 
-    # Get FPS from the first video
-    fps = get_video_fps(input_files[0])
-    if fps is None:
-        fps = 30.0  # Default to 30fps if unable to detect
+def get_audio_gains(input_files: List[str]) -> Dict[int, float]:
+    """
+    Get the loudness balancing gains of the inputs of an ffmpeg command.
 
-    video_width, video_height = video_size
+    Args:
+        input_files (List[str]): The input files of the command.
 
-    N = len(input_files)
-    sqrt_N = int(math.sqrt(N))
+    Returns:
+        Dict[int, float]: The gain in dB of every input found in loudness_gains.
+    """
+    return {
+        index: loudness_gains[file]
+        for index, file in enumerate(input_files)
+        if file in loudness_gains
+    }
 
-    if match_input_resolution_flag:
+
+def build_audio_mix(labels: List[str], shortest: bool = False) -> str:
+    """
+    Create the filter mixing audio streams into '[aout]'.
+
+    Args:
+        labels (List[str]): The labels of the mixed streams. If empty, '[aout]' is a
+                            silent track.
+        shortest (bool): If True, the mix ends with its shortest input.
+
+    Returns:
+        str: The filter.
+    """
+    if not labels:
+        return "anullsrc=channel_layout=stereo:sample_rate=48000[aout]"
+    mix_duration = ":duration=shortest" if shortest else ""
+    return (
+        "".join([f"[{label}]" for label in labels])
+        + f"amix=inputs={len(labels)}{mix_duration}:dropout_transition=0,"
+        + f"volume={len(labels)}[aout]"
+    )
+
+
+def build_tile_filters(
+    input_indexes: List[int],
+    video_width: int,
+    video_height: int,
+    fps: float,
+    image_inputs: Optional[List[int]] = None,
+    convert_inputs: Optional[List[int]] = None,
+    audio_tiles: Optional[List[int]] = None,
+    audio_gains: Optional[Dict[int, float]] = None,
+) -> Tuple[str, str]:
+    """
+    Create the filters producing the '[v<tile>]' video and '[a<tile>]' audio streams.
+
+    An input shown in several tiles is decoded and scaled once and fanned out
+    with split/asplit.
+
+    A still image input is decoded and scaled once, repeated endlessly by the loop
+    filter and converted to the grid frame rate; its audio is silence from
+    anullsrc. The stacks and the mix must therefore end with the shortest input.
+
+    Inputs in another pixel format than target_pix_fmt are converted by a format
+    filter right after scale, so a single swscale pass scales and converts them.
+
+    Audio streams are only created for the heard tiles; the audio of the other
+    tiles is not referenced by the graph, so ffmpeg does not decode it.
+
+    Args:
+        input_indexes (List[int]): The input index of every tile.
+        video_width (int): The width every tile is scaled to.
+        video_height (int): The height every tile is scaled to.
+        fps (float): The frame rate every tile is converted to.
+        image_inputs (Optional[List[int]]): The indexes of the still image inputs.
+        convert_inputs (Optional[List[int]]): The indexes of the inputs to convert to
+                                              target_pix_fmt.
+        audio_tiles (Optional[List[int]]): The tiles whose '[a<tile>]' audio stream is
+                                           created. Defaults to all tiles.
+        audio_gains (Optional[Dict[int, float]]): The gain in dB of inputs whose audio
+                                                  is balanced (see get_audio_gains).
+
+    Returns:
+        Tuple[str, str]: The video filters and the audio filters.
+    """
+    tiles: Dict[int, List[int]] = {}
+    for tile, index in enumerate(input_indexes):
+        tiles.setdefault(index, []).append(tile)
+    if audio_tiles is None:
+        audio_tiles = list(range(len(input_indexes)))
+
+    video_filters = ""
+    audio_filters = ""
+    for index, tile_list in tiles.items():
+        video_filter = f"[{index}:v]scale={video_width}:{video_height}"
+        if index in (convert_inputs or []):
+            video_filter += f",format={target_pix_fmt}"
+        if index in (image_inputs or []):
+            video_filter += f",loop=loop=-1:size=1:start=0,fps={fps}"
+            audio_filter = "anullsrc=channel_layout=stereo:sample_rate=48000"
+        else:
+            video_filter += f",fps={fps}"
+            if audio_gains and index in audio_gains:
+                audio_filter = f"[{index}:a]volume={audio_gains[index]:.2f}dB"
+            else:
+                audio_filter = f"[{index}:a]volume=1"
+        if len(tile_list) > 1:
+            video_filter += f",split={len(tile_list)}"
+        video_filters += f'{video_filter}{"".join([f"[v{t}]" for t in tile_list])}; '
+
+        heard = [tile for tile in tile_list if tile in audio_tiles]
+        if not heard:
+            continue
+        if len(heard) > 1:
+            audio_filter += f",asplit={len(heard)}"
+        audio_filters += f'{audio_filter}{"".join([f"[a{t}]" for t in heard])}; '
+    return video_filters, audio_filters
+
+
+def build_grid_filter_complex(
+    N: int,
+    video_width: int,
+    video_height: int,
+    fps: float,
+    input_indexes: Optional[List[int]] = None,
+    image_inputs: Optional[List[int]] = None,
+    convert_inputs: Optional[List[int]] = None,
+    audio_tiles: Optional[List[int]] = None,
+    audio: bool = True,
+    audio_gains: Optional[Dict[int, float]] = None,
+) -> str:
+    """
+    Create the filter graph that stacks N inputs into a grid and mixes their audio.
+
+    Args:
+        N (int): The number of tiles (a perfect square).
+        video_width (int): The width every tile is scaled to.
+        video_height (int): The height every tile is scaled to.
+        fps (float): The frame rate every tile is converted to.
+        input_indexes (Optional[List[int]]): The input index of every tile, as returned
+                                             by get_unique_inputs. Defaults to one input
+                                             per tile.
+        image_inputs (Optional[List[int]]): The indexes of the still image inputs.
+        convert_inputs (Optional[List[int]]): The indexes of the inputs to convert to
+                                              target_pix_fmt.
+        audio_tiles (Optional[List[int]]): The tiles mixed into '[aout]' (an empty list
+                                           gives a silent track). Defaults to all tiles.
+        audio (bool): If False, the graph has no audio output.
+        audio_gains (Optional[Dict[int, float]]): The gain in dB of every balanced input.
+
+    Returns:
+        str: The filter graph with the '[vstack]' video and '[aout]' audio outputs.
+    """
+    sqrt_N = int(math.sqrt(N))
+    if audio_tiles is None:
+        audio_tiles = list(range(N))
+    video_filters, audio_filters = build_tile_filters(
+        input_indexes or list(range(N)),
+        video_width,
+        video_height,
+        fps,
+        image_inputs,
+        convert_inputs,
+        audio_tiles if audio else [],
+        audio_gains,
+    )
+    # Still images are endless, so the grid ends with the (equally long) videos
+    shortest = ":shortest=1" if image_inputs else ""
+
+    # Build filter complex with FPS setting
+    filter_complex = video_filters
+    filter_complex += "".join(
+        [
+            f'{"".join([f"[v{i*sqrt_N+j}]" for j in range(sqrt_N)])}hstack=inputs={sqrt_N}{shortest}[row{i}]; '
+            for i in range(sqrt_N)
+        ]
+    )
+    filter_complex += f'{"".join([f"[row{i}]" for i in range(sqrt_N)])}vstack=inputs={sqrt_N}{shortest}[vstack]; '
+    if not audio:
+        return filter_complex[: -len("; ")]
+    filter_complex += audio_filters
+    filter_complex += build_audio_mix(
+        [f"a{tile}" for tile in audio_tiles], bool(image_inputs)
+    )
+    return filter_complex
+
+
+def build_encoder_options(
+    cmd_version: str, fps: float, preset: Optional[str] = None
+) -> List[str]:
+    """
+    Create the video and audio encoder options of an ffmpeg command version.
+
+    The v1 and v2 versions encode with video_encoder. The lookahead is limited if
+    encoder_rc_lookahead is set. libx265 outputs use crf 28, its equivalent of the
+    libx264 crf 23, and are tagged hvc1 so that QuickTime plays the MP4/MOV files.
+
+    Args:
+        cmd_version (str): "v1", "v2" or "gpu".
+        fps (float): The output frame rate.
+        preset (Optional[str]): The x264/x265 preset overriding the default of the version.
+
+    Returns:
+        List[str]: The encoder options as ffmpeg arguments.
+    """
+    codec_options: List[str] = []
+    crf = ["-crf", "23"]
+    if video_encoder == "libx265":
+        x265_params = "log-level=error"
+        if encoder_rc_lookahead is not None:
+            x265_params += f":rc-lookahead={encoder_rc_lookahead}"
+        codec_options = ["-x265-params", x265_params, "-tag:v", "hvc1"]
+        crf = ["-crf", "28"]
+    elif encoder_rc_lookahead is not None:
+        codec_options = ["-rc-lookahead", str(encoder_rc_lookahead)]
+    if cmd_version == "v1":
+        return [
+            "-c:v",
+            video_encoder,
+            "-preset",
+            preset or default_encoder_presets["v1"],
+            *codec_options,
+            "-r",
+            str(fps),
+            "-c:a",
+            "aac",
+            "-b:a",
+            "192k",
+        ]
+    elif cmd_version == "v2":
+        return [
+            "-c:v",
+            video_encoder,
+            "-preset",
+            preset or default_encoder_presets["v2"],
+            *codec_options,
+            *crf,
+            "-r",
+            str(fps),
+            "-c:a",
+            "aac",
+            "-b:a",
+            "128k",
+        ]
+    return [
+        "-c:v",
+        "h264_nvenc",
+        "-preset",
+        "p7",
+        "-r",
+        str(fps),
+        "-c:a",
+        "aac",
+        "-b:a",
+        "192k",
+    ]
+
+
+def parse_rendition(text: str) -> Dict[str, Optional[str]]:
+    """
+    Parse an output rendition given as SIZE[:PROFILE[:BITRATE]].
+
+    SIZE is a height like "1080p" (the width keeps the aspect ratio of the grid) or
+    WIDTHxHEIGHT, PROFILE is an ffmpeg command version (default v2) and BITRATE an
+    ffmpeg bitrate like "6M" that caps the video bitrate.
+
+    Args:
+        text (str): The rendition, e.g. "1080p:v2:6M".
+
+    Returns:
+        Dict[str, Optional[str]]: The 'size', 'profile' and 'bitrate' of the rendition.
+
+    Raises:
+        ValueError: If the rendition is malformed.
+    """
+    size, _, rest = text.partition(":")
+    profile, _, bitrate = rest.partition(":")
+    if (
+        not re.fullmatch(r"\d+p|\d+x\d+", size)
+        or profile not in ("", "v1", "v2", "gpu")
+        or not re.fullmatch(r"(\d+(\.\d+)?[kKM]?)?", bitrate)
+    ):
+        raise ValueError(f"Invalid rendition: {text}")
+    return {"size": size, "profile": profile or "v2", "bitrate": bitrate or None}
+
+
+def get_rendition_path(output_path: str, rendition: Dict[str, Optional[str]]) -> str:
+    """
+    Get the output path of a rendition: the main output path with the size appended.
+
+    Args:
+        output_path (str): The path of the main output video file.
+        rendition (Dict[str, Optional[str]]): The rendition (see parse_rendition).
+
+    Returns:
+        str: The path of the rendition, e.g. 'out_1080p.mp4' for 'out.mp4'.
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{rendition['size']}{ext}"
+
+
+def get_artifact_path(output_path: str, artifact: str) -> str:
+    """
+    Get the output path of an artifact, named after the main output path.
+
+    Args:
+        output_path (str): The path of the main output video file.
+        artifact (str): "poster", "sprite" or "preview".
+
+    Returns:
+        str: The path of the artifact (an image2 pattern for the sprite sheets, in
+        which a '%' of the output path is escaped as '%%').
+    """
+    root, ext = os.path.splitext(output_path)
+    if artifact == "poster":
+        return f"{root}_poster.jpg"
+    if artifact == "sprite":
+        return f"{root.replace('%', '%%')}_sprite_%03d.jpg"
+    return f"{root}_preview{ext}"
+
+
+def build_artifact_output(artifact: str, fps: float) -> Tuple[str, List[str]]:
+    """
+    Create the graph branch filters and output options of an artifact.
+
+    Args:
+        artifact (str): "poster", "sprite" or "preview".
+        fps (float): The frame rate of the grid.
+
+    Returns:
+        Tuple[str, List[str]]: The filters of the branch and the output options.
+
+    Raises:
+        ValueError: If the artifact is unknown.
+    """
+    if artifact == "poster":
+        # The most representative frame of the first 100
+        return "thumbnail=100", ["-frames:v", "1", "-q:v", "2"]
+    if artifact == "sprite":
+        every = max(round(sprite_interval * fps), 1)
+        return (
+            f"select='not(mod(n\\,{every}))',scale={sprite_tile_width}:-2,"
+            f"tile={sprite_columns}x{sprite_rows}",
+            ["-q:v", "3"],
+        )
+    if artifact == "preview":
+        return (
+            f"fps={preview_fps},scale=-2:{preview_height}",
+            ["-t", str(preview_seconds), "-c:v", "libx264", "-preset", "ultrafast"]
+            + ["-crf", "30", "-an"],
+        )
+    raise ValueError(f"Invalid artifact: {artifact}")
+
+
+def get_extra_output_paths(output_path: str) -> List[str]:
+    """
+    Get the paths of the files the grid encode writes besides the main output.
+
+    Args:
+        output_path (str): The path of the main output video file.
+
+    Returns:
+        List[str]: The paths of the renditions and artifacts.
+    """
+    return [get_rendition_path(output_path, r) for r in output_renditions] + [
+        get_artifact_path(output_path, artifact) for artifact in output_artifacts
+    ]
+
+
+def build_extra_outputs(
+    output_path: str, fps: float, audio_map: List[str], audio_output: List[str]
+) -> Tuple[str, str, List[str], List[str]]:
+    """
+    Create the graph branches and output options of the renditions and artifacts.
+
+    The stacked frames ('[vstack]') are split once per rendition and artifact, and
+    every branch is scaled (or sampled) and encoded as its own output of the same
+    ffmpeg process, so the inputs are decoded and composited only once. A mixed
+    track ('[aout]') is split for the renditions the same way; input audio streams
+    are mapped to every rendition directly. Artifacts have no audio.
+
+    Args:
+        output_path (str): The path of the main output video file.
+        fps (float): The output frame rate.
+        audio_map (List[str]): The audio -map option of the main output.
+        audio_output (List[str]): The audio output options of the main output.
+
+    Returns:
+        Tuple[str, str, List[str], List[str]]: The filters appended to the graph, the
+        video label and audio -map option of the main output, and the options of the
+        extra outputs appended after the main output. Without renditions and
+        artifacts, nothing changes ("", "vstack", audio_map, []).
+    """
+    if not output_renditions and not output_artifacts:
+        return "", "vstack", audio_map, []
+
+    count = len(output_renditions)
+    filters = f"; [vstack]split={count + len(output_artifacts) + 1}[vmain]"
+    filters += "".join(f"[vr{i}]" for i in range(count))
+    filters += "".join(f"[v{artifact}]" for artifact in output_artifacts)
+    for i, rendition in enumerate(output_renditions):
+        size = str(rendition["size"])
+        scale = f"-2:{size[:-1]}" if size.endswith("p") else size.replace("x", ":")
+        filters += f"; [vr{i}]scale={scale}[r{i}]"
+    split_audio = count > 0 and audio_map == ["-map", "[aout]"]
+    if split_audio:
+        filters += f"; [aout]asplit={count + 1}[amain]"
+        filters += "".join(f"[ar{i}]" for i in range(count))
+
+    outputs: List[str] = []
+    for i, rendition in enumerate(output_renditions):
+        bitrate = str(rendition["bitrate"] or "")
+        bitrate_options = (
+            ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate]
+            if bitrate
+            else []
+        )
+        rendition_audio_map = ["-map", f"[ar{i}]"] if split_audio else audio_map
+        outputs += [
+            "-map",
+            f"[r{i}]",
+            *rendition_audio_map,
+            *build_encoder_options(str(rendition["profile"]), fps),
+            *bitrate_options,
+            *audio_output,
+            "-threads",
+            str(encoder_threads or os.cpu_count()),
+            get_rendition_path(output_path, rendition),
+        ]
+    for artifact in output_artifacts:
+        artifact_filters, artifact_options = build_artifact_output(artifact, fps)
+        filters += f"; [v{artifact}]{artifact_filters}[{artifact}]"
+        outputs += [
+            "-map",
+            f"[{artifact}]",
+            *artifact_options,
+            get_artifact_path(output_path, artifact),
+        ]
+    return filters, "vmain", ["-map", "[amain]"] if split_audio else audio_map, outputs
+
+
+def create_ffmpeg_command_v1(
+    input_files: list[str],
+    output_path: str,
+    match_input_resolution_flag: bool,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    probe_files: Optional[list[str]] = None,
+    preset: Optional[str] = None,
+) -> List[str]:
+    """
+    Create an advanced ffmpeg command to merge multiple videos into a grid layout with sophisticated audio mixing.
+
+    This function generates an ffmpeg command that combines multiple input videos
+    into a single output video with a grid layout. It scales all input videos to the
+    same resolution, stacks them into a grid, and applies a sophisticated audio mixing process.
+    The command uses the 'ultrafast' preset of the libx264 codec for rapid encoding,
+    prioritizing speed while maintaining high audio quality and proper frame rate.
+
+    Features:
+    - Scales all input videos to the same size without maintaining aspect ratio
+    - Converts every input to the grid frame rate chosen by output_fps_policy and
+      max_output_fps (see get_output_fps)
+    - Arranges videos in a grid layout based on the square root of the number of input files
+    - Applies volume normalization to each input audio stream for consistent audio levels
+    - Uses a sophisticated audio mixing process with dropout transition and volume adjustment
+    - Enhances audio clarity and reduces distortion in the final output
+    - Balances audio levels effectively across all inputs
+    - Uses libx264 codec with 'ultrafast' preset for fast encoding
+    - Optionally matches the output resolution to the combined input resolutions if specified
+
+    Args:
+        input_files (list[str]): A list of paths to input video files.
+        output_path (str): The path for the output video file.
+        match_input_resolution_flag (bool): If True, the output resolution matches
+                                            the combined input video resolutions; otherwise,
+                                            it uses the resolution of the first input video.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+        duration (Optional[float]): If set, at most this many seconds of every input are read.
+        probe_files (Optional[list[str]]): The files the resolution and frame rate are read
+                                           from, in the same order as input_files. Defaults
+                                           to input_files.
+        preset (Optional[str]): The x264/x265 preset to use instead of the default one.
+
+    Returns:
+        List[str]: The ffmpeg argv with advanced video layout and audio processing.
+
+    Note:
+        This function prioritizes speed in video processing and quality in audio output,
+        while maintaining smooth playback with proper frame rate handling.
+    """
+    if not input_files:
+        return []
+    probe_files = probe_files or input_files
+
+    video_size = get_video_size(probe_files[0])
+    if video_size is None:
+        return []
+
+    fps = get_output_fps(probe_files)
+    if fps is None:
+        fps = 30.0  # Default to 30fps if unable to detect
+
+    video_width, video_height = video_size
+
+    N = len(input_files)
+    sqrt_N = int(math.sqrt(N))
+
+    if match_input_resolution_flag:
+        output_width = video_width * sqrt_N
+        output_height = video_height * sqrt_N
+    else:
+        output_width = video_width
+        output_height = video_height
+
+    unique_files, input_indexes = get_unique_inputs(input_files, probe_files)
+    mix_tiles, audio_map, audio_output = build_audio_options(
+        get_audio_tiles(probe_files), input_indexes
+    )
+    filter_complex = build_grid_filter_complex(
+        N,
+        video_width,
+        video_height,
+        fps,
+        input_indexes,
+        get_image_inputs(unique_files),
+        get_convert_inputs(probe_files, input_indexes),
+        mix_tiles,
+        mix_tiles is not None,
+        get_audio_gains(unique_files),
+    )
+
+    extra_filters, video_label, main_audio_map, extra_outputs = build_extra_outputs(
+        output_path, fps, audio_map, audio_output
+    )
+
+    return [
+        "ffmpeg",
+        "-y",
+        *build_input_options(unique_files, start, duration),
+        "-filter_complex",
+        f"{filter_complex}{extra_filters}",
+        "-map",
+        f"[{video_label}]",
+        *main_audio_map,
+        *build_encoder_options("v1", fps, preset),
+        *audio_output,
+        "-threads",
+        str(encoder_threads or os.cpu_count()),
+        "-loglevel",
+        ffmpeg_loglevel,
+        "-s",
+        f"{output_width}x{output_height}",
+        output_path,
+        *extra_outputs,
+    ]
+
+
+def create_ffmpeg_command_v2(
+    input_files: list[str],
+    output_path: str,
+    match_input_resolution_flag: bool,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    probe_files: Optional[list[str]] = None,
+    preset: Optional[str] = None,
+) -> List[str]:
+    """
+    Create an ffmpeg command to merge multiple videos into a grid layout with balanced efficiency and quality.
+
+    This function generates an ffmpeg command that combines multiple input videos
+    into a single output video with a grid layout. It scales all input videos to the
+    same resolution, stacks them into a grid, and applies sophisticated audio mixing.
+    The command balances encoding efficiency and output quality, prioritizing file size
+    reduction while maintaining good visual and audio quality and proper frame rate.
+
+    Features:
+    - Scales all input videos to the same size without maintaining aspect ratio
+    - Converts every input to the grid frame rate chosen by output_fps_policy and
+      max_output_fps (see get_output_fps)
+    - Arranges videos in a grid layout based on the square root of the number of input files
+    - Applies volume normalization to each input audio stream for consistent audio levels
+    - Uses a sophisticated audio mixing process with dropout transition and volume adjustment
+    - Enhances audio clarity and reduces distortion in the final output
+    - Balances audio levels effectively across all inputs
+    - Uses libx264 codec with 'medium' preset for a balance of encoding speed and compression efficiency
+    - Applies Constant Rate Factor (CRF) for efficient size/quality balance
+    - Optionally matches the output resolution to the combined input resolutions if specified
+
+    Args:
+        input_files (list[str]): A list of paths to input video files.
+        output_path (str): The path for the output video file.
+        match_input_resolution_flag (bool): If True, the output resolution matches
+                                            the combined input video resolutions; otherwise,
+                                            it uses the resolution of the first input video.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+        duration (Optional[float]): If set, at most this many seconds of every input are read.
+        probe_files (Optional[list[str]]): The files the resolution and frame rate are read
+                                           from, in the same order as input_files. Defaults
+                                           to input_files.
+        preset (Optional[str]): The x264/x265 preset to use instead of the default one.
+
+    Returns:
+        List[str]: The ffmpeg argv with balanced video and audio processing.
+
+    Note:
+        This function aims to produce smaller file sizes compared to the fastest encoding
+        options, while still maintaining good visual quality, audio clarity, and smooth playback.
+    """
+    if not input_files:
+        return []
+    probe_files = probe_files or input_files
+
+    video_size = get_video_size(probe_files[0])
+    if video_size is None:
+        return []
+
+    fps = get_output_fps(probe_files)
+    if fps is None:
+        fps = 30.0  # Default to 30fps if unable to detect
+
+    video_width, video_height = video_size
+
+    N = len(input_files)
+    sqrt_N = int(math.sqrt(N))
+
+    if match_input_resolution_flag:
+        output_width = video_width * sqrt_N
+        output_height = video_height * sqrt_N
+    else:
+        output_width = video_width
+        output_height = video_height
+
+    unique_files, input_indexes = get_unique_inputs(input_files, probe_files)
+    mix_tiles, audio_map, audio_output = build_audio_options(
+        get_audio_tiles(probe_files), input_indexes
+    )
+    filter_complex = build_grid_filter_complex(
+        N,
+        video_width,
+        video_height,
+        fps,
+        input_indexes,
+        get_image_inputs(unique_files),
+        get_convert_inputs(probe_files, input_indexes),
+        mix_tiles,
+        mix_tiles is not None,
+        get_audio_gains(unique_files),
+    )
+
+    extra_filters, video_label, main_audio_map, extra_outputs = build_extra_outputs(
+        output_path, fps, audio_map, audio_output
+    )
+
+    return [
+        "ffmpeg",
+        "-y",
+        *build_input_options(unique_files, start, duration),
+        "-filter_complex",
+        f"{filter_complex}{extra_filters}",
+        "-map",
+        f"[{video_label}]",
+        *main_audio_map,
+        *build_encoder_options("v2", fps, preset),
+        *audio_output,
+        "-threads",
+        str(encoder_threads or os.cpu_count()),
+        "-loglevel",
+        ffmpeg_loglevel,
+        "-s",
+        f"{output_width}x{output_height}",
+        output_path,
+        *extra_outputs,
+    ]
+
+
+def create_gpu_ffmpeg_command(
+    input_files: list[str],
+    output_path: str,
+    match_input_resolution_flag: bool,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    probe_files: Optional[list[str]] = None,
+) -> List[str]:  # pragma: no cover
+    if not input_files:
+        return []
+    probe_files = probe_files or input_files
+
+    video_size = get_video_size(probe_files[0])
+    if video_size is None:
+        return []
+
+    fps = get_output_fps(probe_files)
+    if fps is None:
+        fps = 30.0  # Default to 30fps if unable to detect
+
+    video_width, video_height = video_size
+
+    N = len(input_files)
+    sqrt_N = int(math.sqrt(N))
+
+    if match_input_resolution_flag:
         output_width = video_width * sqrt_N
         output_height = video_height * sqrt_N
     else:
-        output_width = video_width
-        output_height = video_height
+        output_width = video_width
+        output_height = video_height
+
+    unique_files, input_indexes = get_unique_inputs(input_files, probe_files)
+    mix_tiles, audio_map, audio_output = build_audio_options(
+        get_audio_tiles(probe_files), input_indexes
+    )
+    filter_complex = build_grid_filter_complex(
+        N,
+        video_width,
+        video_height,
+        fps,
+        input_indexes,
+        get_image_inputs(unique_files),
+        get_convert_inputs(probe_files, input_indexes),
+        mix_tiles,
+        mix_tiles is not None,
+        get_audio_gains(unique_files),
+    )
+
+    extra_filters, video_label, main_audio_map, extra_outputs = build_extra_outputs(
+        output_path, fps, audio_map, audio_output
+    )
+
+    return [
+        "ffmpeg",
+        "-y",
+        *build_input_options(unique_files, start, duration),
+        "-filter_complex",
+        f"{filter_complex}{extra_filters}",
+        "-map",
+        f"[{video_label}]",
+        *main_audio_map,
+        *build_encoder_options("gpu", fps),
+        *audio_output,
+        "-threads",
+        str(encoder_threads or os.cpu_count()),
+        "-loglevel",
+        ffmpeg_loglevel,
+        "-s",
+        f"{output_width}x{output_height}",
+        output_path,
+        *extra_outputs,
+    ]
+
+
+def create_ffmpeg_command(
+    input_files: list[str],
+    output_path: str,
+    match_input_resolution_flag: bool,
+    cmd_version: Optional[str] = None,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    probe_files: Optional[list[str]] = None,
+    preset: Optional[str] = None,
+) -> List[str]:
+    """
+    Create the grid merge command for the selected ffmpeg command version.
+
+    Args:
+        input_files (list[str]): A list of paths to input video files.
+        output_path (str): The path for the output video file.
+        match_input_resolution_flag (bool): Passed through to the version specific builder.
+        cmd_version (Optional[str]): "v1", "v2" or "gpu". If None, the module level
+                                     ffmpeg_cmd_version is used.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+        duration (Optional[float]): If set, at most this many seconds of every input are read.
+        probe_files (Optional[list[str]]): The files the resolution and frame rate are read
+                                           from. Defaults to input_files.
+        preset (Optional[str]): The x264/x265 preset overriding the default of the version.
+
+    Returns:
+        List[str]: The ffmpeg argv.
+
+    Raises:
+        ValueError: If the command version is unknown, or a preset is given for the
+                    gpu version.
+    """
+    cmd_version = cmd_version or ffmpeg_cmd_version
+    if cmd_version == "v1":
+        return create_ffmpeg_command_v1(
+            input_files,
+            output_path,
+            match_input_resolution_flag,
+            start,
+            duration,
+            probe_files,
+            preset,
+        )
+    elif cmd_version == "v2":
+        return create_ffmpeg_command_v2(
+            input_files,
+            output_path,
+            match_input_resolution_flag,
+            start,
+            duration,
+            probe_files,
+            preset,
+        )
+    elif cmd_version == "gpu":  # pragma: no cover
+        if preset:
+            raise ValueError(
+                "Encoder presets are only supported by the v1 and v2 versions"
+            )
+        return create_gpu_ffmpeg_command(
+            input_files,
+            output_path,
+            match_input_resolution_flag,
+            start,
+            duration,
+            probe_files,
+        )
+    raise ValueError(f"Invalid ffmpeg_cmd_version: {cmd_version}")
+
+
+def get_proxy_path(output_path: str) -> str:
+    """
+    Get the path of the proxy render of an output file.
+
+    Args:
+        output_path (str): The path of the output video file.
+
+    Returns:
+        str: The output path with '_proxy' appended to the file name.
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_proxy{ext}"
+
+
+def create_proxy_command(
+    input_files: list[str], output_path: str, start: Optional[float] = None
+) -> List[str]:
+    """
+    Create an ffmpeg command rendering a small, short proxy of the grid.
+
+    The proxy is made from the input videos directly instead of the target
+    videos: every input is looped endlessly with '-stream_loop -1' and read for
+    proxy_seconds only, so nothing has to be probed, concatenated or linked first.
+    The tiles are proxy_tile_width wide (keeping the aspect ratio of the first
+    input) at proxy_fps, without audio, and encoded with the 'ultrafast' preset.
+
+    Args:
+        input_files (list[str]): The input videos in tile order.
+        output_path (str): The path for the proxy video file.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+
+    Returns:
+        List[str]: The ffmpeg argv, or [] if the inputs cannot be probed.
+    """
+    if not input_files:
+        return []
+    video_size = get_video_size(input_files[0])
+    if video_size is None:
+        return []
+    tile_width = proxy_tile_width
+    tile_height = max(round(tile_width * video_size[1] / video_size[0] / 2) * 2, 2)
+
+    unique_files, input_indexes = get_unique_inputs(input_files)
+    image_inputs = get_image_inputs(unique_files)
+    seek = ["-stream_loop", "-1"] + (["-ss", str(start)] if start else [])
+    seek += ["-t", str(proxy_seconds)]
+    input_options: List[str] = []
+    for index, input_file in enumerate(unique_files):
+        input_options += [] if index in image_inputs else seek
+        input_options += ["-i", input_file]
+    filter_complex = build_grid_filter_complex(
+        len(input_files),
+        tile_width,
+        tile_height,
+        proxy_fps,
+        input_indexes,
+        image_inputs,
+        get_convert_inputs(input_files, input_indexes),
+        audio=False,
+    )
+    return [
+        "ffmpeg",
+        "-y",
+        *input_options,
+        "-filter_complex",
+        filter_complex,
+        "-map",
+        "[vstack]",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-crf",
+        "30",
+        "-r",
+        str(proxy_fps),
+        "-an",
+        "-t",
+        str(proxy_seconds),
+        "-loglevel",
+        ffmpeg_loglevel,
+        output_path,
+    ]
+
+
+def get_block_ranges(grid_size: int, block_size: int) -> List[Tuple[int, int]]:
+    """
+    Split the rows (or columns) of a grid into blocks.
+
+    Args:
+        grid_size (int): The number of rows of the grid.
+        block_size (int): The number of rows of a block. The last block may be smaller.
+
+    Returns:
+        List[Tuple[int, int]]: The first row and the number of rows of each block.
+    """
+    return [
+        (first, min(block_size, grid_size - first))
+        for first in range(0, grid_size, block_size)
+    ]
+
+
+def build_stack_filter(
+    labels: List[str], direction: str, output: str, shortest: bool = False
+) -> str:
+    """
+    Create an hstack/vstack filter, or a null filter for a single input.
+
+    Args:
+        labels (List[str]): The labels of the stacked streams.
+        direction (str): "hstack" or "vstack".
+        output (str): The label of the output stream.
+        shortest (bool): If True, the stack ends with its shortest input.
+
+    Returns:
+        str: The filter followed by '; '.
+    """
+    inputs = "".join([f"[{label}]" for label in labels])
+    if len(labels) == 1:
+        return f"{inputs}null[{output}]; "
+    options = ":shortest=1" if shortest else ""
+    return f"{inputs}{direction}=inputs={len(labels)}{options}[{output}]; "
+
+
+def build_block_filter_complex(
+    rows: int,
+    cols: int,
+    video_width: int,
+    video_height: int,
+    fps: float,
+    input_indexes: Optional[List[int]] = None,
+    image_inputs: Optional[List[int]] = None,
+    convert_inputs: Optional[List[int]] = None,
+    audio_tiles: Optional[List[int]] = None,
+    audio: bool = True,
+    audio_gains: Optional[Dict[int, float]] = None,
+) -> str:
+    """
+    Create the filter graph that stacks rows x cols inputs into one block.
+
+    The audio of the block is the sum of its inputs, like in build_grid_filter_complex,
+    so summing the blocks again gives the same mix as a single pass.
+
+    Args:
+        rows (int): The number of tile rows of the block.
+        cols (int): The number of tile columns of the block.
+        video_width (int): The width every tile is scaled to.
+        video_height (int): The height every tile is scaled to.
+        fps (float): The frame rate every tile is converted to.
+        input_indexes (Optional[List[int]]): The input index of every tile. Defaults to
+                                             one input per tile.
+        image_inputs (Optional[List[int]]): The indexes of the still image inputs.
+        convert_inputs (Optional[List[int]]): The indexes of the inputs to convert to
+                                              target_pix_fmt.
+        audio_tiles (Optional[List[int]]): The tiles mixed into '[aout]'. Defaults to
+                                           all tiles.
+        audio (bool): If False, the graph has no audio output.
+        audio_gains (Optional[Dict[int, float]]): The gain in dB of every balanced input.
+
+    Returns:
+        str: The filter graph with the '[vstack]' video and '[aout]' audio outputs.
+    """
+    N = rows * cols
+    if audio_tiles is None:
+        audio_tiles = list(range(N))
+    video_filters, audio_filters = build_tile_filters(
+        input_indexes or list(range(N)),
+        video_width,
+        video_height,
+        fps,
+        image_inputs,
+        convert_inputs,
+        audio_tiles if audio else [],
+        audio_gains,
+    )
+    shortest = bool(image_inputs)
+    filter_complex = video_filters
+    for i in range(rows):
+        filter_complex += build_stack_filter(
+            [f"v{i * cols + j}" for j in range(cols)], "hstack", f"row{i}", shortest
+        )
+    filter_complex += build_stack_filter(
+        [f"row{i}" for i in range(rows)], "vstack", "vstack", shortest
+    )
+    if not audio:
+        return filter_complex[: -len("; ")]
+    filter_complex += audio_filters
+    filter_complex += build_audio_mix([f"a{tile}" for tile in audio_tiles], shortest)
+    return filter_complex
+
+
+def create_hierarchical_ffmpeg_commands(
+    input_files: List[str],
+    output_path: str,
+    match_input_resolution_flag: bool,
+    block_dir: str,
+    block_size: int,
+    cmd_version: Optional[str] = None,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    preset: Optional[str] = None,
+    intermediate: str = "fifo",
+) -> Tuple[List[List[str]], List[str], List[str]]:
+    """
+    Create the commands that composite a large grid in blocks.
+
+    Every block of up to block_size x block_size tiles is stacked by its own ffmpeg
+    process, so no process opens more than block_size^2 inputs. The final process
+    only stacks the blocks (without scaling) and encodes the output with the
+    encoder options of the command version.
+
+    Blocks are written as uncompressed NUT streams for FIFOs ("fifo"), or as
+    lossless ultrafast libx264 Matroska files ("file"). Audio is kept as float PCM
+    so the block sums do not clip before the final mix. The single heard tile of
+    the "single" and "copy" audio strategies bypasses the blocks: the final process
+    maps the audio of its input file, so "copy" stream copies it.
+
+    Args:
+        input_files (List[str]): A list of paths to input video files.
+        output_path (str): The path for the output video file.
+        match_input_resolution_flag (bool): If True, the output resolution matches
+                                            the combined input video resolutions.
+        block_dir (str): The folder the blocks (FIFOs or files) are created in.
+        block_size (int): The number of tile rows and columns of a block.
+        cmd_version (Optional[str]): The ffmpeg command version.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+        duration (Optional[float]): If set, at most this many seconds of every input are read.
+        preset (Optional[str]): The x264/x265 preset overriding the default of the version.
+        intermediate (str): "fifo" or "file".
+
+    Returns:
+        Tuple[List[List[str]], List[str], List[str]]: The argv of the block commands,
+        the block paths and the argv of the final command. All are empty if the size
+        of the first input cannot be read.
+    """
+    video_size = get_video_size(input_files[0])
+    if video_size is None:
+        return [], [], []
+    fps = get_output_fps(input_files) or 30.0
+    video_width, video_height = video_size
+    grid_size = int(math.sqrt(len(input_files)))
+
+    if intermediate == "fifo":
+        block_options = ["-c:v", "rawvideo", "-c:a", "pcm_f32le", "-f", "nut"]
+        block_ext = ".nut"
+    else:
+        block_options = ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0"]
+        block_options += ["-c:a", "pcm_f32le", "-f", "matroska"]
+        block_ext = ".mkv"
+
+    audio_tiles = get_audio_tiles(input_files)
+    direct_audio = audio_strategy in ("single", "copy") and bool(audio_tiles)
+    mixed_tiles = [] if direct_audio else audio_tiles
+    block_ranges = get_block_ranges(grid_size, block_size)
+    block_commands: List[List[str]] = []
+    block_paths: List[str] = []
+    audio_blocks = []
+    for first_row, rows in block_ranges:
+        for first_col, cols in block_ranges:
+            block_tiles = [
+                row * grid_size + col
+                for row in range(first_row, first_row + rows)
+                for col in range(first_col, first_col + cols)
+            ]
+            block_files = [input_files[tile] for tile in block_tiles]
+            # Blocks without heard tiles have no audio stream
+            block_audio_tiles = [
+                local for local, tile in enumerate(block_tiles) if tile in mixed_tiles
+            ]
+            if block_audio_tiles:
+                audio_blocks.append(len(block_paths))
+            block_path = os.path.join(
+                block_dir, f"block_{first_row}_{first_col}{block_ext}"
+            )
+            unique_files, input_indexes = get_unique_inputs(block_files)
+            image_inputs = get_image_inputs(unique_files)
+            filter_complex = build_block_filter_complex(
+                rows,
+                cols,
+                video_width,
+                video_height,
+                fps,
+                input_indexes,
+                image_inputs,
+                get_convert_inputs(block_files, input_indexes),
+                block_audio_tiles,
+                bool(block_audio_tiles),
+                get_audio_gains(unique_files),
+            )
+            # A block of still images only would never end
+            block_length = (
+                ["-t", str(duration)]
+                if duration is not None and len(image_inputs) == len(unique_files)
+                else []
+            )
+            block_audio_map = ["-map", "[aout]"] if block_audio_tiles else []
+            block_commands.append(
+                [
+                    "ffmpeg",
+                    "-y",
+                    *build_input_options(unique_files, start, duration),
+                    "-filter_complex",
+                    filter_complex,
+                    "-map",
+                    "[vstack]",
+                    *block_audio_map,
+                    *block_options,
+                    *block_length,
+                    "-loglevel",
+                    ffmpeg_loglevel,
+                    block_path,
+                ]
+            )
+            block_paths.append(block_path)
+
+    B = len(block_ranges)
+    filter_complex = ""
+    for i in range(B):
+        filter_complex += build_stack_filter(
+            [f"{i * B + j}:v" for j in range(B)], "hstack", f"row{i}"
+        )
+    filter_complex += build_stack_filter(
+        [f"row{i}" for i in range(B)], "vstack", "vstack"
+    )
+    audio_input: List[str] = []
+    audio_map: List[str] = []
+    if audio_strategy == "none":
+        filter_complex = filter_complex[: -len("; ")]
+        audio_output = ["-an"]
+    elif direct_audio:
+        filter_complex = filter_complex[: -len("; ")]
+        audio_file = input_files[audio_tiles[0]]
+        audio_input = build_input_options([audio_file], start, duration)
+        _, audio_map, audio_output = build_audio_options([0], [len(block_paths)])
+    else:
+        filter_complex += build_audio_mix([f"{i}:a" for i in audio_blocks])
+        audio_map = ["-map", "[aout]"]
+        audio_output = [] if audio_blocks else ["-shortest"]
+
+    if match_input_resolution_flag:
+        output_width = video_width * grid_size
+        output_height = video_height * grid_size
+    else:
+        output_width = video_width
+        output_height = video_height
+
+    extra_filters, video_label, main_audio_map, extra_outputs = build_extra_outputs(
+        output_path, fps, audio_map, audio_output
+    )
+    final_command = [
+        "ffmpeg",
+        "-y",
+        *build_input_options(block_paths),
+        *audio_input,
+        "-filter_complex",
+        f"{filter_complex}{extra_filters}",
+        "-map",
+        f"[{video_label}]",
+        *main_audio_map,
+        *build_encoder_options(cmd_version or ffmpeg_cmd_version, fps, preset),
+        *audio_output,
+        "-threads",
+        str(encoder_threads or os.cpu_count()),
+        "-loglevel",
+        ffmpeg_loglevel,
+        "-s",
+        f"{output_width}x{output_height}",
+        output_path,
+        *extra_outputs,
+    ]
+    return block_commands, block_paths, final_command
+
+
+def parse_ffmpeg_progress(
+    progress: Dict[str, str], duration: Optional[float]
+) -> Dict[str, float]:
+    """
+    Convert one block of ffmpeg '-progress' key=value output into numbers.
+
+    Args:
+        progress (Dict[str, str]): The key/value pairs reported since the last 'progress=' line.
+        duration (Optional[float]): The expected output duration in seconds, used to
+                                    compute the completed fraction.
+
+    Returns:
+        Dict[str, float]: 'out_time' (seconds encoded), 'speed' (multiple of realtime),
+        'fraction' (0.0 - 1.0) and 'done' (1.0 once ffmpeg reports progress=end).
+    """
+    out_time_us = progress.get("out_time_us", progress.get("out_time_ms", ""))
+    try:
+        out_time = max(int(out_time_us), 0) / 1_000_000
+    except ValueError:
+        out_time = 0.0
+    try:
+        speed = float(progress.get("speed", "").rstrip("x"))
+    except ValueError:
+        speed = 0.0
+    done = progress.get("progress") == "end"
+    if done:
+        fraction = 1.0
+    elif duration:
+        fraction = min(out_time / duration, 1.0)
+    else:
+        fraction = 0.0
+    return {
+        "out_time": out_time,
+        "speed": speed,
+        "fraction": fraction,
+        "done": 1.0 if done else 0.0,
+    }
+
+
+def run_ffmpeg_command(
+    ffmpeg_command: List[str],
+    duration: Optional[float] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+) -> int:
+    """
+    Run an ffmpeg command, optionally reporting encode progress.
+
+    The argv is run without a shell (see crn.run_command); its process group is
+    killed after ffmpeg_timeout seconds. Without a callback the command is run
+    exactly as given. With a callback,
+    '-progress pipe:1' is added so ffmpeg writes machine readable progress blocks
+    to stdout, and each block is passed to the callback as parsed by
+    parse_ffmpeg_progress.
+
+    Args:
+        ffmpeg_command (List[str]): The argv created by create_ffmpeg_command.
+        duration (Optional[float]): The expected output duration in seconds.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Called for every
+                                                                          progress block.
+
+    Returns:
+        int: The exit status of ffmpeg (negative if it was killed).
+    """
+    if progress_callback is None or ffmpeg_command[:1] != ["ffmpeg"]:
+        return crn.run_command(ffmpeg_command, timeout=ffmpeg_timeout)
+
+    command = ["ffmpeg", "-progress", "pipe:1", "-nostats", *ffmpeg_command[1:]]
+    progress: Dict[str, str] = {}
+
+    def on_output(line: str) -> None:
+        nonlocal progress
+        key, _, value = line.strip().partition("=")
+        progress[key] = value
+        if key == "progress":
+            progress_callback(parse_ffmpeg_progress(progress, duration))
+            progress = {}
+
+    return crn.run_command(command, timeout=ffmpeg_timeout, on_output=on_output)
+
+
+def release_fifo(fifo_path: str, done: threading.Event) -> None:
+    """
+    Unblock a reader waiting for a FIFO whose writer has failed.
+
+    Opening the FIFO for writing lets the blocked open() of the reader return,
+    and closing it again gives the reader an end of file.
+
+    Args:
+        fifo_path (str): The path of the FIFO.
+        done (threading.Event): Set when the reader has exited.
+    """
+    while not done.is_set():
+        try:
+            os.close(os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+            return
+        except OSError:
+            # No reader has opened the FIFO yet
+            done.wait(0.1)
+
+
+def run_hierarchical_ffmpeg_commands(
+    block_commands: List[List[str]],
+    block_paths: List[str],
+    final_command: List[str],
+    duration: Optional[float] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+    intermediate: str = "fifo",
+) -> int:
+    """
+    Run the commands created by create_hierarchical_ffmpeg_commands.
+
+    With FIFOs all block processes run concurrently and stream into the final
+    process. A failed block releases its FIFO, so the final process fails instead
+    of waiting forever, and a failed final process stops the blocks. With files
+    the blocks are encoded first, by hierarchical_workers processes at a time.
+
+    Args:
+        block_commands (List[List[str]]): The argv of the commands writing the blocks.
+        block_paths (List[str]): The paths of the blocks.
+        final_command (List[str]): The argv stacking the blocks into the output.
+        duration (Optional[float]): The expected output duration in seconds.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Receives the
+                                                                          progress of the
+                                                                          final process.
+        intermediate (str): "fifo" or "file".
+
+    Returns:
+        int: The first non-zero exit status of ffmpeg, or 0 on success.
+    """
+    if intermediate != "fifo":
+        with ThreadPoolExecutor(max_workers=hierarchical_workers) as executor:
+            returncodes = list(executor.map(run_ffmpeg_command, block_commands))
+        failed = next((code for code in returncodes if code != 0), 0)
+        if failed:
+            return failed
+        return run_ffmpeg_command(final_command, duration, progress_callback)
+
+    for block_path in block_paths:
+        os.mkfifo(block_path)
+    processes = [crn.start_command(command) for command in block_commands]
+    done = threading.Event()
+
+    def watch(process: subprocess.Popen[str], block_path: str) -> None:
+        if process.wait() != 0:
+            release_fifo(block_path, done)
+
+    watchers = [
+        threading.Thread(target=watch, args=(process, block_path), daemon=True)
+        for process, block_path in zip(processes, block_paths)
+    ]
+    for watcher in watchers:
+        watcher.start()
+    try:
+        returncode = run_ffmpeg_command(final_command, duration, progress_callback)
+    except BaseException:
+        for process in processes:
+            crn.kill_command(process)
+        raise
+    finally:
+        done.set()
+    if returncode != 0:
+        for process in processes:
+            crn.kill_command(process)
+    returncodes = [process.wait() for process in processes]
+    for watcher in watchers:
+        watcher.join()
+    return returncode or next((code for code in returncodes if code != 0), 0)
+
+
+@contextmanager
+def prefetching(
+    input_files: List[str],
+    start: Optional[float] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+) -> Iterator[Optional[Callable[[Dict[str, float]], None]]]:
+    """
+    Prefetch the inputs of an encode while the context is open, if prefetch_inputs is set.
+
+    Args:
+        input_files (List[str]): The paths of the inputs read by the encode.
+        start (Optional[float]): The position (seconds) the inputs are read from.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Receives encode progress.
+
+    Yields:
+        Optional[Callable[[Dict[str, float]], None]]: The progress callback to pass to
+        the encode, which also moves the prefetcher along.
+    """
+    if not prefetch_inputs:
+        yield progress_callback
+        return
+
+    with pft.Prefetcher(
+        [file for file in input_files if not is_image_file(file)],
+        get_video_length_ffmpeg,
+        prefetch_window_bytes,
+        workers=prefetch_workers,
+    ) as prefetcher:
+
+        def on_progress(progress: Dict[str, float]) -> None:
+            prefetcher.update((start or 0.0) + progress["out_time"])
+            if progress_callback:
+                progress_callback(progress)
+
+        yield on_progress
+
+
+def encode_grid(
+    input_files: List[str],
+    output_path: str,
+    length: Optional[float],
+    cmd_version: Optional[str] = None,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    preset: Optional[str] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+) -> int:
+    """
+    Encode the grid in one ffmpeg process, or hierarchically for large grids.
+
+    Grids with more rows than hierarchical_block_size are composited in blocks
+    (see create_hierarchical_ffmpeg_commands), so the memory and the open files of
+    every process are bounded by the block size instead of the number of tiles.
+
+    With prefetch_inputs the inputs are read into the page cache ahead of ffmpeg
+    (see prefetching). With hierarchical_intermediate = "file" only the first
+    window of every input is prefetched, as the blocks report no progress.
+
+    Args:
+        input_files (List[str]): A list of paths to the target videos.
+        output_path (str): The path for the output video file.
+        length (Optional[float]): The expected output duration in seconds.
+        cmd_version (Optional[str]): The ffmpeg command version.
+        start (Optional[float]): If set, every input is read from this position (seconds).
+        duration (Optional[float]): If set, at most this many seconds of every input are read.
+        preset (Optional[str]): The x264/x265 preset overriding the default of the version.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Receives encode progress.
+
+    Returns:
+        int: The exit status of ffmpeg.
+    """
+    grid_size = int(math.sqrt(len(input_files)))
+    if not hierarchical_block_size or grid_size <= hierarchical_block_size:
+        ffmpeg_command = create_ffmpeg_command(
+            input_files,
+            output_path,
+            match_input_resolution_flag,
+            cmd_version,
+            start=start,
+            duration=duration,
+            preset=preset,
+        )
+        with prefetching(input_files, start, progress_callback) as callback:
+            return run_ffmpeg_command(ffmpeg_command, length, callback)
+
+    if duration is None and any(is_image_file(file) for file in input_files):
+        # Blocks holding only still images are cut at the grid length
+        duration = length
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=output_dir) as block_dir:
+        block_commands, block_paths, final_command = (
+            create_hierarchical_ffmpeg_commands(
+                input_files,
+                output_path,
+                match_input_resolution_flag,
+                block_dir,
+                hierarchical_block_size,
+                cmd_version,
+                start,
+                duration,
+                preset,
+                hierarchical_intermediate,
+            )
+        )
+        if not final_command:
+            return 1
+        print(f"Hierarchical Merge: {len(block_commands)} blocks")
+        with prefetching(input_files, start, progress_callback) as callback:
+            return run_hierarchical_ffmpeg_commands(
+                block_commands,
+                block_paths,
+                final_command,
+                length,
+                callback,
+                hierarchical_intermediate,
+            )
+
+
+def encode_segments(
+    input_files: List[str],
+    output_path: str,
+    max_length: float,
+    journal: jnl.JobJournal,
+    cmd_version: Optional[str] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+    preset_controller: Optional[psl.PresetController] = None,
+    start: Optional[float] = None,
+    keyframes: Optional[Sequence[float]] = None,
+    segment_seconds: Optional[float] = None,
+) -> None:
+    """
+    Encode the grid in time segments recorded in a journal and join them.
+
+    Every segment is encoded by its own ffmpeg run with input side seeking and
+    recorded in the journal when it completes. Segments recorded by an interrupted
+    run are skipped if their files are unchanged. The finished segments are joined
+    without re-encoding and the segment files and the journal are removed.
+
+    With a preset controller every segment is encoded with the controller's current
+    preset and its encode speed is reported back, so the remaining segments can
+    switch to a faster preset. Segments are then written as MPEG-TS, which repeats
+    the codec headers in-band, so segments of different presets can be joined.
+
+    With keyframes shared by every tile (see get_output_keyframes), the segments
+    start on them where they are close enough to the nominal boundaries (see
+    kfi.get_segment_starts). The input side seek of such a segment needs no
+    decoding up to its start.
+
+    Args:
+        input_files (List[str]): A list of paths to the target videos.
+        output_path (str): The path for the output video file.
+        max_length (float): The length of the output video in seconds.
+        journal (jnl.JobJournal): The checkpoint journal of the job.
+        cmd_version (Optional[str]): The ffmpeg command version.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Receives the
+                                                                          overall progress.
+        preset_controller (Optional[psl.PresetController]): Selects the x264/x265 preset
+                                                            of every segment.
+        start (Optional[float]): The position in the target videos (seconds) the
+                                 output starts at. Defaults to the beginning.
+        keyframes (Optional[Sequence[float]]): Keyframe timestamps on the output
+                                               timeline (see get_output_keyframes).
+        segment_seconds (Optional[float]): The segment length recorded in the journal
+                                           settings. Defaults to deadline_segment_seconds
+                                           with a preset controller and to
+                                           resume_segment_seconds otherwise.
+
+    Raises:
+        RuntimeError: If ffmpeg fails to encode a segment or to join the segments.
+    """
+    if segment_seconds is None:
+        segment_seconds = (
+            deadline_segment_seconds if preset_controller else resume_segment_seconds
+        )
+    journal.plan_segments(
+        max_length,
+        segment_seconds,
+        (
+            kfi.get_segment_starts(keyframes, max_length, segment_seconds)
+            if keyframes
+            else None
+        ),
+    )
+    base, ext = os.path.splitext(output_path)
+    part_ext = ".ts" if preset_controller else ext
+    for segment in journal.segments:
+        index = segment["index"]
+        if journal.is_segment_done(index):
+            print(f"Skip encoded segment {index + 1}/{len(journal.segments)}")
+            if preset_controller:
+                preset_controller.update(segment["duration"], 0.0)
+            continue
+
+        def on_progress(
+            progress: Dict[str, float], segment: Dict[str, float] = segment
+        ) -> None:
+            if progress_callback is None:
+                return
+            out_time = segment["start"] + progress["out_time"]
+            last = segment["index"] == len(journal.segments) - 1
+            progress_callback(
+                {
+                    **progress,
+                    "out_time": out_time,
+                    "fraction": min(out_time / max_length, 1.0),
+                    "done": progress["done"] if last else 0.0,
+                }
+            )
+
+        part_path = f"{base}.part{index:04d}{part_ext}"
+        segment_start = time.perf_counter()
+        returncode = encode_grid(
+            input_files,
+            part_path,
+            segment["duration"],
+            cmd_version,
+            start=(start or 0.0) + segment["start"],
+            duration=segment["duration"],
+            preset=preset_controller.preset if preset_controller else None,
+            progress_callback=on_progress if progress_callback else None,
+        )
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode segment {index}: {part_path}")
+        journal.record_segment(index, part_path)
+        if preset_controller:
+            preset_controller.update(
+                segment["duration"], time.perf_counter() - segment_start
+            )
+
+    part_paths = [segment["path"] for segment in journal.segments]
+    list_path = f"{base}.parts.txt"
+    with open(list_path, "w") as f:
+        f.writelines(
+            [
+                f"file {quote_concat_path(os.path.abspath(path))}\n"
+                for path in part_paths
+            ]
+        )
+    returncode = crn.run_command(
+        [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            list_path,
+            "-c",
+            "copy",
+            output_path,
+            "-loglevel",
+            ffmpeg_loglevel,
+        ],
+        timeout=ffmpeg_timeout,
+    )
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to join the segments: {list_path}")
+
+    for path in [*part_paths, list_path]:
+        os.remove(path)
+    journal.remove()
+
+
+def get_run_profile(cmd_version: Optional[str] = None) -> str:
+    """
+    Get the profile a run is recorded under in the run history.
+
+    Runs of the v1 and v2 versions encoded with libx265 are kept apart from the
+    libx264 runs ("v2-x265"), since their encode times differ.
+
+    Args:
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+
+    Returns:
+        str: The profile.
+    """
+    cmd_version = cmd_version or ffmpeg_cmd_version
+    if video_encoder == "libx265" and cmd_version in ("v1", "v2"):
+        return f"{cmd_version}-x265"
+    return cmd_version
+
+
+def get_run_parameters(
+    probe_files: List[str], max_length: float, cmd_version: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Get the job parameters stored in the run history and used by the cost model.
+
+    Args:
+        probe_files (List[str]): The videos of the grid tiles (input or target videos).
+        max_length (float): The length of the output video in seconds.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+
+    Returns:
+        Dict[str, Any]: The parameters, keyed like the run history columns.
+    """
+    grid_size = int(math.sqrt(len(probe_files)))
+    tile_width, tile_height = get_video_size(probe_files[0]) or (0, 0)
+    if match_input_resolution_flag:
+        output_width, output_height = tile_width * grid_size, tile_height * grid_size
+    else:
+        output_width, output_height = tile_width, tile_height
+    return {
+        "profile": get_run_profile(cmd_version),
+        "ffmpeg_version": get_ffmpeg_version(),
+        "cores": os.cpu_count(),
+        "grid_size": grid_size,
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+        "output_width": output_width,
+        "output_height": output_height,
+        "fps": get_output_fps(probe_files) or 30.0,
+        "duration": max_length,
+    }
+
+
+def predict_encode_time(run_parameters: Dict[str, Any]) -> Optional[float]:
+    """
+    Predict the encode time of a job with the cost model fitted on the run history.
+
+    Args:
+        run_parameters (Dict[str, Any]): The parameters created by get_run_parameters.
+
+    Returns:
+        Optional[float]: The predicted encode time in seconds, or None if the history
+        has no run with the same encoder profile.
+    """
+    try:
+        runs = rhs.load_runs(run_history_path)
+    except sqlite3.Error as e:
+        print(f"Error reading the run history {run_history_path}: {e}")
+        return None
+    return rhs.predict_encode_time(runs, run_parameters)
+
+
+def save_run_history(run: Dict[str, Any]) -> None:
+    """
+    Store a finished run in the run history if recording is enabled.
+
+    A history that cannot be written never fails the merge itself.
+
+    Args:
+        run (Dict[str, Any]): The run parameters and stage times.
+    """
+    if not record_run_history:
+        return
+    try:
+        rhs.record_run(run_history_path, run)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error writing the run history {run_history_path}: {e}")
+
+
+def calibrate_encode_speed(
+    input_files: List[str],
+    max_length: float,
+    preset: str,
+    cmd_version: Optional[str] = None,
+) -> Optional[float]:
+    """
+    Measure the encode speed of a preset with a short encode of the actual grid.
+
+    A sample of preset_calibration_seconds from the middle of the grid is encoded
+    into a temporary file, so the measurement includes decoding, scaling and
+    mixing of all tiles.
+
+    Args:
+        input_files (List[str]): A list of paths to the target videos.
+        max_length (float): The length of the output video in seconds.
+        preset (str): The x264/x265 preset to measure.
+        cmd_version (Optional[str]): The ffmpeg command version.
+
+    Returns:
+        Optional[float]: The encode speed as a multiple of realtime, or None if the
+        calibration encode failed.
+    """
+    sample = min(preset_calibration_seconds, max_length)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        calibration_start = time.perf_counter()
+        returncode = encode_grid(
+            input_files,
+            os.path.join(tmp_dir, "calibration.ts"),
+            sample,
+            cmd_version,
+            start=(max_length - sample) / 2,
+            duration=sample,
+            preset=preset,
+        )
+        elapsed = time.perf_counter() - calibration_start
+    if returncode != 0 or elapsed <= 0:
+        return None
+    print(f"Calibration Speed ({preset}): {sample / elapsed:.2f}x")
+    return sample / elapsed
+
+
+def select_encoder_preset(
+    input_files: List[str],
+    max_length: float,
+    deadline_at: Optional[float],
+    cmd_version: Optional[str] = None,
+    run_parameters: Optional[Dict[str, Any]] = None,
+    target_speed: Optional[float] = None,
+) -> psl.PresetController:
+    """
+    Select the slowest preset of video_encoder that meets a deadline or speed target.
+
+    The encode time of a preset is predicted by the run history model if the
+    history has runs of that preset, otherwise it is measured with a calibration
+    encode (see calibrate_encode_speed). The calibration counts against a deadline,
+    but not against a speed target: its clock starts with the encode.
+
+    Args:
+        input_files (List[str]): A list of paths to the target videos.
+        max_length (float): The length of the output video in seconds.
+        deadline_at (Optional[float]): The time.perf_counter() value the encode must
+                                       finish by. Ignored if target_speed is set.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+        run_parameters (Optional[Dict[str, Any]]): The parameters created by get_run_parameters.
+        target_speed (Optional[float]): Minimum encode speed as a multiple of realtime.
+
+    Returns:
+        psl.PresetController: The controller starting with the selected preset.
+    """
+    cmd_version = cmd_version or ffmpeg_cmd_version
+    profile = get_run_profile(cmd_version)
+    presets = psl.ENCODER_PRESETS[video_encoder]
+
+    def estimate(preset: str) -> Optional[float]:
+        if run_parameters:
+            predicted = predict_encode_time(
+                {**run_parameters, "profile": f"{profile}:{preset}"}
+            )
+            if predicted is not None:
+                return predicted
+        speed = calibrate_encode_speed(input_files, max_length, preset, cmd_version)
+        return max_length / speed if speed else None
+
+    if target_speed:
+        budget = max_length / target_speed
+        preset = psl.select_preset(estimate, None, presets, budget_seconds=budget)
+        deadline_at = time.perf_counter() + budget
+    else:
+        preset = psl.select_preset(estimate, deadline_at, presets)
+    print(f"Selected Encoder Preset: {preset}")
+    return psl.PresetController(
+        preset,
+        max_length,
+        deadline_at or time.perf_counter(),
+        presets,
+        relative_speed=psl.ENCODER_RELATIVE_SPEED[video_encoder],
+    )
+
+
+def get_memory_model(
+    input_files: List[str], cmd_version: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Any]]:
+    """
+    Collect the probe data and settings the memory estimate is based on.
+
+    Args:
+        input_files (List[str]): The videos of the grid tiles.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Any]]: The inputs, the
+        output and the options as expected by mbg.estimate_peak_memory.
+    """
+    cmd_version = cmd_version or ffmpeg_cmd_version
+    inputs: List[Dict[str, Any]] = []
+    for file_path in input_files:
+        width, height = get_video_size(file_path) or (0, 0)
+        inputs.append(
+            {
+                "width": width,
+                "height": height,
+                "pix_fmt": probe_video(file_path).get("pix_fmt"),
+            }
+        )
+    grid_size = int(math.sqrt(len(input_files)))
+    # Every tile is scaled to the size of the first input. If it cannot be probed,
+    # the output frames are left out of the estimate
+    tile_width, tile_height = get_video_size(input_files[0]) or (0, 0)
+    scale = grid_size if match_input_resolution_flag else 1
+    output = {
+        "width": tile_width * scale,
+        "height": tile_height * scale,
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+    }
+    options = {
+        "cores": os.cpu_count(),
+        "preset": default_encoder_presets.get(cmd_version, "ultrafast"),
+        "decoder_threads": decoder_threads,
+        "thread_queue_size": input_thread_queue_size,
+        "encoder_threads": encoder_threads,
+        "rc_lookahead": encoder_rc_lookahead,
+    }
+    return inputs, output, options
+
+
+def fit_memory_budget(
+    input_files: List[str], max_memory: int, cmd_version: Optional[str] = None
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Select the encode buffering so the estimated peak memory fits a budget.
+
+    The decoder threads, input queue size, encoder lookahead and threads are
+    returned as values of the module level settings used by the command builders.
+    As a last resort match_input_resolution_flag is turned off, so the output has
+    the resolution of one tile. No setting is changed; use module_settings to
+    apply them to one merge.
+
+    Args:
+        input_files (List[str]): The videos of the grid tiles.
+        max_memory (int): The memory budget in bytes.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+
+    Returns:
+        Tuple[Dict[str, Any], int]: The settings by module level name, and the
+        estimated peak memory in bytes with them.
+    """
+    inputs, output, options = get_memory_model(input_files, cmd_version)
+    options, fitted_output, predicted, applied = mbg.fit_memory_budget(
+        inputs, output, options, max_memory
+    )
+    settings = {
+        "decoder_threads": options["decoder_threads"],
+        "input_thread_queue_size": options["thread_queue_size"],
+        "encoder_threads": options["encoder_threads"],
+        "encoder_rc_lookahead": options["rc_lookahead"],
+    }
+    if fitted_output["width"] != output["width"]:
+        settings["match_input_resolution_flag"] = False
+
+    if applied:
+        print(f"Memory Budget Adjustments: {', '.join(applied)}")
+    if predicted > max_memory:
+        print(
+            f"Warning: the estimated peak memory ({predicted / mbg.MiB:.0f} MiB) "
+            f"exceeds the budget ({max_memory / mbg.MiB:.0f} MiB)"
+        )
+    return settings, predicted
+
+
+@contextmanager
+def module_settings(settings: Dict[str, Any]) -> Iterator[None]:
+    """
+    Set module level settings while the context is open and restore them afterwards.
+
+    Args:
+        settings (Dict[str, Any]): The values by module level name.
+    """
+    previous = {name: globals()[name] for name in settings}
+    globals().update(settings)
+    try:
+        yield
+    finally:
+        globals().update(previous)
+
+
+def apply_loudness_balance(input_folder: str, video_files: List[str]) -> None:
+    """
+    Set loudness_gains so that the mixed tiles reach loudness_target.
+
+    Inputs measured by an earlier job are read from the loudness cache; only new
+    or changed inputs are analyzed (in parallel), so repeat jobs need no extra
+    decoding pass. The gains apply to the inputs and to their target videos.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+    """
+    global loudness_gains
+
+    cache = lcs.LoudnessCache.open(loudness_cache_path)
+    paths = [
+        os.path.join(input_folder, file)
+        for file in video_files
+        if not is_image_file(file)
+    ]
+    missing = [path for path in paths if cache.get(path) is None]
+    if missing:
+        with ThreadPoolExecutor() as executor:
+            for path, loudness in zip(
+                missing, executor.map(lcs.measure_loudness, missing)
+            ):
+                if loudness is not None:
+                    cache.record(path, loudness)
+        cache.save()
+    print(
+        f"Loudness Analysis: {len(missing)} analyzed, "
+        f"{len(paths) - len(missing)} cached"
+    )
+
+    loudness_gains = {}
+    for file in video_files:
+        loudness = cache.get(os.path.join(input_folder, file))
+        if loudness is None:
+            continue
+        gain = lcs.get_gain_db(loudness, loudness_target)
+        loudness_gains[os.path.join(input_folder, file)] = gain
+        loudness_gains[get_target_video_path(input_folder, file)] = gain
+
+
+def check_input_integrity(input_folder: str, video_files: List[str]) -> None:
+    """
+    Check the inputs for corruption before the merge (see ick.check_files).
+
+    Up to integrity_check_workers inputs are checked at once in the
+    integrity_check_mode, and inputs that passed an earlier check unchanged are
+    skipped. A report line is printed for every input.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+
+    Raises:
+        ValueError: If an input is corrupt.
+    """
+    paths = [os.path.join(input_folder, file) for file in video_files]
+    results = ick.check_files(
+        paths,
+        str(integrity_check_mode),
+        ick.IntegrityCache.open(integrity_cache_path),
+        integrity_check_workers,
+    )
+    for file, path in zip(video_files, paths):
+        if path not in results:
+            status = "not checked"
+        else:
+            status = results[path] or "ok"
+        print(f"Integrity Check: {file}: {status}")
+    corrupt = [file for file, path in zip(video_files, paths) if results.get(path)]
+    if corrupt:
+        raise ValueError(f"Corrupt input files: {', '.join(corrupt)}")
+
+
+def merge_videos(
+    input_folder: str,
+    video_files: List[str],
+    output_path: str,
+    cmd_version: Optional[str] = None,
+    progress_callback: Optional[Callable[[Dict[str, float]], None]] = None,
+    resume: bool = False,
+    deadline: Optional[float] = None,
+    target_speed: Optional[float] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    directory_index: Optional[dix.DirectoryIndex] = None,
+) -> Dict[str, float]:
+    """
+    Run the merge pipeline for video files that have already been validated.
+
+    The pipeline creates the target videos, builds the ffmpeg command for the
+    requested version, encodes the grid and removes the temporary data.
+
+    A resumable job keeps a checkpoint journal next to the output file and
+    encodes the grid in segments (see encode_segments). If the job is interrupted,
+    running it again with resume=True continues after the last completed unit.
+
+    With a deadline or a target speed the x264/x265 preset is selected automatically
+    (see select_encoder_preset) and the grid is encoded in segments like a
+    resumable job, switching to faster presets if the encode falls behind.
+
+    With start and/or end only that time range of the grid is merged. The target
+    videos end at the end time, and every tile of the grid encode is read with
+    input side seeking (-ss before -i) and -t, so no frame outside the range is
+    decoded.
+
+    The output_renditions and output_artifacts are written next to the output file
+    by the same grid encode (see build_extra_outputs).
+
+    With use_result_cache the output of an identical earlier merge (see
+    get_merge_recipe) is linked or copied to output_path instead, and new outputs
+    are added to the cache.
+
+    With integrity_check_mode the inputs are checked first, so a corrupt input
+    aborts the merge before the target videos are created.
+
+    The input folder is scanned once (see dix.DirectoryIndex); the target videos
+    and concat lists the merge creates are added to the index explicitly, so the
+    grid inputs and the temporary data are found without listing the folder again.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+        output_path (str): The path for the output video file.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+        progress_callback (Optional[Callable[[Dict[str, float]], None]]): Receives encode progress.
+        resume (bool): If True, run as a resumable job and continue an interrupted run.
+        deadline (Optional[float]): Wall-clock seconds the whole merge should finish in.
+        target_speed (Optional[float]): Minimum encode speed as a multiple of realtime.
+        start (Optional[float]): The start of the merged time range in seconds.
+        end (Optional[float]): The end of the merged time range in seconds.
+        directory_index (Optional[dix.DirectoryIndex]): The index of the input folder.
+                                                        If None, the folder is scanned.
+
+    Returns:
+        Dict[str, float]: The elapsed time in seconds of each stage ('cache', 'preflight',
+                          'normalize', 'encode'). Only 'cache' is set on a cache hit.
+
+    Raises:
+        ValueError: If the time range starts after the end of the inputs, output
+                    renditions or artifacts are requested for a resumable or
+                    deadline job, a deadline job uses the gpu version, or an input
+                    fails the integrity check.
+        RuntimeError: If ffmpeg fails to encode the grid. The failed run is neither
+                      cached nor recorded in the run history.
+    """
+    merge_start = time.perf_counter()
+    stage_times: Dict[str, float] = {}
+    auto_preset = deadline is not None or target_speed is not None
+    if get_extra_output_paths(output_path) and (resume or auto_preset):
+        raise ValueError(
+            "Output renditions and artifacts cannot be combined with resumable or "
+            "deadline jobs"
+        )
+    if auto_preset and (cmd_version or ffmpeg_cmd_version) == "gpu":
+        raise ValueError(
+            "A deadline or target speed selects x264/x265 presets and cannot be "
+            "combined with the gpu version"
+        )
+    directory_index = directory_index or dix.DirectoryIndex.scan(input_folder)
+    result_cache = None
+    # Automatically selected presets depend on the machine load, so their outputs
+    # are not reused; only the main output would be restored from the cache
+    if use_result_cache and not auto_preset and not get_extra_output_paths(output_path):
+        stage_start = time.perf_counter()
+        result_cache = rcs.ResultCache.open(result_cache_dir, result_cache_max_bytes)
+        result_key = rcs.get_result_key(
+            get_merge_recipe(
+                input_folder,
+                video_files,
+                output_path,
+                cmd_version,
+                start,
+                end,
+                directory_index,
+            )
+        )
+        hit = result_cache.fetch(result_key, output_path)
+        stage_times["cache"] = time.perf_counter() - stage_start
+        if hit:
+            print(f"Result Cache Hit: {result_key}")
+            return stage_times
+
+    if integrity_check_mode:
+        stage_start = time.perf_counter()
+        check_input_integrity(input_folder, video_files)
+        stage_times["preflight"] = time.perf_counter() - stage_start
+
+    journal = None
+    # Deadline jobs use short segments, so the preset can be switched often
+    segment_seconds = (
+        deadline_segment_seconds if auto_preset else resume_segment_seconds
+    )
+    if resume or auto_preset:
+        journal = jnl.JobJournal.open(
+            jnl.get_journal_path(output_path),
+            {
+                "inputs": {
+                    file: directory_index.fingerprint(file) for file in video_files
+                },
+                "output_path": os.path.abspath(output_path),
+                "cmd_version": cmd_version or ffmpeg_cmd_version,
+                "match_input_resolution_flag": match_input_resolution_flag,
+                "segment_seconds": segment_seconds,
+                "auto_preset": auto_preset,
+                "start": start,
+                "end": end,
+            },
+        )
+
+    stage_start = time.perf_counter()
+    max_length = create_target_video(input_folder, video_files, journal, end)
+    stage_times["normalize"] = time.perf_counter() - stage_start
+    directory_index.refresh(
+        os.path.basename(path)
+        for file in video_files
+        for path in (
+            get_target_video_path(input_folder, file),
+            get_concat_list_path(input_folder, file),
+        )
+    )
+    if balance_loudness:
+        stage_start = time.perf_counter()
+        apply_loudness_balance(input_folder, video_files)
+        stage_times["loudness"] = time.perf_counter() - stage_start
+
+    # The length of the output, which is shorter than the target videos with a start
+    window = start is not None or end is not None
+    length = max_length
+    if max_length and start:
+        length = max_length - start
+        if length <= 0:
+            raise ValueError(
+                f"The start time {start}s is after the end of the inputs ({max_length}s)"
+            )
+
+    input_files = get_target_files(input_folder, directory_index.names())
+    run_parameters = (
+        get_run_parameters(input_files, length, cmd_version)
+        if length and input_files
+        else None
+    )
+    if run_parameters:
+        predicted = predict_encode_time(run_parameters)
+        if predicted is not None:
+            print(f"Predicted Encode Time(s): {predicted:.2f}")
+
+    preset_controller = None
+    if auto_preset and length and run_parameters:
+        preset_controller = select_encoder_preset(
+            input_files,
+            length,
+            merge_start + deadline if deadline is not None else None,
+            cmd_version,
+            run_parameters,
+            target_speed,
+        )
+
+    print("Video Grid Merge Start")
+    stage_start = time.perf_counter()
+    if journal and max_length and length:
+        encode_segments(
+            input_files,
+            output_path,
+            length,
+            journal,
+            cmd_version,
+            progress_callback,
+            preset_controller,
+            start,
+            # Segments recorded by an interrupted run are kept as they are
+            (
+                None
+                if journal.segments
+                else get_output_keyframes(input_folder, video_files, max_length, start)
+            ),
+            segment_seconds,
+        )
+        returncode = 0
+    else:
+        returncode = encode_grid(
+            input_files,
+            output_path,
+            length,
+            cmd_version,
+            start=start,
+            duration=length if window else None,
+            progress_callback=progress_callback,
+        )
+    stage_times["encode"] = time.perf_counter() - stage_start
 
-    filter_complex = "".join(
-        [
-            f"[{i}:v]scale={video_width}:{video_height},fps={fps}[v{i}]; "
-            for i in range(N)
-        ]
+    directory_index.remove(
+        dlf.delete_files_in_folder(
+            temporarily_data_list, input_folder, directory_index.names()
+        )
     )
-    filter_complex += "".join(
-        [
-            f'{"".join([f"[v{i*sqrt_N+j}]" for j in range(sqrt_N)])}hstack=inputs={sqrt_N}[row{i}]; '
-            for i in range(sqrt_N)
-        ]
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode the grid: {output_path}")
+    if result_cache and os.path.exists(output_path):
+        result_cache.store(result_key, output_path)
+    if run_parameters:
+        if preset_controller:
+            run_parameters["profile"] = preset_controller.profile_name(
+                get_run_profile(cmd_version)
+            )
+        save_run_history(
+            {
+                **run_parameters,
+                "normalize_seconds": stage_times["normalize"],
+                "encode_seconds": stage_times["encode"],
+            }
+        )
+    return stage_times
+
+
+def merge_proxy(
+    input_folder: str,
+    video_files: List[str],
+    output_path: str,
+    start: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Render a proxy of the grid (see create_proxy_command) to check the tile order.
+
+    No target videos are created; the tiles are placed in the same order as in a
+    full merge (see get_plan_tile_order).
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+        output_path (str): The path for the proxy video file.
+        start (Optional[float]): The start of the rendered time range in seconds.
+
+    Returns:
+        Dict[str, float]: The elapsed time in seconds of the 'encode' stage.
+
+    Raises:
+        RuntimeError: If ffmpeg fails to render the proxy.
+    """
+    stage_start = time.perf_counter()
+    returncode = run_ffmpeg_command(
+        create_proxy_command(
+            [
+                os.path.join(input_folder, file)
+                for file in get_plan_tile_order(input_folder, video_files)
+            ],
+            output_path,
+            start,
+        )
     )
-    filter_complex += f'{"".join([f"[row{i}]" for i in range(sqrt_N)])}vstack=inputs={sqrt_N}[vstack]; '
-    filter_complex += "".join([f"[{i}:a]volume=1[a{i}]; " for i in range(N)])
-    filter_complex += "".join([f"[a{i}]" for i in range(N)])
-    filter_complex += f"amix=inputs={N}:dropout_transition=0,volume={N}[aout]"
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to render the proxy: {output_path}")
+    return {"encode": time.perf_counter() - stage_start}
 
-    return (
-        f"ffmpeg -y {' '.join([f'-i {input_file}' for input_file in input_files])} "
-        f'-filter_complex "{filter_complex}" '
-        f'-map "[vstack]" -map "[aout]" '
-        f"-c:v h264_nvenc -preset p7 -r {fps} "
-        f"-c:a aac -b:a 192k -threads {os.cpu_count()} -loglevel {ffmpeg_loglevel} "
-        f"-s {output_width}x{output_height} {output_path}"
+
+def get_output_keyframes(
+    input_folder: str,
+    video_files: List[str],
+    max_length: float,
+    start: Optional[float] = None,
+) -> Optional[List[float]]:
+    """
+    Get the keyframes shared by every video tile on the output timeline.
+
+    The keyframes of each input video are read from its keyframe index (probed once
+    and cached in keyframe_index_dir) and repeated like process_video concatenates
+    the video, so the target videos themselves are never probed. Only the
+    timestamps that are a keyframe of every video tile are kept (see
+    kfi.common_keyframes), so an input side seek to one of them needs no decoding
+    in any tile.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+        max_length (float): The length of the target videos in seconds.
+        start (Optional[float]): The position in the target videos the output starts at.
+
+    Returns:
+        Optional[List[float]]: The keyframe timestamps relative to the output start,
+        or None if they are unknown for a video tile.
+    """
+    tile_keyframes = []
+    for file in video_files:
+        if is_image_file(file):
+            continue
+        file_path = os.path.join(input_folder, file)
+        length = get_video_length_ffmpeg(file_path)
+        keyframes = kfi.get_keyframes(
+            file_path, fpr.file_fingerprint(file_path), keyframe_index_dir
+        )
+        if not keyframes or not length:
+            return None
+        tile_keyframes.append(kfi.repeat_keyframes(keyframes, length, max_length))
+    if not tile_keyframes:
+        return None
+    offset = start or 0.0
+    return [
+        keyframe - offset
+        for keyframe in kfi.common_keyframes(tile_keyframes)
+        if keyframe >= offset
+    ]
+
+
+def get_plan_tile_order(input_folder: str, video_files: List[str]) -> List[str]:
+    """
+    Sort input videos in the order their target videos are placed in the grid.
+
+    The grid is filled with the target videos in alphabetical order of their
+    names (see get_target_files), which is not always the order of the input names.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): A list of video file names.
+
+    Returns:
+        List[str]: The video file names in tile order.
+    """
+    return sorted(
+        video_files,
+        key=lambda file: os.path.basename(get_target_video_path(input_folder, file)),
+    )
+
+
+def create_merge_plan(
+    input_folder: str,
+    video_files: List[str],
+    output_path: str,
+    cmd_version: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    directory_index: Optional[dix.DirectoryIndex] = None,
+) -> Dict[str, Any]:
+    """
+    Create the execution plan of a merge without running it.
+
+    Only the input videos are probed; no target video is created and nothing is
+    encoded. The plan lists the metadata of every input, how process_video will
+    handle it (loop count), the exact filter graph and ffmpeg argv of the grid
+    encode, and estimates of the intermediate data and of the encode work.
+    A saved plan can be run later with execute_merge_plan without probing again.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+        output_path (str): The path for the output video file.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+        start (Optional[float]): The start of the merged time range in seconds.
+        end (Optional[float]): The end of the merged time range in seconds.
+        directory_index (Optional[dix.DirectoryIndex]): The index of the input folder
+                                                        the fingerprints are taken from.
+
+    Returns:
+        Dict[str, Any]: The plan, serializable as JSON.
+    """
+    cmd_version = cmd_version or ffmpeg_cmd_version
+    lengths = {
+        file: (
+            None
+            if is_image_file(file)
+            else get_video_length_ffmpeg(os.path.join(input_folder, file))
+        )
+        for file in video_files
+    }
+    max_length = max(
+        (length for length in lengths.values() if length is not None), default=None
+    )
+    if max_length is not None and end is not None:
+        max_length = min(max_length, end)
+    duration = max(max_length - (start or 0.0), 0.0) if max_length else 0.0
+
+    inputs: List[Dict[str, Any]] = []
+    for file in get_plan_tile_order(input_folder, video_files):
+        file_path = os.path.join(input_folder, file)
+        length = lengths[file]
+        video_size = get_video_size(file_path)
+        loop_count = get_loop_count(length, max_length) if max_length else 0
+        fingerprint = (
+            directory_index.fingerprint(file)
+            if directory_index
+            else fpr.file_fingerprint(file_path)
+        )
+        file_size = fingerprint["size"] if fingerprint else os.path.getsize(file_path)
+        if is_image_file(file):
+            # Decoded once and held by the loop filter
+            action = "image"
+            loop_count = 1 if max_length else 0
+        elif loop_count == 0:
+            action = "skip"
+        elif loop_count == 1:
+            action = "link"
+        else:
+            action = "concat"
+        inputs.append(
+            {
+                "file": file,
+                "path": file_path,
+                "target_file": get_target_video_path(input_folder, file),
+                "fingerprint": fingerprint,
+                "size_bytes": file_size,
+                "duration": length,
+                "width": video_size[0] if video_size else None,
+                "height": video_size[1] if video_size else None,
+                "fps": None if action == "image" else get_video_fps(file_path),
+                **probe_video(file_path),
+                "convert_pix_fmt": bool(target_pix_fmt)
+                and probe_video(file_path).get("pix_fmt") != target_pix_fmt,
+                "action": action,
+                "loop_count": loop_count,
+                "estimated_target_bytes": (
+                    int(file_size * max_length / length)
+                    if action == "concat" and length and max_length
+                    else 0
+                ),
+            }
+        )
+
+    tiles = [entry for entry in inputs if entry["loop_count"]]
+    argv = create_ffmpeg_command(
+        [entry["target_file"] for entry in tiles],
+        output_path,
+        match_input_resolution_flag,
+        cmd_version,
+        start=start,
+        duration=duration if start is not None or end is not None else None,
+        probe_files=[entry["path"] for entry in tiles],
+    )
+
+    def get_option(name: str) -> Optional[str]:
+        return argv[argv.index(name) + 1] if name in argv else None
+
+    output_size = (get_option("-s") or "0x0").split("x")
+    output_width, output_height = int(output_size[0]), int(output_size[1])
+    output_fps = float(get_option("-r") or 0)
+
+    return {
+        "input_folder": input_folder,
+        "cmd_version": cmd_version,
+        "match_input_resolution_flag": match_input_resolution_flag,
+        "max_length": max_length,
+        "start": start,
+        "end": end,
+        "inputs": inputs,
+        "output": {
+            "path": output_path,
+            "width": output_width,
+            "height": output_height,
+            "fps": output_fps,
+            "pix_fmt": target_pix_fmt,
+        },
+        "filter_complex": get_option("-filter_complex"),
+        "argv": argv,
+        "estimates": {
+            "intermediate_bytes": sum(e["estimated_target_bytes"] for e in inputs),
+            "decoded_pixels": int(
+                sum(
+                    (e["width"] or 0) * (e["height"] or 0) * (e["fps"] or 0) * duration
+                    for e in tiles
+                )
+            ),
+            "encoded_frames": int(output_fps * duration),
+            "encoded_pixels": int(output_width * output_height * output_fps * duration),
+            "peak_memory_bytes": (
+                mbg.estimate_peak_memory(
+                    *get_memory_model([entry["path"] for entry in tiles], cmd_version)
+                )
+                if tiles
+                else None
+            ),
+            "encode_seconds": (
+                predict_encode_time(
+                    get_run_parameters(
+                        [entry["path"] for entry in tiles], duration, cmd_version
+                    )
+                )
+                if tiles and duration
+                else None
+            ),
+        },
+    }
+
+
+def save_merge_plan(plan: Dict[str, Any], plan_path: str) -> None:
+    """
+    Write a merge plan as JSON.
+
+    Args:
+        plan (Dict[str, Any]): The plan created by create_merge_plan.
+        plan_path (str): The file to write, or "-" to print the plan to stdout.
+    """
+    if plan_path == "-":
+        print(json.dumps(plan, indent=2))
+        return
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    print(f"Plan Output Complete: {plan_path}")
+
+
+def get_merge_recipe(
+    input_folder: str,
+    video_files: List[str],
+    output_path: str,
+    cmd_version: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    directory_index: Optional[dix.DirectoryIndex] = None,
+) -> Dict[str, Any]:
+    """
+    Collect everything the output of a merge depends on, for the result cache key.
+
+    The recipe holds the fingerprints of the inputs in tile order, the ffmpeg argv
+    of the merge plan with the file paths replaced by their role, the settings that
+    are not part of the argv and the ffmpeg version, so the same input files merged
+    into another file name (or from a moved folder) have the same recipe. Copies of
+    the inputs do not: their fingerprints differ in the inode and modification time.
+
+    Args:
+        input_folder (str): The path to the folder containing the input videos.
+        video_files (List[str]): The video file names in the input folder.
+        output_path (str): The path for the output video file.
+        cmd_version (Optional[str]): The ffmpeg command version. If None, ffmpeg_cmd_version is used.
+        start (Optional[float]): The start of the merged time range in seconds.
+        end (Optional[float]): The end of the merged time range in seconds.
+        directory_index (Optional[dix.DirectoryIndex]): The index of the input folder.
+
+    Returns:
+        Dict[str, Any]: The recipe, serializable as JSON.
+    """
+    plan = create_merge_plan(
+        input_folder,
+        video_files,
+        output_path,
+        cmd_version,
+        start=start,
+        end=end,
+        directory_index=directory_index,
     )
+    roles = {
+        entry["target_file"]: f"tile{index}"
+        for index, entry in enumerate(plan["inputs"])
+    }
+    roles[output_path] = f"output{os.path.splitext(output_path)[1]}"
+    return {
+        "inputs": [entry["fingerprint"] for entry in plan["inputs"]],
+        "argv": [roles.get(arg, arg) for arg in plan["argv"]],
+        "start": start,
+        "end": end,
+        "hierarchical_block_size": hierarchical_block_size,
+        "loudness_target": loudness_target if balance_loudness else None,
+        "ffmpeg_version": get_ffmpeg_version(),
+    }
+
+
+def execute_merge_plan(plan: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Run a merge plan created by create_merge_plan.
+
+    The recorded lengths, loop counts and ffmpeg argv are used as they are,
+    so no input is probed again. The inputs must be unchanged since the plan
+    was created.
+
+    Args:
+        plan (Dict[str, Any]): The plan created by create_merge_plan.
+
+    Returns:
+        Dict[str, float]: The elapsed time in seconds of each stage ('normalize', 'encode').
+
+    Raises:
+        ValueError: If an input video was changed after the plan was created.
+        RuntimeError: If ffmpeg fails to encode the grid.
+    """
+    for entry in plan["inputs"]:
+        if entry["fingerprint"] != fpr.file_fingerprint(entry["path"]):
+            raise ValueError(
+                f"Input video changed since the plan was created: {entry['path']}"
+            )
+
+    stage_times: Dict[str, float] = {}
+    stage_start = time.perf_counter()
+    with ThreadPoolExecutor() as executor:
+        futures = [
+            executor.submit(
+                process_video,
+                plan["input_folder"],
+                entry["file"],
+                plan["max_length"],
+                entry["duration"],
+            )
+            for entry in plan["inputs"]
+            if entry["loop_count"]
+        ]
+        for future in as_completed(futures):
+            future.result()
+    stage_times["normalize"] = time.perf_counter() - stage_start
+
+    print("Video Grid Merge Start")
+    stage_start = time.perf_counter()
+    returncode = crn.run_command(plan["argv"], timeout=ffmpeg_timeout)
+    stage_times["encode"] = time.perf_counter() - stage_start
+
+    dlf.delete_files_in_folder(temporarily_data_list, plan["input_folder"])
+    if returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to encode the grid: {plan['output']['path']}"
+        )
+    return stage_times
+
+
+def get_output_path(output_folder: str, output_file: str) -> str:
+    """
+    Get the output path for an output file name given on the command line.
+
+    Args:
+        output_folder (str): The path to the output folder.
+        output_file (str): The output file name. The default extension is added if
+                           it has no supported extension.
+
+    Returns:
+        str: The full path to the output file.
+    """
+    if not output_file.endswith(tuple(video_extension_list)):
+        output_file += video_extension_list[0]
+    return os.path.join(output_folder, output_file)
+
+
+def is_valid_video_count(count: int) -> bool:
+    """
+    Check whether the number of input videos can be arranged in an NxN grid.
+
+    Args:
+        count (int): The number of input videos.
+
+    Returns:
+        bool: True if count is a perfect square of at least 4.
+    """
+    return count >= 4 and int(math.sqrt(count)) ** 2 == count
 
 
 def main(
-    input_folder: Optional[str] = None, output_folder: Optional[str] = None
+    input_folder: Optional[str] = None,
+    output_folder: Optional[str] = None,
+    resume: bool = False,
+    output_file: Optional[str] = None,
+    plan_path: Optional[str] = None,
+    deadline: Optional[float] = None,
+    target_speed: Optional[float] = None,
+    max_memory: Optional[int] = None,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    preview: bool = False,
 ) -> None:
     """
     Main function to process and merge multiple videos into a grid layout.
@@ -611,51 +3598,347 @@ def main(
     Args:
         input_folder (Optional[str]): The path to the input folder. If None, a default path is used.
         output_folder (Optional[str]): The path to the output folder. If None, a default path is used.
+        resume (bool): If True, run as a resumable job and continue an interrupted run
+                       of the same job from its checkpoint journal.
+        output_file (Optional[str]): The output file name. If None, the user is asked for it.
+        plan_path (Optional[str]): If set, only the execution plan is created and written
+                                   to this file ("-" for stdout); nothing is encoded.
+        deadline (Optional[float]): If set, the encoder preset is selected so that the
+                                    merge finishes within this many seconds.
+        target_speed (Optional[float]): If set, the encoder preset is selected so that
+                                        the encode runs at least this fast (x realtime).
+        max_memory (Optional[int]): If set, the encode buffering is reduced so that the
+                                    estimated peak memory (bytes) fits, and the estimate
+                                    is reported with the actual peak RSS afterwards.
+        start_time (Optional[float]): If set, the output starts at this time (seconds).
+        end_time (Optional[float]): If set, the output ends at this time (seconds).
+        preview (bool): If True, only a small proxy of the grid is rendered next to
+                        the output file to check the tile order (see merge_proxy).
     """
     input_folder = input_folder or "./video_grid_merge/media/input"
     output_folder = output_folder or "./video_grid_merge/media/output"
+    if (start_time is not None and start_time < 0) or (
+        start_time is not None and end_time is not None and start_time >= end_time
+    ):
+        sys.exit(f"Error: Invalid time range.\nstart: {start_time}, end: {end_time}")
+    if (output_renditions or output_artifacts) and (
+        resume or deadline is not None or target_speed is not None
+    ):
+        sys.exit(
+            "Error: Output renditions and artifacts cannot be combined with --resume, --deadline or --speed."
+        )
+    if ffmpeg_cmd_version == "gpu" and (
+        deadline is not None or target_speed is not None
+    ):
+        sys.exit(
+            "Error: --deadline and --speed select x264/x265 presets and cannot be used with the gpu version."
+        )
 
     start = time.perf_counter()
-    rnf.rename_files_with_spaces(input_folder)
-    video_files = get_video_files(input_folder)
+    # The only scan of the input folder; the merge updates the index itself
+    directory_index = dix.DirectoryIndex.scan(input_folder)
+    video_files = get_video_files(input_folder, directory_index)
 
-    if len(video_files) < 4 or int(math.sqrt(len(video_files))) ** 2 != len(
-        video_files
-    ):
+    if not is_valid_video_count(len(video_files)):
         sys.exit(
             f"Error: Please store a perfect square number (>= 4) of video files in the input folder.\ninput_folder: {input_folder}"
         )
 
     os.makedirs(output_folder, exist_ok=True)
-    output_path = get_output_filename_from_user(output_folder)
+    if output_file:
+        output_path = get_output_path(output_folder, output_file)
+    else:
+        output_path = get_output_filename_from_user(output_folder)
+
+    if plan_path is not None:
+        save_merge_plan(
+            create_merge_plan(
+                input_folder,
+                video_files,
+                output_path,
+                start=start_time,
+                end=end_time,
+                directory_index=directory_index,
+            ),
+            plan_path,
+        )
+        return
 
-    create_target_video(input_folder, video_files)
-    input_files = get_target_files(input_folder, sorted(os.listdir(input_folder)))
+    if preview:
+        proxy_path = get_proxy_path(output_path)
+        merge_proxy(input_folder, video_files, proxy_path, start_time)
+        print(f"File Output Complete: {proxy_path}")
+        print(f"Processing Time(s): {time.perf_counter() - start:.8f}\n")
+        return
 
-    if ffmpeg_cmd_version == "v1":
-        ffmpeg_command = create_ffmpeg_command_v1(
-            input_files, output_path, match_input_resolution_flag
+    budget_settings: Dict[str, Any] = {}
+    predicted_memory = None
+    if max_memory:
+        budget_settings, predicted_memory = fit_memory_budget(
+            [os.path.join(input_folder, file) for file in sorted(video_files)],
+            max_memory,
         )
-    elif ffmpeg_cmd_version == "v2":
-        ffmpeg_command = create_ffmpeg_command_v2(
-            input_files, output_path, match_input_resolution_flag
+
+    # The budget applies to this merge only
+    with module_settings(budget_settings):
+        merge_videos(
+            input_folder,
+            video_files,
+            output_path,
+            resume=resume,
+            deadline=deadline,
+            target_speed=target_speed,
+            start=start_time,
+            end=end_time,
+            directory_index=directory_index,
         )
-    elif ffmpeg_cmd_version == "gpu":  # pragma: no cover
-        ffmpeg_command = create_gpu_ffmpeg_command(
-            input_files, output_path, match_input_resolution_flag
+    print("Video Grid Merge End And Output Success")
+    print(f"File Output Complete: {output_path}")
+    for extra_path in get_extra_output_paths(output_path):
+        print(f"File Output Complete: {extra_path}")
+    if predicted_memory is not None:
+        print(
+            f"Peak Memory(MiB): predicted {predicted_memory / mbg.MiB:.1f}, "
+            f"actual {mbg.get_peak_child_rss() / mbg.MiB:.1f}"
         )
-    else:
-        raise ValueError(f"Invalid ffmpeg_cmd_version: {ffmpeg_cmd_version}")
 
-    print("Video Grid Merge Start")
-    subprocess.run(ffmpeg_command, shell=True)
-    dlf.delete_files_in_folder(temporarily_data_list, input_folder)
+    elapsed_time = time.perf_counter() - start
+    print(f"Processing Time(s): {elapsed_time:.8f}\n")
+
+
+def run_merge_plan(plan_path: str) -> None:
+    """
+    Run a merge plan saved with the --plan option.
+
+    Args:
+        plan_path (str): The path to the plan file.
+    """
+    start = time.perf_counter()
+    with open(plan_path, encoding="utf-8") as f:
+        plan = json.load(f)
+
+    execute_merge_plan(plan)
     print("Video Grid Merge End And Output Success")
-    print(f"File Output Complete: {output_path}")
+    print(f"File Output Complete: {plan['output']['path']}")
 
     elapsed_time = time.perf_counter() - start
     print(f"Processing Time(s): {elapsed_time:.8f}\n")
 
 
+def show_stats() -> None:
+    """
+    Print the throughput trends and the cost model of the recorded runs.
+    """
+    print(f"Run history: {run_history_path}")
+    print(rhs.format_stats(rhs.load_runs(run_history_path)))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (Optional[List[str]]): The arguments to parse. If None, sys.argv is used.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Merge the videos in the input folder into an NxN grid video."
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["merge", "stats"],
+        default="merge",
+        help="'merge' (default) or 'stats' to show the throughput of recorded runs",
+    )
+    parser.add_argument("--input-folder", help="folder containing the input videos")
+    parser.add_argument("--output-folder", help="folder the output video is written to")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="run as a resumable job and continue an interrupted run of the same job",
+    )
+    parser.add_argument(
+        "--output-file", help="output file name (asked interactively if omitted)"
+    )
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="-",
+        metavar="PATH",
+        help="probe the inputs and write the execution plan as JSON (stdout if no PATH)",
+    )
+    parser.add_argument(
+        "--execute-plan", metavar="PATH", help="run a plan saved with --plan"
+    )
+    parser.add_argument(
+        "--encoder",
+        choices=VIDEO_ENCODERS,
+        help="software video encoder of the v1 and v2 versions (default: libx264)",
+    )
+    preset_group = parser.add_mutually_exclusive_group()
+    preset_group.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="select the slowest x264/x265 preset finishing the merge within SECONDS",
+    )
+    preset_group.add_argument(
+        "--speed",
+        type=float,
+        metavar="X",
+        help="select the slowest x264/x265 preset encoding at least X times realtime",
+    )
+    parser.add_argument(
+        "--start",
+        type=float,
+        metavar="SECONDS",
+        help="merge only the part of the grid from SECONDS on",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="only render a small, short proxy of the grid to check the tile order",
+    )
+    parser.add_argument(
+        "--end",
+        type=float,
+        metavar="SECONDS",
+        help="merge only the part of the grid up to SECONDS",
+    )
+    parser.add_argument(
+        "--fps-policy",
+        choices=["first", "min", "max", "common"],
+        help="frame rate of the grid: of the first video (default), the lowest, "
+        "the highest or the most common one",
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=float,
+        metavar="FPS",
+        help="cap the frame rate of the grid at FPS",
+    )
+    parser.add_argument(
+        "--audio",
+        choices=AUDIO_STRATEGIES,
+        help="audio of the grid: mix all tiles (default), the first tiles, the first "
+        "tile alone (re-encoded or copied), a silent track or none",
+    )
+    parser.add_argument(
+        "--balance-loudness",
+        action="store_true",
+        help="balance the loudness of the mixed tiles (measurements are cached)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=mbg.parse_memory_size,
+        metavar="SIZE",
+        help="reduce encode buffering to fit the estimated peak memory, e.g. 4G",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        metavar="N",
+        help="composite grids larger than NxN in NxN blocks by separate processes",
+    )
+    parser.add_argument(
+        "--rendition",
+        action="append",
+        type=parse_rendition,
+        metavar="SIZE[:PROFILE[:BITRATE]]",
+        help="also write the grid at SIZE (e.g. 1080p or 1920x1080) from the same "
+        "decode, e.g. 1080p:v2:6M (repeatable)",
+    )
+    parser.add_argument(
+        "--artifacts",
+        nargs="+",
+        choices=ARTIFACTS,
+        help="also write a poster frame, sprite sheets and/or a preview clip from "
+        "the same decode",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="kill an ffmpeg command (with its child processes) after SECONDS",
+    )
+    parser.add_argument(
+        "--check",
+        choices=ick.CHECK_MODES,
+        help="check the inputs for corruption before merging: 'fast' (demux only) "
+        "or 'full' (decode every frame)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="read the inputs into the page cache ahead of ffmpeg (slow disks, NFS)",
+    )
+    parser.add_argument(
+        "--result-cache",
+        action="store_true",
+        help="reuse the output of an identical earlier merge and cache new outputs",
+    )
+    parser.add_argument(
+        "--result-cache-size",
+        type=mbg.parse_memory_size,
+        metavar="SIZE",
+        help="total size of the cached outputs, e.g. 50G (default: 20G)",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        help=f"run history database (default: {rhs.default_history_path})",
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":  # pragma: no cover
-    main()
+    args = parse_args()
+    if args.history:
+        run_history_path = args.history
+    if args.block_size:
+        hierarchical_block_size = args.block_size
+    if args.encoder:
+        video_encoder = args.encoder
+    if args.fps_policy:
+        output_fps_policy = args.fps_policy
+    if args.max_fps:
+        max_output_fps = args.max_fps
+    if args.audio:
+        audio_strategy = args.audio
+    if args.balance_loudness:
+        balance_loudness = True
+    if args.rendition:
+        output_renditions = args.rendition
+    if args.artifacts:
+        output_artifacts = args.artifacts
+    if args.timeout:
+        ffmpeg_timeout = args.timeout
+    if args.check:
+        integrity_check_mode = args.check
+    if args.prefetch:
+        prefetch_inputs = True
+    if args.result_cache:
+        use_result_cache = True
+    if args.result_cache_size:
+        result_cache_max_bytes = args.result_cache_size
+    if args.command == "stats":
+        show_stats()
+    elif args.execute_plan:
+        run_merge_plan(args.execute_plan)
+    else:
+        main(
+            args.input_folder,
+            args.output_folder,
+            resume=args.resume,
+            output_file=args.output_file,
+            plan_path=args.plan,
+            deadline=args.deadline,
+            target_speed=args.speed,
+            max_memory=args.max_memory,
+            start_time=args.start,
+            end_time=args.end,
+            preview=args.preview,
+        )
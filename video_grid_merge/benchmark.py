@@ -0,0 +1,435 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_dir)
+
+from video_grid_merge import __main__ as vgm
+from video_grid_merge import memory_budget as mbg
+from video_grid_merge import prefetch as pft
+
+RESULTS_VERSION = 1
+# Allowed slowdown (or RSS growth) relative to the baseline before a run fails
+DEFAULT_THRESHOLD = 0.2
+# Timings below this are dominated by process startup and are not compared
+MIN_COMPARED_SECONDS = 0.5
+
+COMPOSITORS = {"flat": 0, "hierarchical": 2}
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    """A synthetic grid: grid_size x grid_size tiles of the same format."""
+
+    name: str
+    grid_size: int
+    width: int
+    height: int
+    fps: int
+    duration: float
+
+
+BENCHMARK_CASES = [
+    BenchmarkCase("2x2_640x360_30fps", 2, 640, 360, 30, 10.0),
+    BenchmarkCase("3x3_640x360_24fps", 3, 640, 360, 24, 8.0),
+    BenchmarkCase("4x4_480x270_25fps", 4, 480, 270, 25, 6.0),
+    BenchmarkCase("5x5_320x180_30fps", 5, 320, 180, 30, 5.0),
+    BenchmarkCase("6x6_256x144_24fps", 6, 256, 144, 24, 4.0),
+]
+
+
+def get_tile_duration(case: BenchmarkCase, index: int) -> float:
+    """Return the duration of a tile.
+
+    Every third tile is shorter, so the loop and link paths of
+    create_target_video are both exercised.
+
+    Args:
+        case (BenchmarkCase): The benchmark case
+        index (int): Index of the tile
+
+    Returns:
+        float: The duration in seconds
+    """
+    return case.duration * (1.0, 0.75, 0.5)[index % 3]
+
+
+def build_input_command(case: BenchmarkCase, index: int, path: str) -> List[str]:
+    """Return the ffmpeg command that generates one deterministic input tile.
+
+    Args:
+        case (BenchmarkCase): The benchmark case
+        index (int): Index of the tile
+        path (str): Path of the generated file
+
+    Returns:
+        List[str]: The ffmpeg command
+    """
+    duration = get_tile_duration(case, index)
+    return [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={case.width}x{case.height}:rate={case.fps}"
+        f":duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency={220 + 55 * index}:sample_rate=48000:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-shortest",
+        path,
+    ]
+
+
+def generate_inputs(case: BenchmarkCase, media_dir: str) -> str:
+    """Generate the input tiles of a case, reusing tiles generated before.
+
+    Args:
+        case (BenchmarkCase): The benchmark case
+        media_dir (str): Folder of the generated media
+
+    Returns:
+        str: The input folder of the case
+    """
+    input_folder = os.path.join(media_dir, case.name)
+    os.makedirs(input_folder, exist_ok=True)
+    for index in range(case.grid_size**2):
+        path = os.path.join(input_folder, f"tile_{index:02d}.mp4")
+        if not os.path.exists(path):
+            subprocess.run(build_input_command(case, index, path), check=True)
+    return input_folder
+
+
+def get_result_key(
+    case_name: str, profile: str, compositor: str, prefetch: bool = False
+) -> str:
+    """Return the key of a run in the results."""
+    key = f"{case_name}/{profile}/{compositor}"
+    return f"{key}/prefetch" if prefetch else key
+
+
+def run_case(
+    case: BenchmarkCase,
+    profile: str,
+    compositor: str,
+    input_folder: str,
+    prefetch: bool = False,
+    cold_cache: bool = False,
+) -> Dict[str, Any]:
+    """Run the full pipeline for one case and measure it.
+
+    Called in a fresh worker process, so the peak RSS of the finished child
+    processes belongs to this run only.
+
+    Args:
+        case (BenchmarkCase): The benchmark case
+        profile (str): The ffmpeg command version (v1, v2, gpu)
+        compositor (str): Key of COMPOSITORS
+        input_folder (str): Folder of the generated inputs
+        prefetch (bool): Prefetch the inputs of the grid encode
+        cold_cache (bool): Drop the inputs of the grid encode from the page cache
+            before encoding
+
+    Returns:
+        Dict[str, Any]: Stage times, total seconds, encode fps and peak RSS
+    """
+    vgm.hierarchical_block_size = COMPOSITORS[compositor]
+    vgm.record_run_history = False
+    vgm.prefetch_inputs = prefetch
+    if cold_cache:
+        encode_grid = vgm.encode_grid
+
+        def cold_encode_grid(input_files: List[str], *args: Any, **kwargs: Any) -> int:
+            # Dirty pages of the freshly written target videos cannot be dropped
+            os.sync()
+            for file in input_files:
+                pft.drop_page_cache(file)
+            return encode_grid(input_files, *args, **kwargs)
+
+        vgm.encode_grid = cold_encode_grid
+    output_folder = tempfile.mkdtemp(prefix="vgm_bench_")
+    try:
+        start = time.perf_counter()
+        stage_times = vgm.merge_videos(
+            input_folder,
+            vgm.get_video_files(input_folder),
+            os.path.join(output_folder, "output.mp4"),
+            cmd_version=profile,
+        )
+        total_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+    frames = case.duration * case.fps
+    return {
+        "stage_times": stage_times,
+        "total_seconds": total_seconds,
+        "fps": frames / stage_times["encode"] if stage_times["encode"] else 0.0,
+        "peak_rss": mbg.get_peak_child_rss(),
+    }
+
+
+def run_benchmarks(
+    cases: List[BenchmarkCase],
+    profiles: List[str],
+    compositors: List[str],
+    media_dir: str,
+    prefetch: bool = False,
+    cold_cache: bool = False,
+) -> Dict[str, Any]:
+    """Run every combination of case, profile and compositor.
+
+    Args:
+        cases (List[BenchmarkCase]): The benchmark cases
+        profiles (List[str]): The ffmpeg command versions
+        compositors (List[str]): Keys of COMPOSITORS
+        media_dir (str): Folder of the generated media
+        prefetch (bool): Prefetch the inputs of the grid encodes
+        cold_cache (bool): Encode from a cold page cache
+
+    Returns:
+        Dict[str, Any]: The results with the environment they were measured in
+    """
+    runs: Dict[str, Any] = {}
+    for case in cases:
+        input_folder = generate_inputs(case, media_dir)
+        for profile in profiles:
+            for compositor in compositors:
+                # Hierarchical compositing only differs from flat above the block size
+                if compositor != "flat" and case.grid_size <= COMPOSITORS[compositor]:
+                    continue
+                key = get_result_key(case.name, profile, compositor, prefetch)
+                print(f"Benchmark: {key}")
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(
+                        run_case,
+                        case,
+                        profile,
+                        compositor,
+                        input_folder,
+                        prefetch,
+                        cold_cache,
+                    ).result()
+                runs[key] = {"case": asdict(case), **result}
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": time.time(),
+        "environment": {
+            "ffmpeg_version": vgm.get_ffmpeg_version(),
+            "platform": platform.platform(),
+            "cores": os.cpu_count(),
+            "cold_cache": cold_cache,
+        },
+        "runs": runs,
+    }
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    """Write benchmark results as JSON.
+
+    Args:
+        results (Dict[str, Any]): Result of run_benchmarks
+        path (str): Path of the results file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Optional[Dict[str, Any]]:
+    """Read benchmark results written by save_results.
+
+    Args:
+        path (str): Path of the results file
+
+    Returns:
+        Optional[Dict[str, Any]]: The results, or None if the file is missing or of
+            another version
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return results if results.get("version") == RESULTS_VERSION else None
+
+
+def find_baseline_run(baseline: Dict[str, Any], key: str) -> Optional[Dict[str, Any]]:
+    """Return the baseline run of a key.
+
+    Runs with prefetching fall back to the same run without it, so a baseline
+    saved without --prefetch shows the effect of prefetching.
+
+    Args:
+        baseline (Dict[str, Any]): Stored results
+        key (str): Key of the run (see get_result_key)
+
+    Returns:
+        Optional[Dict[str, Any]]: The baseline run, or None
+    """
+    run = baseline["runs"].get(key)
+    if run is None and key.endswith("/prefetch"):
+        run = baseline["runs"].get(key[: -len("/prefetch")])
+    return run
+
+
+def get_speedups(results: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, float]:
+    """Return the encode speedup of every run over its baseline run.
+
+    Args:
+        results (Dict[str, Any]): Result of run_benchmarks
+        baseline (Dict[str, Any]): Stored results to compare with
+
+    Returns:
+        Dict[str, float]: Baseline encode time / encode time per run key
+    """
+    speedups = {}
+    for key, run in results["runs"].items():
+        base = find_baseline_run(baseline, key)
+        if base is not None and run["stage_times"].get("encode"):
+            speedups[key] = base["stage_times"]["encode"] / run["stage_times"]["encode"]
+    return speedups
+
+
+def compare_results(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """Compare benchmark results with a baseline.
+
+    A run regresses if a stage or the whole pipeline takes more than threshold
+    longer, the encode fps drops by more than threshold or the peak RSS grows by
+    more than threshold. Runs missing from the baseline are not compared.
+
+    Args:
+        results (Dict[str, Any]): Result of run_benchmarks
+        baseline (Dict[str, Any]): Stored results to compare with
+        threshold (float): Allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        List[str]: A description of every regression
+    """
+    regressions = []
+    for key, run in results["runs"].items():
+        base = find_baseline_run(baseline, key)
+        if base is None:
+            continue
+        seconds = {f"{stage} time": t for stage, t in run["stage_times"].items()}
+        base_seconds = {f"{stage} time": t for stage, t in base["stage_times"].items()}
+        seconds["total time"] = run["total_seconds"]
+        base_seconds["total time"] = base["total_seconds"]
+        for name, value in seconds.items():
+            base_value = base_seconds.get(name)
+            if (
+                base_value is not None
+                and base_value >= MIN_COMPARED_SECONDS
+                and value > base_value * (1 + threshold)
+            ):
+                regressions.append(
+                    f"{key}: {name} {value:.2f}s (baseline {base_value:.2f}s)"
+                )
+        if base["fps"] and run["fps"] < base["fps"] * (1 - threshold):
+            regressions.append(
+                f"{key}: fps {run['fps']:.1f} (baseline {base['fps']:.1f})"
+            )
+        if base["peak_rss"] and run["peak_rss"] > base["peak_rss"] * (1 + threshold):
+            regressions.append(
+                f"{key}: peak RSS {run['peak_rss'] / mbg.MiB:.1f}MiB "
+                f"(baseline {base['peak_rss'] / mbg.MiB:.1f}MiB)"
+            )
+    return regressions
+
+
+def main() -> None:  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Benchmark the video grid merge pipeline with synthetic media."
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=[case.name for case in BENCHMARK_CASES],
+        default=[case.name for case in BENCHMARK_CASES],
+    )
+    parser.add_argument(
+        "--profiles", nargs="+", choices=["v1", "v2", "gpu"], default=["v1", "v2"]
+    )
+    parser.add_argument(
+        "--compositors", nargs="+", choices=list(COMPOSITORS), default=list(COMPOSITORS)
+    )
+    parser.add_argument(
+        "--media-dir", default=os.path.join(tempfile.gettempdir(), "vgm_bench_media")
+    )
+    parser.add_argument(
+        "--prefetch", action="store_true", help="prefetch the inputs of the encodes"
+    )
+    parser.add_argument(
+        "--cold-cache",
+        action="store_true",
+        help="drop the inputs from the page cache before every encode",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None:
+        sys.exit("Error: ffmpeg and ffprobe are required to run the benchmarks.")
+
+    results = run_benchmarks(
+        [case for case in BENCHMARK_CASES if case.name in args.cases],
+        args.profiles,
+        args.compositors,
+        args.media_dir,
+        args.prefetch,
+        args.cold_cache,
+    )
+    save_results(results, args.output)
+    print(f"Benchmark results: {args.output}")
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"Baseline saved: {args.baseline}")
+        return
+
+    baseline = load_results(args.baseline)
+    if baseline is None:
+        print(f"No baseline to compare with: {args.baseline}")
+        return
+    for key, speedup in get_speedups(results, baseline).items():
+        print(f"Encode speedup: {key} x{speedup:.2f}")
+    regressions = compare_results(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
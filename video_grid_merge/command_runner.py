@@ -0,0 +1,99 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional
+
+# How often a running command is checked for its timeout and cancellation
+POLL_SECONDS = 0.1
+
+
+def start_command(
+    command: List[str], capture_output: bool = False
+) -> subprocess.Popen[str]:
+    """Start a command without a shell in its own process group.
+
+    The process does not read the terminal (stdin is /dev/null), and being in
+    its own session it can be killed with everything it started (see
+    kill_command).
+
+    Args:
+        command (List[str]): The argv
+        capture_output (bool): Pipe stdout (as text) to the caller
+
+    Returns:
+        subprocess.Popen[str]: The started process
+    """
+    return subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if capture_output else None,
+        encoding="utf-8",
+        start_new_session=True,
+    )
+
+
+def kill_command(process: subprocess.Popen[str]) -> None:
+    """Kill the process group of a command started with start_command.
+
+    Args:
+        process (subprocess.Popen[str]): The process
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_command(
+    command: List[str],
+    timeout: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
+    on_output: Optional[Callable[[str], None]] = None,
+) -> int:
+    """Run a command without a shell and wait for it.
+
+    The process group is killed when the timeout expires, the cancel event is
+    set or the caller is interrupted (e.g. KeyboardInterrupt, which no longer
+    reaches the process group of the command directly).
+
+    Args:
+        command (List[str]): The argv
+        timeout (Optional[float]): Seconds the command may run
+        cancel (Optional[threading.Event]): Kills the command when set
+        on_output (Optional[Callable[[str], None]]): Receives every line the
+            command writes to stdout
+
+    Returns:
+        int: The exit status (negative signal number if the command was killed)
+    """
+    process = start_command(command, capture_output=on_output is not None)
+    finished = threading.Event()
+
+    def watch() -> None:
+        stop_at = time.monotonic() + timeout if timeout is not None else None
+        while not finished.wait(POLL_SECONDS):
+            if (cancel is not None and cancel.is_set()) or (
+                stop_at is not None and time.monotonic() >= stop_at
+            ):
+                kill_command(process)
+                return
+
+    watcher = None
+    if timeout is not None or cancel is not None:
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+    try:
+        if on_output is not None and process.stdout:
+            for line in process.stdout:
+                on_output(line)
+        return process.wait()
+    except BaseException:
+        kill_command(process)
+        process.wait()
+        raise
+    finally:
+        finished.set()
+        if watcher is not None:
+            watcher.join()
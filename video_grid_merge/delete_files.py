@@ -1,25 +1,37 @@
 import os
-from typing import List
+from typing import List, Optional
 
 temporarily_data_list = ["_TV", ".txt"]
 
 
-def delete_files_in_folder(tmp_data_list: List[str], input_folder: str) -> None:
+def delete_files_in_folder(
+    tmp_data_list: List[str], input_folder: str, file_names: Optional[List[str]] = None
+) -> List[str]:
     """Deletes temporary data files in the specified folder.
 
     Args:
         tmp_data_list (List[str]): List defining temporarily stored data information
         input_folder (str): Path of the folder to be deleted
+        file_names (Optional[List[str]]): Names of the files in the folder if they are
+            already known (e.g. from a directory index); otherwise the folder is listed
+
+    Returns:
+        List[str]: Names of the deleted files
     """
+    if file_names is None:
+        file_names = os.listdir(input_folder)
     files_to_delete = [
         file_name
-        for file_name in os.listdir(input_folder)
+        for file_name in file_names
         if any(x in file_name for x in tmp_data_list)
     ]
+    deleted = []
     for file_name in files_to_delete:
         file_path = os.path.join(input_folder, file_name)
         if os.path.isfile(file_path):
             os.remove(file_path)
+            deleted.append(file_name)
+    return deleted
 
 
 def delete_files_with_confirmation(tmp_data_list: List[str], path: str) -> None:
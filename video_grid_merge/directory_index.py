@@ -0,0 +1,132 @@
+import os
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from video_grid_merge import fingerprint as fpr
+
+
+class FileEntry(NamedTuple):
+    """Name and stat of a file in an indexed folder."""
+
+    name: str
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+def stat_entry(name: str, st: os.stat_result) -> FileEntry:
+    """Return the index entry of a file from its stat.
+
+    Args:
+        name (str): Name of the file in its folder
+        st (os.stat_result): Stat of the file (symbolic links followed)
+
+    Returns:
+        FileEntry: The entry
+    """
+    return FileEntry(name, st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class DirectoryIndex:
+    """The files of one folder, read in a single os.scandir pass.
+
+    Discovery, fingerprints and cleanup of a job query the index instead of
+    listing the folder again. The index does not watch the folder: files the job
+    creates or removes are recorded explicitly with refresh and remove.
+    Symbolic links are indexed with the stat of their target; subfolders are
+    not indexed.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        self.entries: Dict[str, FileEntry] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def scan(cls, folder: str) -> "DirectoryIndex":
+        """Index the files of a folder.
+
+        Args:
+            folder (str): Path of the folder
+
+        Returns:
+            DirectoryIndex: The index (empty if the folder cannot be read)
+        """
+        index = cls(folder)
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            index.entries[entry.name] = stat_entry(
+                                entry.name, entry.stat()
+                            )
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return index
+
+    def names(self) -> List[str]:
+        """Return the names of the indexed files in alphabetical order."""
+        with self._lock:
+            names = list(self.entries)
+        names.sort()
+        return names
+
+    def get(self, name: str) -> Optional[FileEntry]:
+        """Return the entry of a file, or None if it is not indexed.
+
+        Args:
+            name (str): Name of the file in the folder
+        """
+        with self._lock:
+            return self.entries.get(name)
+
+    def refresh(self, names: Iterable[str]) -> None:
+        """Stat files again, e.g. after the job created or changed them.
+
+        Args:
+            names (Iterable[str]): Names of the files in the folder; files that no
+                longer exist are removed from the index
+        """
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                self.remove([name])
+                continue
+            with self._lock:
+                self.entries[name] = stat_entry(name, st)
+
+    def remove(self, names: Iterable[str]) -> None:
+        """Remove files from the index, e.g. after the job deleted them.
+
+        Args:
+            names (Iterable[str]): Names of the files in the folder
+        """
+        with self._lock:
+            for name in names:
+                self.entries.pop(name, None)
+
+    def fingerprint(self, name: str, full: bool = False) -> Optional[Dict[str, Any]]:
+        """Return the fingerprint of a file from its indexed stat.
+
+        Args:
+            name (str): Name of the file in the folder
+            full (bool): Hash the whole file instead of samples
+
+        Returns:
+            Optional[Dict[str, Any]]: The fingerprint (see fpr.file_fingerprint), or
+                None if the file is not indexed or cannot be read
+        """
+        entry = self.get(name)
+        if entry is None:
+            return None
+        return fpr.stat_fingerprint(
+            os.path.join(self.folder, name),
+            entry.size,
+            entry.mtime_ns,
+            entry.inode,
+            full,
+        )
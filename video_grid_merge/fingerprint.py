@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import mmap
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+SAMPLE_SIZE = 64 * 1024
+# Evenly spaced blocks hashed between the head and the tail of a file
+MIDDLE_SAMPLES = 8
+DIGEST_SIZE = 16
+FULL_HASH_CHUNK = 1024 * 1024
+
+
+def get_sample_offsets(
+    size: int, sample_size: int = SAMPLE_SIZE, middle_samples: int = MIDDLE_SAMPLES
+) -> List[int]:
+    """Return the offsets of the blocks hashed for a sampled fingerprint.
+
+    Files no larger than all samples together are hashed completely, so their
+    sampled and full hashes are equal.
+
+    Args:
+        size (int): Size of the file in bytes
+        sample_size (int): Size of one block in bytes
+        middle_samples (int): Number of blocks between the head and the tail
+
+    Returns:
+        List[int]: The block offsets in ascending order, or [] for a full hash
+    """
+    if size <= sample_size * (middle_samples + 2):
+        return []
+    last = size - sample_size
+    step = last / (middle_samples + 1)
+    return [round(step * i) for i in range(middle_samples + 2)]
+
+
+def hash_samples(fd: int, size: int) -> str:
+    """Hash the sampled blocks of an open file with BLAKE2b.
+
+    Args:
+        fd (int): File descriptor opened for reading
+        size (int): Size of the file in bytes
+
+    Returns:
+        str: The hex digest
+    """
+    offsets = get_sample_offsets(size)
+    if not offsets:
+        return hash_full(fd, size)
+    digest = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=DIGEST_SIZE)
+    for offset in offsets:
+        if hasattr(os, "pread"):
+            digest.update(os.pread(fd, SAMPLE_SIZE, offset))
+        else:  # pragma: no cover
+            os.lseek(fd, offset, os.SEEK_SET)
+            digest.update(os.read(fd, SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def hash_full(fd: int, size: int) -> str:
+    """Hash the whole contents of an open file with BLAKE2b.
+
+    The file is memory-mapped and hashed in chunks, so it is not copied into
+    Python buffers.
+
+    Args:
+        fd (int): File descriptor opened for reading
+        size (int): Size of the file in bytes
+
+    Returns:
+        str: The hex digest
+    """
+    digest = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=DIGEST_SIZE)
+    if size == 0:
+        return digest.hexdigest()
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, size, FULL_HASH_CHUNK):
+                digest.update(view[offset : offset + FULL_HASH_CHUNK])
+        finally:
+            view.release()
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(
+    path: str, size: int, mtime_ns: int, inode: int, full: bool
+) -> Optional[str]:
+    """Hash a file, memoized on its stat so repeated checks read it only once."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except OSError:
+        return None
+    try:
+        return hash_full(fd, size) if full else hash_samples(fd, size)
+    except (OSError, ValueError):
+        return None
+    finally:
+        os.close(fd)
+
+
+def file_fingerprint(path: str, full: bool = False) -> Optional[Dict[str, Any]]:
+    """Return the identity of a file: size, mtime, inode and a content hash.
+
+    By default the hash covers only the head, the tail and MIDDLE_SAMPLES evenly
+    spaced blocks of the file, so even multi-GB files cost a few small reads.
+    Within a process the hash is reused while the size, mtime and inode of the
+    file are unchanged.
+
+    Args:
+        path (str): Path of the file
+        full (bool): Hash the whole file instead of samples (for verification)
+
+    Returns:
+        Optional[Dict[str, Any]]: The fingerprint, or None if the file does not
+            exist or cannot be read
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return stat_fingerprint(path, st.st_size, st.st_mtime_ns, st.st_ino, full)
+
+
+def stat_fingerprint(
+    path: str, size: int, mtime_ns: int, inode: int, full: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Return the fingerprint of a file whose stat is already known.
+
+    Args:
+        path (str): Path of the file
+        size (int): Size of the file in bytes
+        mtime_ns (int): Modification time of the file in nanoseconds
+        inode (int): Inode number of the file
+        full (bool): Hash the whole file instead of samples
+
+    Returns:
+        Optional[Dict[str, Any]]: The fingerprint (see file_fingerprint), or None if
+            the file cannot be read
+    """
+    content_hash = _hash_file(os.path.abspath(path), size, mtime_ns, inode, full)
+    if content_hash is None:
+        return None
+    return {"size": size, "mtime_ns": mtime_ns, "inode": inode, "hash": content_hash}
+
+
+def measure_throughput(paths: List[str], full: bool = False) -> Dict[str, float]:
+    """Fingerprint files without the memo and measure the throughput.
+
+    Args:
+        paths (List[str]): Paths of the files
+        full (bool): Measure the full hash instead of the sampled hash
+
+    Returns:
+        Dict[str, float]: Files, bytes, seconds, files per second and file bytes
+            covered per second
+    """
+    _hash_file.cache_clear()
+    total_bytes = 0
+    start = time.perf_counter()
+    for path in paths:
+        fingerprint = file_fingerprint(path, full)
+        if fingerprint is not None:
+            total_bytes += fingerprint["size"]
+    seconds = time.perf_counter() - start
+    _hash_file.cache_clear()
+    return {
+        "files": len(paths),
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "files_per_second": len(paths) / seconds if seconds else 0.0,
+        "bytes_per_second": total_bytes / seconds if seconds else 0.0,
+    }
+
+
+def main() -> None:  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Print file fingerprints and the fingerprint throughput."
+    )
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--full", action="store_true", help="hash whole files")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        fingerprint = file_fingerprint(path, args.full)
+        print(f"{fingerprint['hash'] if fingerprint else 'missing'}  {path}")
+    for full in (False, True):
+        stats = measure_throughput(args.paths, full)
+        mode = "full" if full else "sampled"
+        print(
+            f"{mode}: {stats['files_per_second']:.1f} files/s, "
+            f"{stats['bytes_per_second'] / (1024 * 1024):.1f} MiB/s"
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from video_grid_merge import fingerprint as fpr
+
+CACHE_VERSION = 1
+
+CacheType = TypeVar("CacheType", bound="FingerprintCache")
+
+
+class FingerprintCache:
+    """Entries about media files, keyed by absolute path and stored as JSON.
+
+    Every entry records the fingerprint of its file and only applies while the
+    file is unchanged.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls: Type[CacheType], path: str) -> CacheType:
+        """Load the cache at path, or start an empty one.
+
+        Args:
+            path (str): Path of the cache file
+
+        Returns:
+            CacheType: The loaded cache
+        """
+        cache = cls(path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if data.get("version") == CACHE_VERSION:
+            cache.entries = data.get("entries", {})
+        return cache
+
+    def get_entry(self, path: str) -> Optional[Dict[str, Any]]:
+        """Return the entry of a file if the file is unchanged.
+
+        Args:
+            path (str): Path of the media file
+
+        Returns:
+            Optional[Dict[str, Any]]: The entry, or None
+        """
+        with self._lock:
+            entry = self.entries.get(os.path.abspath(path))
+        if entry is None or entry["fingerprint"] != fpr.file_fingerprint(path):
+            return None
+        return entry
+
+    def set_entry(self, path: str, values: Dict[str, Any]) -> None:
+        """Store the entry of a file together with its current fingerprint.
+
+        Args:
+            path (str): Path of the media file
+            values (Dict[str, Any]): The entry, serializable as JSON
+        """
+        entry = {"fingerprint": fpr.file_fingerprint(path), **values}
+        with self._lock:
+            self.entries[os.path.abspath(path)] = entry
+
+    def save(self) -> None:
+        """Atomically write the cache to disk."""
+        with self._lock:
+            data = {"version": CACHE_VERSION, "entries": dict(self.entries)}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
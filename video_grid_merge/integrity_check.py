@@ -0,0 +1,157 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from video_grid_merge import fingerprint_cache as fpc
+
+default_cache_path = os.path.join(
+    os.path.expanduser("~"), ".video_grid_merge", "integrity.json"
+)
+
+# "fast" only demuxes the packets, "full" decodes every frame
+CHECK_MODES = ["fast", "full"]
+# Lines of the ffmpeg log kept in the report of a corrupt file
+MAX_ERROR_LINES = 3
+
+
+def build_check_command(path: str, mode: str) -> List[str]:
+    """Return the ffmpeg arguments checking the integrity of a file.
+
+    Args:
+        path (str): Path of the media file
+        mode (str): "fast" (demux only, -c copy) or "full" (decode everything)
+
+    Returns:
+        List[str]: The ffmpeg arguments
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    if mode not in CHECK_MODES:
+        raise ValueError(f"Invalid integrity check mode: {mode}")
+    command = ["ffmpeg", "-hide_banner", "-nostats", "-v", "error", "-i", path]
+    command += ["-map", "0"]
+    if mode == "fast":
+        command += ["-c", "copy"]
+    return command + ["-f", "null", "-"]
+
+
+def check_file(path: str, mode: str) -> Optional[str]:
+    """Check a file with ffmpeg.
+
+    With -v error ffmpeg logs nothing for an intact file, so any logged line
+    marks the file as corrupt.
+
+    Args:
+        path (str): Path of the media file
+        mode (str): "fast" or "full" (see build_check_command)
+
+    Returns:
+        Optional[str]: None if the file is intact, otherwise the error
+    """
+    try:
+        result = subprocess.run(
+            build_check_command(path, mode), capture_output=True, text=True
+        )
+    except OSError as e:
+        return str(e)
+    lines = [line for line in result.stderr.splitlines() if line.strip()]
+    if result.returncode == 0 and not lines:
+        return None
+    return "; ".join(lines[:MAX_ERROR_LINES]) or f"exit status {result.returncode}"
+
+
+class IntegrityCache(fpc.FingerprintCache):
+    """Files that passed an integrity check, stored as JSON.
+
+    A clean file is not checked again until it changes. Files that passed the
+    full check also count as checked in the fast mode.
+    """
+
+    def is_clean(self, path: str, mode: str) -> bool:
+        """Return whether the unchanged file passed a check at least as thorough.
+
+        Args:
+            path (str): Path of the media file
+            mode (str): "fast" or "full"
+
+        Returns:
+            bool: True if the check can be skipped
+        """
+        entry = self.get_entry(path)
+        return entry is not None and entry["mode"] in (mode, "full")
+
+    def record(self, path: str, mode: str) -> None:
+        """Record that a file passed a check.
+
+        A full check of the unchanged file is kept when it passes a fast check.
+
+        Args:
+            path (str): Path of the media file
+            mode (str): "fast" or "full"
+        """
+        entry = self.get_entry(path)
+        if entry and entry["mode"] == "full" and mode == "fast":
+            return
+        self.set_entry(path, {"mode": mode})
+
+
+def check_files(
+    paths: List[str],
+    mode: str,
+    cache: Optional[IntegrityCache] = None,
+    workers: int = 4,
+) -> Dict[str, Optional[str]]:
+    """Check files concurrently, stopping at the first corrupt file.
+
+    Files the cache knows as clean are not checked. When a check fails, the
+    checks that have not started yet are skipped.
+
+    Args:
+        paths (List[str]): Paths of the media files
+        mode (str): "fast" or "full" (see build_check_command)
+        cache (Optional[IntegrityCache]): Cache of clean files, updated with the
+            files that pass
+        workers (int): Number of concurrent ffmpeg processes
+
+    Returns:
+        Dict[str, Optional[str]]: The result of every checked or cached file: None
+            if it is intact, otherwise the error. Skipped files are left out.
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    if mode not in CHECK_MODES:
+        raise ValueError(f"Invalid integrity check mode: {mode}")
+    results: Dict[str, Optional[str]] = {}
+    pending = []
+    for path in dict.fromkeys(paths):
+        if cache and cache.is_clean(path, mode):
+            results[path] = None
+        else:
+            pending.append(path)
+    if not pending:
+        return results
+
+    aborted = threading.Event()
+
+    def check(path: str) -> Tuple[bool, Optional[str]]:
+        if aborted.is_set():
+            return False, None
+        error = check_file(path, mode)
+        if error is not None:
+            aborted.set()
+        return True, error
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, (checked, error) in zip(pending, executor.map(check, pending)):
+            if not checked:
+                continue
+            results[path] = error
+            if error is None and cache:
+                cache.record(path, mode)
+    if cache:
+        cache.save()
+    return results
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from video_grid_merge import fingerprint as fpr
+
+JOURNAL_VERSION = 1
+
+
+def get_journal_path(output_path: str) -> str:
+    """Return the journal path belonging to an output file.
+
+    Args:
+        output_path (str): Path of the merged output video
+
+    Returns:
+        str: Path of the journal file
+    """
+    return f"{output_path}.journal.json"
+
+
+class JobJournal:
+    """On-disk checkpoint journal of one merge job.
+
+    The journal records every unit of work as soon as it is finished: the probed
+    input lengths, the normalized (_TV) clips and the encoded time segments of
+    the output. Each entry stores the fingerprint of the file it describes, so
+    a resumed job only skips work whose result is still on disk unchanged.
+
+    The journal is rewritten atomically (temporary file + os.replace) after every
+    record, so a crash at any point leaves the last completed state readable.
+    """
+
+    def __init__(self, path: str, settings: Dict[str, Any]) -> None:
+        self.path = path
+        self.settings = settings
+        self.probes: Dict[str, Dict[str, Any]] = {}
+        self.normalized: Dict[str, Dict[str, Any]] = {}
+        self.segments: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str, settings: Dict[str, Any]) -> "JobJournal":
+        """Load the journal at path, or start a new one.
+
+        An existing journal is only reused when it was written for the same
+        settings (inputs, output and encoder options). Otherwise it is discarded.
+
+        Args:
+            path (str): Path of the journal file
+            settings (Dict[str, Any]): Job settings the journal must match
+
+        Returns:
+            JobJournal: The loaded or new journal
+        """
+        journal = cls(path, settings)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return journal
+
+        if data.get("version") != JOURNAL_VERSION or data.get("settings") != settings:
+            print(f"Journal does not match the current job, starting over: {path}")
+            return journal
+
+        journal.probes = data.get("probes", {})
+        journal.normalized = data.get("normalized", {})
+        journal.segments = data.get("segments", [])
+        return journal
+
+    def save(self) -> None:
+        """Atomically write the journal to disk."""
+        data = {
+            "version": JOURNAL_VERSION,
+            "settings": self.settings,
+            "probes": self.probes,
+            "normalized": self.normalized,
+            "segments": self.segments,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        """Delete the journal once the job has completed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def get_probe(self, path: str) -> Optional[float]:
+        """Return the recorded length of path if the file is unchanged.
+
+        Args:
+            path (str): Path of the input video
+
+        Returns:
+            Optional[float]: The recorded length in seconds, or None
+        """
+        with self._lock:
+            entry = self.probes.get(path)
+        if entry is None or entry["fingerprint"] != fpr.file_fingerprint(path):
+            return None
+        return float(entry["length"])
+
+    def record_probe(self, path: str, length: float) -> None:
+        """Record the probed length of an input video.
+
+        Args:
+            path (str): Path of the input video
+            length (float): Length in seconds
+        """
+        with self._lock:
+            self.probes[path] = {
+                "length": length,
+                "fingerprint": fpr.file_fingerprint(path),
+            }
+            self.save()
+
+    def is_normalized(self, path: str) -> bool:
+        """Check whether a normalized clip was completed and is unchanged.
+
+        Args:
+            path (str): Path of the normalized (_TV) clip
+
+        Returns:
+            bool: True if the clip can be reused
+        """
+        with self._lock:
+            fingerprint = self.normalized.get(path)
+        return fingerprint is not None and fingerprint == fpr.file_fingerprint(path)
+
+    def record_normalized(self, path: str) -> None:
+        """Record a completed normalized clip.
+
+        Args:
+            path (str): Path of the normalized (_TV) clip
+        """
+        fingerprint = fpr.file_fingerprint(path)
+        if fingerprint is None:
+            return
+        with self._lock:
+            self.normalized[path] = fingerprint
+            self.save()
+
+    def plan_segments(
+        self,
+        total_length: float,
+        segment_length: float,
+        starts: Optional[List[float]] = None,
+    ) -> None:
+        """Split the output into time segments, unless a plan was already recorded.
+
+        Args:
+            total_length (float): Length of the output in seconds
+            segment_length (float): Target length of one segment in seconds
+            starts (Optional[List[float]]): Start of every segment (e.g. on keyframes).
+                Defaults to multiples of segment_length
+        """
+        with self._lock:
+            if self.segments:
+                return
+            if starts is None:
+                count = max(int(-(-total_length // segment_length)), 1)
+                starts = [index * segment_length for index in range(count)]
+            ends = starts[1:] + [total_length]
+            self.segments = [
+                {
+                    "index": index,
+                    "start": start,
+                    "duration": end - start,
+                    "path": None,
+                    "fingerprint": None,
+                }
+                for index, (start, end) in enumerate(zip(starts, ends))
+            ]
+            self.save()
+
+    def is_segment_done(self, index: int) -> bool:
+        """Check whether a segment was encoded and its file is unchanged.
+
+        Args:
+            index (int): Index of the segment
+
+        Returns:
+            bool: True if the segment can be reused
+        """
+        with self._lock:
+            segment = self.segments[index]
+        if segment["path"] is None:
+            return False
+        return bool(segment["fingerprint"] == fpr.file_fingerprint(segment["path"]))
+
+    def record_segment(self, index: int, path: str) -> None:
+        """Record a completed output segment.
+
+        Args:
+            index (int): Index of the segment
+            path (str): Path of the encoded segment file
+        """
+        with self._lock:
+            self.segments[index]["path"] = path
+            self.segments[index]["fingerprint"] = fpr.file_fingerprint(path)
+            self.save()
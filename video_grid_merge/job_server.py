@@ -0,0 +1,418 @@
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_dir)
+
+from video_grid_merge import __main__ as vgm
+
+JOB_STATUSES = ["queued", "running", "succeeded", "failed"]
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+@dataclass
+class MergeJob:
+    """A merge request submitted to the job server."""
+
+    inputs: List[str]
+    output_path: str
+    profile: str
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    progress: float = 0.0
+    speed: float = 0.0
+    error: Optional[str] = None
+    stage_times: Dict[str, float] = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the JSON representation used by the HTTP API."""
+        return {
+            "id": self.job_id,
+            "status": self.status,
+            "inputs": self.inputs,
+            "output_path": self.output_path,
+            "profile": self.profile,
+            "progress": round(self.progress, 4),
+            "speed": self.speed,
+            "error": self.error,
+            "stage_times": self.stage_times,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def parse_job_request(payload: Dict[str, Any], output_folder: str) -> MergeJob:
+    """
+    Validate a job submission and create the corresponding MergeJob.
+
+    The payload must contain 'inputs', a list of video paths in tile order
+    (top left to bottom right). 'layout' ("NxN") is optional and must match
+    the number of inputs, 'profile' defaults to the module ffmpeg_cmd_version
+    and 'output_path' defaults to a file named after the job in output_folder.
+
+    Args:
+        payload (Dict[str, Any]): The decoded JSON request body.
+        output_folder (str): The folder used when no output_path is given.
+
+    Returns:
+        MergeJob: The validated job.
+
+    Raises:
+        ValueError: If the payload does not describe a valid merge job.
+    """
+    inputs = payload.get("inputs")
+    if not isinstance(inputs, list) or not all(isinstance(i, str) for i in inputs):
+        raise ValueError("'inputs' must be a list of file paths")
+    if not vgm.is_valid_video_count(len(inputs)):
+        raise ValueError(
+            "'inputs' must contain a perfect square number (>= 4) of files"
+        )
+    for path in inputs:
+        extension = os.path.splitext(path)[1]
+        if extension not in vgm.video_extension_list and not vgm.is_image_file(path):
+            raise ValueError(f"Unsupported input extension: {path}")
+        if not os.path.isfile(path):
+            raise ValueError(f"Input file not found: {path}")
+
+    layout = payload.get("layout")
+    if layout is not None:
+        match = re.fullmatch(r"(\d+)x(\d+)", str(layout))
+        if not match or int(match.group(1)) * int(match.group(2)) != len(inputs):
+            raise ValueError(f"'layout' {layout} does not match {len(inputs)} inputs")
+        if match.group(1) != match.group(2):
+            raise ValueError("Only NxN layouts are supported")
+
+    profile = payload.get("profile", vgm.ffmpeg_cmd_version)
+    if profile not in ("v1", "v2", "gpu"):
+        raise ValueError(f"Invalid profile: {profile}")
+
+    job = MergeJob(
+        inputs=[os.path.abspath(i) for i in inputs], output_path="", profile=profile
+    )
+    output_path = payload.get("output_path")
+    if output_path is None:
+        output_path = os.path.join(
+            output_folder, f"job_{job.job_id}{vgm.video_extension_list[0]}"
+        )
+    elif os.path.splitext(output_path)[1] not in vgm.video_extension_list:
+        raise ValueError(f"Unsupported output extension: {output_path}")
+    job.output_path = os.path.abspath(output_path)
+    return job
+
+
+def stage_job_inputs(job: MergeJob, work_folder: str) -> List[str]:
+    """
+    Link the job inputs into a private work folder in tile order.
+
+    The merge pipeline arranges videos alphabetically, so each link is
+    prefixed with its tile index.
+
+    Args:
+        job (MergeJob): The job whose inputs are staged.
+        work_folder (str): An empty folder owned by the job.
+
+    Returns:
+        List[str]: The staged video file names.
+    """
+    width = len(str(len(job.inputs)))
+    video_files = []
+    for index, path in enumerate(job.inputs):
+        name = f"{index:0{width}d}{os.path.splitext(path)[1]}"
+        os.symlink(path, os.path.join(work_folder, name))
+        video_files.append(name)
+    return video_files
+
+
+class MergeJobQueue:
+    """In-process queue that runs merge jobs on a fixed number of worker threads.
+
+    Only the keep_finished most recently finished jobs are kept; older ones are
+    dropped from jobs (the vgm_jobs_total counters still count them).
+    """
+
+    def __init__(
+        self, output_folder: str, workers: int = 1, keep_finished: int = 1000
+    ) -> None:
+        self.output_folder = output_folder
+        self.workers = max(workers, 1)
+        self.keep_finished = max(keep_finished, 0)
+        self.jobs: Dict[str, MergeJob] = {}
+        self._queue: "queue.Queue[Optional[MergeJob]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._jobs_total: Dict[str, int] = {status: 0 for status in JOB_STATUSES}
+        self._stage_latency: Dict[str, Tuple[float, int]] = {}
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"merge-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Let the workers finish the jobs in progress and stop them."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, job: MergeJob) -> MergeJob:
+        """Register a job and put it on the queue."""
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self._jobs_total["queued"] += 1
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[MergeJob]:
+        """Return the job with the given id, or None if it is unknown."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return the JSON representation of all jobs in submission order."""
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def _prune_finished(self) -> None:
+        # Called with the lock held once a job has finished
+        finished = [
+            job for job in self.jobs.values() if job.status in FINISHED_STATUSES
+        ]
+        finished.sort(key=lambda job: job.finished_at or 0.0)
+        for job in finished[: max(len(finished) - self.keep_finished, 0)]:
+            del self.jobs[job.job_id]
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                self.run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def run_job(self, job: MergeJob) -> None:
+        """Run one job to completion and record its status and stage latencies."""
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+            self._jobs_total["running"] += 1
+
+        def on_progress(progress: Dict[str, float]) -> None:
+            job.progress = progress["fraction"]
+            job.speed = progress["speed"]
+
+        work_folder = tempfile.mkdtemp(prefix=f"vgm_job_{job.job_id}_")
+        try:
+            video_files = stage_job_inputs(job, work_folder)
+            os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+            stage_times = vgm.merge_videos(
+                work_folder,
+                video_files,
+                job.output_path,
+                cmd_version=job.profile,
+                progress_callback=on_progress,
+            )
+            status = "succeeded"
+            error = None
+        except Exception as e:
+            traceback.print_exc()
+            stage_times = {}
+            status = "failed"
+            error = str(e)
+        finally:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+        with self._lock:
+            job.stage_times = stage_times
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+            if status == "succeeded":
+                job.progress = 1.0
+            self._jobs_total[status] += 1
+            for stage, seconds in stage_times.items():
+                total, count = self._stage_latency.get(stage, (0.0, 0))
+                self._stage_latency[stage] = (total + seconds, count + 1)
+            self._prune_finished()
+
+    def render_metrics(self) -> str:
+        """
+        Render the server metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page served at /metrics.
+        """
+        with self._lock:
+            queued = [job for job in self.jobs.values() if job.status == "queued"]
+            running = [job for job in self.jobs.values() if job.status == "running"]
+            lines = [
+                "# HELP vgm_queue_depth Jobs waiting for a worker.",
+                "# TYPE vgm_queue_depth gauge",
+                f"vgm_queue_depth {len(queued)}",
+                "# HELP vgm_jobs_in_flight Jobs currently being merged.",
+                "# TYPE vgm_jobs_in_flight gauge",
+                f"vgm_jobs_in_flight {len(running)}",
+                "# HELP vgm_workers Configured worker threads.",
+                "# TYPE vgm_workers gauge",
+                f"vgm_workers {self.workers}",
+                "# HELP vgm_jobs_total Jobs that entered each status.",
+                "# TYPE vgm_jobs_total counter",
+            ]
+            lines += [
+                f'vgm_jobs_total{{status="{status}"}} {count}'
+                for status, count in self._jobs_total.items()
+            ]
+            lines += [
+                "# HELP vgm_encode_speed Encode speed of running jobs (x realtime).",
+                "# TYPE vgm_encode_speed gauge",
+            ]
+            lines += [
+                f'vgm_encode_speed{{job="{job.job_id}"}} {job.speed}' for job in running
+            ]
+            lines += [
+                "# HELP vgm_stage_latency_seconds Time spent in each pipeline stage.",
+                "# TYPE vgm_stage_latency_seconds summary",
+            ]
+            for stage, (total, count) in sorted(self._stage_latency.items()):
+                labels = f'{{stage="{stage}"}}'
+                lines.append(f"vgm_stage_latency_seconds_sum{labels} {total}")
+                lines.append(f"vgm_stage_latency_seconds_count{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a MergeJobQueue.
+
+    Endpoints:
+        POST /jobs       Submit a job, returns 202 with the job status.
+        GET  /jobs       List all jobs (see MergeJobQueue.snapshot).
+        GET  /jobs/<id>  Status and progress of one job.
+        GET  /metrics    Prometheus metrics.
+    """
+
+    job_queue: MergeJobQueue
+
+    def _send(self, status: int, body: str, content_type: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        self._send(status, json.dumps(payload), "application/json")
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self._send(
+                200,
+                self.job_queue.render_metrics(),
+                "text/plain; version=0.0.4; charset=utf-8",
+            )
+        elif self.path == "/jobs":
+            self._send_json(200, self.job_queue.snapshot())
+        elif self.path.startswith("/jobs/"):
+            job = self.job_queue.get(self.path[len("/jobs/") :])
+            if job is None:
+                self._send_json(404, {"error": "job not found"})
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/jobs":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("request body must be a JSON object")
+            job = parse_job_request(payload, self.job_queue.output_folder)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self.job_queue.submit(job)
+        self._send_json(202, job.to_dict())
+
+
+def create_server(
+    host: str, port: int, job_queue: MergeJobQueue
+) -> ThreadingHTTPServer:
+    """
+    Create an HTTP server bound to host:port that serves job_queue.
+
+    Args:
+        host (str): The address to bind.
+        port (int): The port to bind (0 picks a free port).
+        job_queue (MergeJobQueue): The queue the handlers submit to.
+
+    Returns:
+        ThreadingHTTPServer: The server, not yet serving.
+    """
+    handler = type(
+        "BoundJobRequestHandler", (JobRequestHandler,), {"job_queue": job_queue}
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:  # pragma: no cover
+    parser = argparse.ArgumentParser(
+        description="Serve video grid merge jobs over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--keep-jobs",
+        type=int,
+        default=1000,
+        help="Number of finished jobs kept for GET /jobs",
+    )
+    parser.add_argument("--output-folder", default="./video_grid_merge/media/output")
+    args = parser.parse_args()
+
+    job_queue = MergeJobQueue(args.output_folder, args.workers, args.keep_jobs)
+    job_queue.start()
+    server = create_server(args.host, args.port, job_queue)
+    print(
+        f"Video Grid Merge job server listening on http://{args.host}:{server.server_port}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        job_queue.stop()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
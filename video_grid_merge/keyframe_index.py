@@ -0,0 +1,259 @@
+import hashlib
+import os
+import struct
+import subprocess
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence
+
+default_index_dir = os.path.join(
+    os.path.expanduser("~"), ".video_grid_merge", "keyframes"
+)
+
+INDEX_MAGIC = b"VGMK"
+INDEX_VERSION = 2
+# magic, version, size, mtime_ns, inode and content hash of the indexed file,
+# keyframe count
+INDEX_HEADER = struct.Struct("<4sHqqq16sI")
+
+
+def get_index_path(index_dir: str, path: str) -> str:
+    """Return the index file of a media file.
+
+    Args:
+        index_dir (str): Folder of the keyframe indexes
+        path (str): Path of the media file
+
+    Returns:
+        str: Path of the index file
+    """
+    name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(index_dir, f"{name}.kfi")
+
+
+def probe_keyframes(path: str) -> Optional["array[float]"]:
+    """Read the timestamps of the key packets of the first video stream.
+
+    Only the packet headers are read (ffprobe demuxes without decoding).
+
+    Args:
+        path (str): Path of the media file
+
+    Returns:
+        Optional[array[float]]: The keyframe timestamps in seconds ('d' array), or
+            None if ffprobe failed
+    """
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "packet=pts_time,flags",
+                "-of",
+                "csv=p=0",
+                path,
+            ],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+
+    keyframes = array("d")
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return array("d", sorted(keyframes))
+
+
+def save_index(
+    index_path: str, fingerprint: Dict[str, Any], keyframes: Sequence[float]
+) -> None:
+    """Atomically write a keyframe index.
+
+    The file is a fixed header followed by the timestamps as little-endian
+    doubles, so it is read back with one array.fromfile call.
+
+    Args:
+        index_path (str): Path of the index file
+        fingerprint (Dict[str, Any]): Fingerprint of the indexed file
+        keyframes (Sequence[float]): The keyframe timestamps in seconds
+    """
+    data = array("d", keyframes)
+    if sys.byteorder == "big":
+        data.byteswap()
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            INDEX_HEADER.pack(
+                INDEX_MAGIC,
+                INDEX_VERSION,
+                fingerprint["size"],
+                fingerprint["mtime_ns"],
+                fingerprint["inode"],
+                bytes.fromhex(fingerprint["hash"]),
+                len(data),
+            )
+        )
+        data.tofile(f)
+    os.replace(tmp_path, index_path)
+
+
+def load_index(
+    index_path: str, fingerprint: Dict[str, Any]
+) -> Optional["array[float]"]:
+    """Read a keyframe index if it was written for the same file contents.
+
+    Args:
+        index_path (str): Path of the index file
+        fingerprint (Dict[str, Any]): Current fingerprint of the indexed file
+
+    Returns:
+        Optional[array[float]]: The keyframe timestamps, or None if there is no
+            valid index
+    """
+    try:
+        with open(index_path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return None
+            magic, version, *identity, count = INDEX_HEADER.unpack(header)
+            if (magic, version) != (INDEX_MAGIC, INDEX_VERSION) or identity != [
+                fingerprint["size"],
+                fingerprint["mtime_ns"],
+                fingerprint["inode"],
+                bytes.fromhex(fingerprint["hash"]),
+            ]:
+                return None
+            keyframes = array("d")
+            keyframes.fromfile(f, count)
+    except (OSError, EOFError):
+        return None
+    if sys.byteorder == "big":
+        keyframes.byteswap()
+    return keyframes
+
+
+def get_keyframes(
+    path: str, fingerprint: Optional[Dict[str, Any]], index_dir: str = default_index_dir
+) -> Optional["array[float]"]:
+    """Return the keyframe timestamps of a file, probing it only on a cache miss.
+
+    Args:
+        path (str): Path of the media file
+        fingerprint (Optional[Dict[str, Any]]): Fingerprint of the file (see
+            fingerprint.file_fingerprint), None if it does not exist
+        index_dir (str): Folder of the keyframe indexes
+
+    Returns:
+        Optional[array[float]]: The keyframe timestamps in seconds, or None if
+            unknown
+    """
+    if fingerprint is None:
+        return None
+    index_path = get_index_path(index_dir, path)
+    keyframes = load_index(index_path, fingerprint)
+    if keyframes is not None:
+        return keyframes
+    keyframes = probe_keyframes(path)
+    if keyframes is not None:
+        try:
+            save_index(index_path, fingerprint, keyframes)
+        except OSError:
+            pass
+    return keyframes
+
+
+def repeat_keyframes(
+    keyframes: Sequence[float], length: float, total_length: float
+) -> List[float]:
+    """Return the keyframes of a video concatenated to total_length.
+
+    Args:
+        keyframes (Sequence[float]): The keyframe timestamps of one copy
+        length (float): Length of one copy in seconds
+        total_length (float): Length of the concatenated video in seconds
+
+    Returns:
+        List[float]: The keyframe timestamps of the concatenated video
+    """
+    if length <= 0:
+        return []
+    repeated: List[float] = []
+    offset = 0.0
+    while offset < total_length:
+        repeated.extend(
+            offset + keyframe
+            for keyframe in keyframes
+            if keyframe < length and offset + keyframe < total_length
+        )
+        offset += length
+    return repeated
+
+
+def common_keyframes(
+    keyframe_lists: Sequence[Sequence[float]], tolerance: float = 0.001
+) -> List[float]:
+    """Return the keyframes shared by every video.
+
+    Args:
+        keyframe_lists (Sequence[Sequence[float]]): Sorted keyframe timestamps of
+            every video
+        tolerance (float): Largest difference in seconds of matching keyframes
+
+    Returns:
+        List[float]: The timestamps (of the first video) that are a keyframe in
+            every video
+    """
+    if not keyframe_lists:
+        return []
+    common = list(keyframe_lists[0])
+    for keyframes in keyframe_lists[1:]:
+        matched = []
+        for keyframe in common:
+            index = bisect_left(keyframes, keyframe - tolerance)
+            if index < len(keyframes) and keyframes[index] <= keyframe + tolerance:
+                matched.append(keyframe)
+        common = matched
+    return common
+
+
+def get_segment_starts(
+    keyframes: Sequence[float], total_length: float, segment_length: float
+) -> List[float]:
+    """Split a duration into segments that start on keyframes.
+
+    Every segment starts at the first keyframe at least segment_length after the
+    previous start. Where the keyframes are further apart than two segments, the
+    nominal boundary is used instead.
+
+    Args:
+        keyframes (Sequence[float]): Sorted keyframe timestamps
+        total_length (float): Length of the output in seconds
+        segment_length (float): Target length of one segment in seconds
+
+    Returns:
+        List[float]: The start of every segment, beginning with 0.0
+    """
+    starts = [0.0]
+    while True:
+        target = starts[-1] + segment_length
+        if target >= total_length:
+            return starts
+        index = bisect_left(keyframes, target)
+        if index < len(keyframes) and keyframes[index] < target + segment_length:
+            start = keyframes[index]
+        else:
+            start = target
+        if start >= total_length:
+            return starts
+        starts.append(start)
@@ -0,0 +1,114 @@
+import json
+import math
+import os
+import subprocess
+from typing import Dict, Optional
+
+from video_grid_merge import fingerprint_cache as fpc
+
+default_cache_path = os.path.join(
+    os.path.expanduser("~"), ".video_grid_merge", "loudness.json"
+)
+
+# Keep a safety margin below full scale (dBTP) when raising quiet inputs
+TRUE_PEAK_CEILING = -1.0
+
+
+def measure_loudness(path: str) -> Optional[Dict[str, float]]:
+    """Measure the EBU R128 loudness of the audio of a file with loudnorm.
+
+    Only the audio stream is decoded (-vn).
+
+    Args:
+        path (str): Path of the media file
+
+    Returns:
+        Optional[Dict[str, float]]: input_i (LUFS), input_tp (dBTP) and input_lra (LU),
+            or None if the file has no audio or ffmpeg failed
+    """
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-nostats",
+                "-i",
+                path,
+                "-vn",
+                "-af",
+                "loudnorm=print_format=json",
+                "-f",
+                "null",
+                "-",
+            ],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    # loudnorm prints its JSON summary as the last block of the log
+    start, end = result.stderr.rfind("{"), result.stderr.rfind("}")
+    if result.returncode != 0 or start < 0 or end < start:
+        return None
+    try:
+        stats = json.loads(result.stderr[start : end + 1])
+        return {
+            "input_i": float(stats["input_i"]),
+            "input_tp": float(stats["input_tp"]),
+            "input_lra": float(stats["input_lra"]),
+        }
+    except (KeyError, ValueError):
+        return None
+
+
+def get_gain_db(
+    loudness: Dict[str, float], target: float, max_gain: float = 20.0
+) -> float:
+    """Return the gain that brings a measured input to the target loudness.
+
+    The gain is limited so that the true peak stays below TRUE_PEAK_CEILING and
+    to +/- max_gain.
+
+    Args:
+        loudness (Dict[str, float]): Result of measure_loudness
+        target (float): Target integrated loudness in LUFS
+        max_gain (float): Largest gain or attenuation in dB
+
+    Returns:
+        float: The gain in dB (0.0 for silent inputs)
+    """
+    if not math.isfinite(loudness["input_i"]):
+        return 0.0
+    gain = target - loudness["input_i"]
+    if math.isfinite(loudness["input_tp"]):
+        gain = min(gain, TRUE_PEAK_CEILING - loudness["input_tp"])
+    return max(-max_gain, min(gain, max_gain))
+
+
+class LoudnessCache(fpc.FingerprintCache):
+    """Loudness measurements of media files, stored as JSON.
+
+    A measurement is reused until the file changes, so repeat jobs need no
+    analysis pass.
+    """
+
+    def get(self, path: str) -> Optional[Dict[str, float]]:
+        """Return the measurement of a file if the file is unchanged.
+
+        Args:
+            path (str): Path of the media file
+
+        Returns:
+            Optional[Dict[str, float]]: The measurement, or None
+        """
+        entry = self.get_entry(path)
+        return None if entry is None else entry["loudness"]
+
+    def record(self, path: str, loudness: Dict[str, float]) -> None:
+        """Record the measurement of a file.
+
+        Args:
+            path (str): Path of the media file
+            loudness (Dict[str, float]): Result of measure_loudness
+        """
+        self.set_entry(path, {"loudness": loudness})
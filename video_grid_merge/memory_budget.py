@@ -0,0 +1,231 @@
+import os
+import re
+import resource
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+MiB = 1024 * 1024
+
+# Bytes per pixel of a decoded frame
+PIX_FMT_BYTES = {
+    "yuv420p": 1.5,
+    "yuvj420p": 1.5,
+    "nv12": 1.5,
+    "yuv422p": 2.0,
+    "yuvj422p": 2.0,
+    "yuv444p": 3.0,
+    "yuvj444p": 3.0,
+    "yuv420p10le": 3.0,
+    "yuv422p10le": 4.0,
+    "yuv444p10le": 6.0,
+    "p010le": 3.0,
+    "rgb24": 3.0,
+    "bgr24": 3.0,
+    "rgba": 4.0,
+    "bgra": 4.0,
+}
+
+# libx264 defaults per preset: frames of rate control lookahead and reference frames
+X264_LOOKAHEAD = {
+    "ultrafast": 0,
+    "superfast": 0,
+    "veryfast": 10,
+    "faster": 20,
+    "fast": 30,
+    "medium": 40,
+    "slow": 50,
+    "slower": 60,
+    "veryslow": 60,
+}
+X264_REFS = {
+    "ultrafast": 1,
+    "superfast": 1,
+    "veryfast": 1,
+    "faster": 2,
+    "fast": 2,
+    "medium": 3,
+    "slow": 5,
+    "slower": 8,
+    "veryslow": 16,
+}
+
+PROCESS_OVERHEAD_BYTES = 64 * MiB
+INPUT_OVERHEAD_BYTES = 4 * MiB
+# Frames a decoder keeps besides its threads (references and reordering delay)
+DECODER_BUFFERED_FRAMES = 6
+DEFAULT_THREAD_QUEUE_SIZE = 8
+# Size of a compressed packet relative to the decoded frame
+PACKET_FRAME_RATIO = 0.05
+
+# Adjustments tried in order until the estimate fits the budget
+BUDGET_ADJUSTMENTS: List[Tuple[str, Optional[int]]] = [
+    ("decoder_threads", 1),
+    ("thread_queue_size", 2),
+    ("rc_lookahead", 10),
+    ("encoder_threads", 4),
+    ("rc_lookahead", 0),
+    ("encoder_threads", 1),
+    ("output", None),
+]
+
+
+def parse_memory_size(text: str) -> int:
+    """Parse a memory size like "512M", "8G" or "1.5GiB" into bytes.
+
+    Args:
+        text (str): The size. A number without unit is in bytes
+
+    Returns:
+        int: The size in bytes
+
+    Raises:
+        ValueError: If the size cannot be parsed
+    """
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?)(i?B)?\s*", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid memory size: {text}")
+    try:
+        value = float(match.group(1))
+    except ValueError:
+        raise ValueError(f"Invalid memory size: {text}") from None
+    exponent = "KMGT".find(match.group(2).upper()) + 1 if match.group(2) else 0
+    return int(value * 1024**exponent)
+
+
+def get_frame_bytes(width: int, height: int, pix_fmt: Optional[str]) -> float:
+    """Return the size of a decoded frame.
+
+    Args:
+        width (int): Frame width
+        height (int): Frame height
+        pix_fmt (Optional[str]): Pixel format (yuv420p if unknown)
+
+    Returns:
+        float: The frame size in bytes
+    """
+    return width * height * PIX_FMT_BYTES.get(pix_fmt or "yuv420p", 1.5)
+
+
+def estimate_peak_memory(
+    inputs: List[Dict[str, Any]], output: Dict[str, Any], options: Dict[str, Any]
+) -> int:
+    """Estimate the peak memory of the grid encode process.
+
+    The estimate adds the frames buffered by every decoder (references, one
+    frame per decoder thread and the input packet queue), the scaled tiles and
+    the stacked frame of the filter graph, and the frames held by the encoder
+    (lookahead, references and one frame per encoder thread).
+
+    Args:
+        inputs (List[Dict[str, Any]]): width, height and pix_fmt of every input
+        output (Dict[str, Any]): width and height of the output, tile_width and
+            tile_height of the scaled tiles
+        options (Dict[str, Any]): cores, preset, and decoder_threads, thread_queue_size,
+            encoder_threads and rc_lookahead (0 or None for the ffmpeg default)
+
+    Returns:
+        int: The estimated peak memory in bytes
+    """
+    cores = options.get("cores") or 1
+    decoder_threads = options.get("decoder_threads") or min(cores, 16)
+    queue_size = options.get("thread_queue_size") or DEFAULT_THREAD_QUEUE_SIZE
+    total = float(PROCESS_OVERHEAD_BYTES)
+
+    for entry in inputs:
+        frame = get_frame_bytes(
+            entry.get("width") or 0, entry.get("height") or 0, entry.get("pix_fmt")
+        )
+        total += INPUT_OVERHEAD_BYTES
+        total += frame * (DECODER_BUFFERED_FRAMES + decoder_threads)
+        total += frame * PACKET_FRAME_RATIO * queue_size
+
+    # Scaled tiles plus the stacked frame (as large as all tiles together)
+    tile_frame = get_frame_bytes(output["tile_width"], output["tile_height"], None)
+    total += len(inputs) * tile_frame * 3
+
+    preset = options.get("preset") or "medium"
+    lookahead = options.get("rc_lookahead")
+    if lookahead is None:
+        lookahead = X264_LOOKAHEAD.get(preset, 40)
+    encoder_threads = options.get("encoder_threads") or cores
+    output_frame = get_frame_bytes(output["width"], output["height"], None)
+    total += output_frame * (lookahead + X264_REFS.get(preset, 3) + encoder_threads)
+    return int(total)
+
+
+def fit_memory_budget(
+    inputs: List[Dict[str, Any]],
+    output: Dict[str, Any],
+    options: Dict[str, Any],
+    max_memory: int,
+) -> Tuple[Dict[str, Any], Dict[str, Any], int, List[str]]:
+    """Reduce buffering until the estimated peak memory fits a budget.
+
+    The adjustments in BUDGET_ADJUSTMENTS are applied cumulatively, cheapest
+    first: single threaded decoders, shorter input queues, shorter encoder
+    lookahead, fewer encoder threads and finally an output of one tile size.
+    Adjustments that would not lower the current setting are skipped.
+
+    Args:
+        inputs (List[Dict[str, Any]]): See estimate_peak_memory
+        output (Dict[str, Any]): See estimate_peak_memory
+        options (Dict[str, Any]): See estimate_peak_memory
+        max_memory (int): The budget in bytes
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any], int, List[str]]: The adjusted options and
+            output, the estimate in bytes and the applied adjustments. The estimate
+            exceeds the budget if all adjustments were not enough.
+    """
+    options = dict(options)
+    output = dict(output)
+    applied: List[str] = []
+    predicted = estimate_peak_memory(inputs, output, options)
+    for name, value in BUDGET_ADJUSTMENTS:
+        if predicted <= max_memory:
+            break
+        if name == "output":
+            size = (output["tile_width"], output["tile_height"])
+            if (output["width"], output["height"]) == size:
+                continue
+            output["width"], output["height"] = size
+            applied.append(f"output {size[0]}x{size[1]}")
+        else:
+            candidate = dict(options, **{name: value})
+            if estimate_peak_memory(inputs, output, candidate) >= predicted:
+                continue
+            options = candidate
+            applied.append(f"{name} {value}")
+        predicted = estimate_peak_memory(inputs, output, options)
+    return options, output, predicted, applied
+
+
+def get_peak_child_rss() -> int:
+    """Return the peak RSS of the largest child process that has finished.
+
+    Returns:
+        int: The peak resident set size in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_available_memory() -> Optional[int]:
+    """Return the memory available for new allocations and the page cache.
+
+    Returns:
+        Optional[int]: MemAvailable of /proc/meminfo (free physical memory where that
+            is missing) in bytes, or None if unknown
+    """
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
@@ -0,0 +1,230 @@
+import os
+import threading
+from types import TracebackType
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from video_grid_merge import memory_budget as mbg
+
+MiB = 1024 * 1024
+# Bytes read ahead of the estimated read position of every input
+DEFAULT_WINDOW_BYTES = 64 * MiB
+# Large reads keep a spinning disk streaming instead of seeking between inputs
+DEFAULT_CHUNK_BYTES = 8 * MiB
+READ_SIZE = 1 * MiB
+# Share of the available memory the read-ahead windows of all inputs may fill
+MEMORY_HEADROOM_SHARE = 0.25
+
+
+def advise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    """Pass an access pattern hint to the kernel where posix_fadvise exists.
+
+    Args:
+        fd (int): Open file descriptor
+        offset (int): Start of the range in bytes
+        length (int): Length of the range in bytes (0 for up to the end)
+        advice_name (str): Name of the os.POSIX_FADV_* constant
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+        except OSError:
+            pass
+
+
+def drop_page_cache(path: str) -> None:
+    """Ask the kernel to drop the cached pages of a file (for cold-cache runs).
+
+    Args:
+        path (str): Path of the file
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        advise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+    finally:
+        os.close(fd)
+
+
+def get_window_bytes(file_count: int, window_bytes: int = DEFAULT_WINDOW_BYTES) -> int:
+    """Return the read-ahead window per input that fits the memory headroom.
+
+    Args:
+        file_count (int): Number of prefetched inputs
+        window_bytes (int): Largest window per input in bytes
+
+    Returns:
+        int: The window per input in bytes (at least one READ_SIZE)
+    """
+    available = mbg.get_available_memory()
+    if available is not None and file_count:
+        window_bytes = min(
+            window_bytes, int(available * MEMORY_HEADROOM_SHARE / file_count)
+        )
+    return max(window_bytes, READ_SIZE)
+
+
+class Prefetcher:
+    """Read the inputs of an encode into the page cache ahead of ffmpeg.
+
+    ffmpeg reads all inputs of the grid in lockstep, in small interleaved reads
+    that make spinning disks and NFS seek constantly. The prefetcher estimates
+    the read offset of every input from the encoded position (update, fed by the
+    '-progress' output) and reads the window ahead of it in large chunks, always
+    serving the input that is furthest behind first. The workers bound the number
+    of concurrent reads; the windows are bounded by the memory headroom.
+
+    Usable as a context manager, which starts and stops the workers.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        get_duration: Callable[[str], Optional[float]],
+        window_bytes: int = DEFAULT_WINDOW_BYTES,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        workers: int = 2,
+    ) -> None:
+        self.paths = list(dict.fromkeys(paths))
+        self.get_duration = get_duration
+        self.window_bytes = get_window_bytes(len(self.paths), window_bytes)
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers
+        self.position = 0.0
+        self.prefetched_bytes = 0
+        self._sizes: List[int] = []
+        self._durations: List[Optional[float]] = []
+        self._read_ends: List[int] = []
+        self._fds: List[int] = []
+        self._in_flight: Dict[int, bool] = {}
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "Prefetcher":
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Open the inputs and start the read-ahead workers."""
+        opened = []
+        for path in self.paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            opened.append(path)
+            advise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+            self._fds.append(fd)
+            self._sizes.append(os.fstat(fd).st_size)
+            # Probed in the background; only the first window is read until then
+            self._durations.append(None)
+            self._read_ends.append(0)
+        self.paths = opened
+        threading.Thread(target=self._probe_durations, daemon=True).start()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def update(self, position: float) -> None:
+        """Report how far (seconds) ffmpeg has read into the inputs.
+
+        Args:
+            position (float): The position in seconds
+        """
+        with self._cond:
+            self.position = position
+            self._cond.notify_all()
+
+    def stop(self) -> None:
+        """Stop the workers and close the inputs."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def get_read_offset(self, index: int) -> int:
+        """Return the estimated byte offset ffmpeg has read an input up to.
+
+        Args:
+            index (int): Index of the input
+
+        Returns:
+            int: The offset in bytes (0 while the duration is unknown)
+        """
+        duration = self._durations[index]
+        if not duration:
+            return 0
+        return int(self._sizes[index] * min(self.position / duration, 1.0))
+
+    def next_chunk(self) -> Optional[Tuple[int, int, int]]:
+        """Pick the next chunk to read; the caller holds the condition lock.
+
+        Returns:
+            Optional[Tuple[int, int, int]]: Input index, offset and length of the
+                chunk of the input furthest behind, or None if all windows are full
+        """
+        best: Optional[Tuple[int, int, int, int]] = None
+        for index, size in enumerate(self._sizes):
+            if self._in_flight.get(index):
+                continue
+            offset = self.get_read_offset(index)
+            read_end = max(self._read_ends[index], offset)
+            limit = min(offset + self.window_bytes, size)
+            if read_end >= limit:
+                continue
+            lead = read_end - offset
+            if best is None or lead < best[0]:
+                best = (lead, index, read_end, min(self.chunk_bytes, limit - read_end))
+        return best[1:] if best else None
+
+    def _probe_durations(self) -> None:
+        for index, path in enumerate(self.paths):
+            duration = self.get_duration(path)
+            with self._cond:
+                self._durations[index] = duration
+                self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                chunk = None
+                while not self._stopped:
+                    chunk = self.next_chunk()
+                    if chunk:
+                        break
+                    self._cond.wait()
+                if self._stopped or chunk is None:
+                    return
+                index, offset, length = chunk
+                self._in_flight[index] = True
+            try:
+                self._read(self._fds[index], offset, length)
+            finally:
+                with self._cond:
+                    self._in_flight[index] = False
+                    self._read_ends[index] = max(
+                        self._read_ends[index], offset + length
+                    )
+                    self.prefetched_bytes += length
+                    self._cond.notify_all()
+
+    def _read(self, fd: int, offset: int, length: int) -> None:
+        advise(fd, offset, length, "POSIX_FADV_WILLNEED")
+        end = offset + length
+        while offset < end and not self._stopped:
+            data = os.pread(fd, min(READ_SIZE, end - offset), offset)
+            if not data:
+                return
+            offset += len(data)
@@ -0,0 +1,185 @@
+import time
+from typing import Callable, Dict, List, Optional
+
+# libx264 presets from the fastest (largest files) to the slowest (best compression)
+X264_PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+# Approximate encode speed of each preset relative to ultrafast. Used to predict
+# the speed of a preset from the measured speed of another one.
+X264_RELATIVE_SPEED: Dict[str, float] = {
+    "ultrafast": 1.0,
+    "superfast": 0.62,
+    "veryfast": 0.48,
+    "faster": 0.34,
+    "fast": 0.27,
+    "medium": 0.22,
+    "slow": 0.14,
+    "slower": 0.07,
+    "veryslow": 0.035,
+}
+
+# libx265 uses the same preset names (placebo is left out, as for libx264)
+X265_PRESETS = list(X264_PRESETS)
+
+# Approximate encode speed of each libx265 preset relative to ultrafast. The
+# slow presets enable rectangular partitions and RDO levels that cost far more
+# than their libx264 counterparts.
+X265_RELATIVE_SPEED: Dict[str, float] = {
+    "ultrafast": 1.0,
+    "superfast": 0.8,
+    "veryfast": 0.55,
+    "faster": 0.5,
+    "fast": 0.4,
+    "medium": 0.25,
+    "slow": 0.09,
+    "slower": 0.03,
+    "veryslow": 0.015,
+}
+
+# Preset ladder and relative speeds of every software encoder
+ENCODER_PRESETS: Dict[str, List[str]] = {
+    "libx264": X264_PRESETS,
+    "libx265": X265_PRESETS,
+}
+ENCODER_RELATIVE_SPEED: Dict[str, Dict[str, float]] = {
+    "libx264": X264_RELATIVE_SPEED,
+    "libx265": X265_RELATIVE_SPEED,
+}
+
+
+def select_preset(
+    estimate_seconds: Callable[[str], Optional[float]],
+    deadline_at: Optional[float],
+    presets: List[str] = X264_PRESETS,
+    margin: float = 1.1,
+    budget_seconds: Optional[float] = None,
+) -> str:
+    """Pick the slowest preset whose estimated encode time meets the deadline.
+
+    Presets are assumed to get slower along the list, so the search is a
+    binary search and only O(log n) presets are estimated. Time spent on the
+    estimates themselves (e.g. calibration encodes) is taken off the time left
+    until deadline_at; a fixed budget_seconds is not charged for it.
+
+    Args:
+        estimate_seconds (Callable[[str], Optional[float]]): Returns the estimated
+            encode time of the whole job with a preset, or None if unknown
+        deadline_at (Optional[float]): time.perf_counter() value the encode must
+            finish by (ignored if budget_seconds is given)
+        presets (List[str]): Candidate presets, fastest first
+        margin (float): Safety factor applied to the estimates
+        budget_seconds (Optional[float]): Encode time allowed from the start of the
+            encode, e.g. for a speed target
+
+    Returns:
+        str: The selected preset (the fastest one if none meets the deadline, or
+            if neither a deadline nor a budget is given)
+    """
+    best = presets[0]
+    low, high = 0, len(presets) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        estimate = estimate_seconds(presets[middle])
+        if budget_seconds is not None:
+            remaining = budget_seconds
+        elif deadline_at is not None:
+            remaining = deadline_at - time.perf_counter()
+        else:
+            remaining = 0.0
+        if estimate is not None and estimate * margin <= remaining:
+            best = presets[middle]
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best
+
+
+class PresetController:
+    """Switch to faster presets while encoding when the job falls behind.
+
+    The encode is split into segments. After every segment the controller
+    compares the measured speed with the speed still required to finish the
+    remaining duration before the deadline, and moves to the slowest faster
+    preset that is predicted (with the relative speeds of the encoder, e.g.
+    X264_RELATIVE_SPEED) to be fast enough. It never switches back to a slower
+    preset.
+    """
+
+    def __init__(
+        self,
+        preset: str,
+        total_duration: float,
+        deadline_at: float,
+        presets: List[str] = X264_PRESETS,
+        margin: float = 1.1,
+        relative_speed: Dict[str, float] = X264_RELATIVE_SPEED,
+    ) -> None:
+        self.preset = preset
+        self.remaining_duration = total_duration
+        self.deadline_at = deadline_at
+        self.presets = presets
+        self.margin = margin
+        self.relative_speed = relative_speed
+        self.presets_used = [preset]
+
+    def update(self, encoded_duration: float, elapsed_seconds: float) -> None:
+        """Report a finished segment and adjust the preset for the next one.
+
+        Args:
+            encoded_duration (float): Media seconds encoded by the segment
+            elapsed_seconds (float): Wall-clock seconds the segment took
+        """
+        self.remaining_duration -= encoded_duration
+        if self.remaining_duration <= 0 or elapsed_seconds <= 0:
+            return
+
+        speed = encoded_duration / elapsed_seconds
+        remaining_time = self.deadline_at - time.perf_counter()
+        if remaining_time <= 0:
+            required_speed = float("inf")
+        else:
+            required_speed = self.remaining_duration / remaining_time * self.margin
+        if speed >= required_speed:
+            return
+
+        current = self.presets.index(self.preset)
+        preset = self.presets[0]
+        for candidate in reversed(self.presets[:current]):
+            predicted = (
+                speed
+                * self.relative_speed[candidate]
+                / self.relative_speed[self.preset]
+            )
+            if predicted >= required_speed:
+                preset = candidate
+                break
+        if preset != self.preset:
+            print(
+                f"Encode is behind the deadline ({speed:.2f}x < {required_speed:.2f}x), "
+                f"switching preset {self.preset} -> {preset}"
+            )
+            self.preset = preset
+            self.presets_used.append(preset)
+
+    def profile_name(self, cmd_version: str) -> str:
+        """Return the profile name the run is recorded under in the run history.
+
+        Args:
+            cmd_version (str): The run profile (ffmpeg command version and encoder)
+
+        Returns:
+            str: "<cmd_version>:<preset>", or "<cmd_version>:mixed" if the preset changed
+        """
+        if len(self.presets_used) > 1:
+            return f"{cmd_version}:mixed"
+        return f"{cmd_version}:{self.preset}"
@@ -0,0 +1,201 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict
+
+from video_grid_merge import fingerprint as fpr
+
+default_cache_dir = os.path.join(
+    os.path.expanduser("~"), ".video_grid_merge", "results"
+)
+
+CACHE_VERSION = 1
+INDEX_FILE = "index.json"
+# ioctl request cloning a file on Linux (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+
+def get_result_key(recipe: Dict[str, Any]) -> str:
+    """Return the cache key of a merge result.
+
+    Args:
+        recipe (Dict[str, Any]): Everything the output depends on, serializable as
+            JSON (input fingerprints, filter graph, encoder arguments, ffmpeg version)
+
+    Returns:
+        str: The key (hex digest)
+    """
+    data = json.dumps(recipe, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(data.encode(), digest_size=20).hexdigest()
+
+
+def clone_file(src: str, dst: str) -> None:
+    """Create dst as a copy-on-write clone of src (FICLONE, e.g. Btrfs or XFS).
+
+    Args:
+        src (str): Path of the existing file
+        dst (str): Path of the clone to create
+
+    Raises:
+        OSError: If the file system (or the platform) cannot clone files
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def clone_or_copy(src: str, dst: str) -> None:
+    """Atomically place a copy of a file at dst, cloned where the file system can.
+
+    The copy never shares the inode of src (unlike a hard link): ffmpeg -y
+    truncates and rewrites an existing output in place, which would otherwise
+    change the cached file as well.
+
+    Args:
+        src (str): Path of the existing file
+        dst (str): Path to create or replace
+    """
+    tmp_path = f"{dst}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        clone_file(src, tmp_path)
+    except OSError:
+        # copyfile uses the kernel copy (sendfile/copy_file_range) where available
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class ResultCache:
+    """Merged outputs stored by the key of everything they were made from.
+
+    The outputs live in one folder next to an index (index.json) with their size,
+    fingerprint and last use. When the outputs exceed max_bytes, the least
+    recently used ones are removed. Outputs are copied into and out of the cache,
+    so writing the output path again leaves the cached file intact; an entry
+    whose file was changed anyway is dropped instead of returned.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory: str, max_bytes: int) -> "ResultCache":
+        """Load the cache in directory, or start an empty one.
+
+        Args:
+            directory (str): Folder of the cached outputs
+            max_bytes (int): Total size of the cached outputs to keep
+
+        Returns:
+            ResultCache: The loaded cache
+        """
+        cache = cls(directory, max_bytes)
+        try:
+            with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if data.get("version") == CACHE_VERSION:
+            cache.entries = data.get("entries", {})
+        return cache
+
+    def total_bytes(self) -> int:
+        """Return the total size of the cached outputs."""
+        with self._lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """Place the cached output of a key at output_path.
+
+        Args:
+            key (str): Key of the result (see get_result_key)
+            output_path (str): Path of the output file to create or replace
+
+        Returns:
+            bool: True on a cache hit
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        entry_path = os.path.join(self.directory, entry["file"])
+        if fpr.file_fingerprint(entry_path) != entry["fingerprint"]:
+            self.remove(key)
+            self.save()
+            return False
+        clone_or_copy(entry_path, output_path)
+        with self._lock:
+            entry["last_used"] = time.time()
+        self.save()
+        return True
+
+    def store(self, key: str, output_path: str) -> None:
+        """Add a merged output to the cache and evict old outputs over the budget.
+
+        Outputs larger than the whole budget are not stored.
+
+        Args:
+            key (str): Key of the result (see get_result_key)
+            output_path (str): Path of the merged output file
+        """
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        file = f"{key}{os.path.splitext(output_path)[1]}"
+        entry_path = os.path.join(self.directory, file)
+        clone_or_copy(output_path, entry_path)
+        with self._lock:
+            self.entries[key] = {
+                "file": file,
+                "size": size,
+                "fingerprint": fpr.file_fingerprint(entry_path),
+                "last_used": time.time(),
+            }
+        self.evict(self.max_bytes)
+        self.save()
+
+    def remove(self, key: str) -> None:
+        """Remove the output of a key from the cache.
+
+        Args:
+            key (str): Key of the result
+        """
+        with self._lock:
+            entry = self.entries.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except OSError:
+                pass
+
+    def evict(self, max_bytes: int) -> None:
+        """Remove the least recently used outputs until the rest fits max_bytes.
+
+        Args:
+            max_bytes (int): Total size of the outputs to keep
+        """
+        with self._lock:
+            keys = sorted(self.entries, key=lambda k: self.entries[k]["last_used"])
+        for key in keys:
+            if self.total_bytes() <= max_bytes:
+                return
+            self.remove(key)
+
+    def save(self) -> None:
+        """Atomically write the cache index to disk."""
+        with self._lock:
+            data = {"version": CACHE_VERSION, "entries": self.entries}
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, INDEX_FILE)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+default_history_path = os.path.join(
+    os.path.expanduser("~"), ".video_grid_merge", "history.sqlite3"
+)
+
+RUN_COLUMNS = {
+    "started_at": "REAL",
+    "profile": "TEXT",
+    "ffmpeg_version": "TEXT",
+    "cores": "INTEGER",
+    "grid_size": "INTEGER",
+    "tile_width": "INTEGER",
+    "tile_height": "INTEGER",
+    "output_width": "INTEGER",
+    "output_height": "INTEGER",
+    "fps": "REAL",
+    "duration": "REAL",
+    "normalize_seconds": "REAL",
+    "encode_seconds": "REAL",
+}
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open the run history database, creating it if needed.
+
+    Args:
+        db_path (str): Path of the SQLite database
+
+    Returns:
+        sqlite3.Connection: The open connection
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    columns = ", ".join(f"{name} {kind}" for name, kind in RUN_COLUMNS.items())
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, {columns})"
+    )
+    return connection
+
+
+def record_run(db_path: str, run: Dict[str, Any]) -> None:
+    """Store the parameters and stage timings of one merge run.
+
+    Args:
+        db_path (str): Path of the SQLite database
+        run (Dict[str, Any]): Values for the columns in RUN_COLUMNS. Missing values are
+            stored as NULL and started_at defaults to now.
+    """
+    values = {name: run.get(name) for name in RUN_COLUMNS}
+    if values["started_at"] is None:
+        values["started_at"] = time.time()
+    connection = connect(db_path)
+    try:
+        with connection:
+            connection.execute(
+                f"INSERT INTO runs ({', '.join(values)}) "
+                f"VALUES ({', '.join('?' for _ in values)})",
+                list(values.values()),
+            )
+    finally:
+        connection.close()
+
+
+def load_runs(db_path: str) -> List[Dict[str, Any]]:
+    """Load all recorded runs, oldest first.
+
+    Args:
+        db_path (str): Path of the SQLite database
+
+    Returns:
+        List[Dict[str, Any]]: The recorded runs (empty if there is no database yet)
+    """
+    if not os.path.exists(db_path):
+        return []
+    connection = connect(db_path)
+    try:
+        rows = connection.execute("SELECT * FROM runs ORDER BY started_at").fetchall()
+    finally:
+        connection.close()
+    return [dict(row) for row in rows]
+
+
+def get_pixel_work(run: Dict[str, Any]) -> float:
+    """Return the pixels a run decodes/scales plus the pixels it encodes.
+
+    Args:
+        run (Dict[str, Any]): A run with the RUN_COLUMNS parameters
+
+    Returns:
+        float: The pixel work of the run
+    """
+    frames = (run.get("fps") or 0) * (run.get("duration") or 0)
+    tiles = (run.get("grid_size") or 0) ** 2
+    tile_pixels = (run.get("tile_width") or 0) * (run.get("tile_height") or 0)
+    output_pixels = (run.get("output_width") or 0) * (run.get("output_height") or 0)
+    return float((tiles * tile_pixels + output_pixels) * frames)
+
+
+def fit_cost_model(runs: List[Dict[str, Any]]) -> Dict[str, Tuple[float, float]]:
+    """Fit encode_seconds = intercept + slope * pixel work / cores for each profile.
+
+    The fit is an ordinary least squares line. A profile with a single run (or
+    runs of identical size) gets a line through the origin.
+
+    Args:
+        runs (List[Dict[str, Any]]): Recorded runs
+
+    Returns:
+        Dict[str, Tuple[float, float]]: (intercept, slope) per encoder profile
+    """
+    samples: Dict[str, List[Tuple[float, float]]] = {}
+    for run in runs:
+        work = get_pixel_work(run)
+        if work <= 0 or not run.get("encode_seconds") or not run.get("profile"):
+            continue
+        x = work / max(run.get("cores") or 1, 1)
+        samples.setdefault(run["profile"], []).append((x, run["encode_seconds"]))
+
+    models = {}
+    for profile, points in samples.items():
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if var_x == 0:
+            models[profile] = (0.0, mean_y / mean_x)
+            continue
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        models[profile] = (mean_y - slope * mean_x, slope)
+    return models
+
+
+def predict_encode_time(
+    runs: List[Dict[str, Any]], job: Dict[str, Any]
+) -> Optional[float]:
+    """Predict the encode time of a job from the recorded runs.
+
+    Args:
+        runs (List[Dict[str, Any]]): Recorded runs
+        job (Dict[str, Any]): The parameters of the new job (RUN_COLUMNS without timings)
+
+    Returns:
+        Optional[float]: The predicted encode time in seconds, or None if no run with
+            the same profile was recorded
+    """
+    model = fit_cost_model(runs).get(job.get("profile") or "")
+    if model is None:
+        return None
+    intercept, slope = model
+    x = get_pixel_work(job) / max(job.get("cores") or 1, 1)
+    return max(intercept + slope * x, 0.0)
+
+
+def format_stats(runs: List[Dict[str, Any]], recent: int = 10) -> str:
+    """Summarize encode throughput per profile and ffmpeg version.
+
+    Throughput is pixel work per second of encode time (Mpx/s). Grouping by
+    ffmpeg version makes a slowdown after an ffmpeg upgrade visible.
+
+    Args:
+        runs (List[Dict[str, Any]]): Recorded runs, oldest first
+        recent (int): Number of most recent runs to list
+
+    Returns:
+        str: The report
+    """
+    if not runs:
+        return "No runs recorded."
+
+    def throughput(run: Dict[str, Any]) -> float:
+        seconds = run.get("encode_seconds") or 0
+        return get_pixel_work(run) / seconds / 1e6 if seconds > 0 else 0.0
+
+    lines = ["Throughput by profile and ffmpeg version (Mpx/s):"]
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for run in runs:
+        key = (run.get("profile") or "-", run.get("ffmpeg_version") or "unknown")
+        groups.setdefault(key, []).append(run)
+    for (profile, version), group in sorted(groups.items()):
+        values = [throughput(run) for run in group]
+        lines.append(
+            f"  {profile:<4} ffmpeg {version:<12} runs {len(group):>4}  "
+            f"mean {sum(values) / len(values):9.2f}  "
+            f"min {min(values):9.2f}  last {values[-1]:9.2f}"
+        )
+
+    models = fit_cost_model(runs)
+    if models:
+        lines.append("Cost model (encode seconds = a + b * Gpx / cores):")
+        for profile, (intercept, slope) in sorted(models.items()):
+            lines.append(f"  {profile:<4} a {intercept:8.2f}  b {slope * 1e9:8.2f}")
+
+    lines.append(f"Recent runs (last {min(recent, len(runs))}):")
+    for run in runs[-recent:]:
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started_at"]))
+        lines.append(
+            f"  {started}  {run.get('profile') or '-':<4} "
+            f"{run.get('grid_size')}x{run.get('grid_size')} "
+            f"{run.get('tile_width')}x{run.get('tile_height')} "
+            f"{run.get('fps') or 0:.2f}fps {run.get('duration') or 0:.1f}s  "
+            f"normalize {run.get('normalize_seconds') or 0:.2f}s  "
+            f"encode {run.get('encode_seconds') or 0:.2f}s  "
+            f"{throughput(run):.2f} Mpx/s"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    print(format_stats(load_runs(default_history_path)))